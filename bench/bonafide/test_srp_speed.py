@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# test_srp_speed.py
+# Copyright (C) 2017 LEAP Encryption Acess Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarking for the client side of the bonafide SRP authentication, for
+each srp backend available.
+
+The server side is done in process with srp.Verifier, so each round is a
+whole authentication without the network. The OPS column is roughly the
+number of authentications per second a single srp worker thread can do, as
+the client does most of the work.
+"""
+
+import importlib
+
+import pytest
+import srp
+
+from leap.bitmask.bonafide import _srp
+
+
+USERNAME = 'user'
+PASSWORD = 'secret'
+
+
+def _available(name):
+    try:
+        importlib.import_module(name)
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+BACKENDS = [name for name in _srp.BACKENDS if _available(name)]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    previous = _srp.get_backend()
+    request.addfinalizer(lambda: _srp.set_backend(previous))
+    _srp.set_backend(request.param)
+    return _srp.get_backend()
+
+
+def authenticate(salt, vkey):
+    auth = _srp.SRPAuthMechanism(USERNAME, PASSWORD)
+    auth._start_authentication()
+    svr = srp.Verifier(USERNAME, salt, vkey, auth.A, srp.SHA256, srp.NG_1024)
+    _, B = svr.get_challenge()
+    auth._process_challenge(salt, B)
+    auth.srp_user.verify_session(svr.verify_session(auth.M))
+    assert auth.authenticated()
+
+
+@pytest.mark.benchmark(group='bonafide srp')
+def test_srp_authentication(benchmark, backend):
+    salt, vkey = _srp._get_salt_verifier(USERNAME, PASSWORD)
+    benchmark(authenticate, salt, vkey)
+
+
+@pytest.mark.benchmark(group='bonafide srp')
+def test_srp_verifier(benchmark, backend):
+    benchmark(_srp._get_salt_verifier, USERNAME, PASSWORD)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# local_soledad.py
+# Copyright (C) 2017 LEAP Encryption Acess Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+An in-memory stand-in for Soledad, so KeyManager can be benchmarked without
+sqlcipher, encryption of documents nor a running reactor.
+
+All the methods return already fired deferreds.
+"""
+
+import copy
+import json
+import re
+
+from twisted.internet import defer
+
+
+BOOL_RE = re.compile(r'^bool\((.*)\)$')
+
+
+class LocalDocument(object):
+
+    def __init__(self, doc_id, content):
+        self.doc_id = doc_id
+        self.rev = None
+        self.content = content
+
+    def set_json(self, json_string):
+        self.content = json.loads(json_string)
+
+    def get_json(self):
+        return json.dumps(self.content)
+
+
+class LocalSoledad(object):
+    """
+    Keeps the documents in a dict and a hash for each index, like the
+    sqlite tables used by the real soledad, so lookups don't need to scan all
+    the documents.
+    """
+
+    def __init__(self):
+        self._docs = {}
+        self._index_definitions = {}
+        self._indexes = {}
+        self._doc_index_keys = {}
+        self._next_id = 0
+
+    # indexes
+
+    def list_indexes(self):
+        return defer.succeed(self._index_definitions.items())
+
+    def create_index(self, index_name, *index_expressions):
+        self._index_definitions[index_name] = list(index_expressions)
+        self._indexes[index_name] = {}
+        for doc_id in self._docs:
+            self._index_doc(doc_id, index_name)
+        return defer.succeed(None)
+
+    def delete_index(self, index_name):
+        del self._index_definitions[index_name]
+        del self._indexes[index_name]
+        for keys in self._doc_index_keys.values():
+            keys.pop(index_name, None)
+        return defer.succeed(None)
+
+    def get_from_index(self, index_name, *key_values):
+        doc_ids = self._indexes[index_name].get(tuple(key_values), ())
+        return defer.succeed([self._copy(doc_id) for doc_id in doc_ids])
+
+    # documents
+
+    def create_doc_from_json(self, json_string, doc_id=None):
+        if doc_id is None:
+            self._next_id += 1
+            doc_id = 'D-%d' % (self._next_id,)
+        self._docs[doc_id] = json.loads(json_string)
+        self._reindex(doc_id)
+        return defer.succeed(self._copy(doc_id))
+
+    def put_doc(self, doc):
+        self._docs[doc.doc_id] = copy.deepcopy(doc.content)
+        self._reindex(doc.doc_id)
+        return defer.succeed(doc.rev)
+
+    def delete_doc(self, doc):
+        self._unindex(doc.doc_id)
+        del self._docs[doc.doc_id]
+        doc.content = None
+        return defer.succeed(None)
+
+    def close(self):
+        pass
+
+    def _copy(self, doc_id):
+        return LocalDocument(doc_id, copy.deepcopy(self._docs[doc_id]))
+
+    def _reindex(self, doc_id):
+        self._unindex(doc_id)
+        for index_name in self._index_definitions:
+            self._index_doc(doc_id, index_name)
+
+    def _index_doc(self, doc_id, index_name):
+        content = self._docs[doc_id]
+        keys = _index_keys(self._index_definitions[index_name], content)
+        index = self._indexes[index_name]
+        for key in keys:
+            index.setdefault(key, set()).add(doc_id)
+        self._doc_index_keys.setdefault(doc_id, {})[index_name] = keys
+
+    def _unindex(self, doc_id):
+        for index_name, keys in self._doc_index_keys.pop(doc_id, {}).items():
+            index = self._indexes[index_name]
+            for key in keys:
+                index[key].discard(doc_id)
+
+
+def _index_keys(expressions, content):
+    """
+    Return the keys under which C{content} is indexed by an index with the
+    given u1db C{expressions}. A list field produces one key per element.
+    """
+    keys = [()]
+    for expression in expressions:
+        match = BOOL_RE.match(expression)
+        if match:
+            values = ['1' if content.get(match.group(1)) else '0']
+        else:
+            value = content.get(expression)
+            if value is None:
+                return []
+            values = value if isinstance(value, list) else [value]
+        keys = [key + (unicode(item),) for key in keys for item in values]
+    return keys
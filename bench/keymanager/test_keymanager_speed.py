@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# test_keymanager_speed.py
+# Copyright (C) 2017 LEAP Encryption Acess Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarking for leap.bitmask.keymanager.KeyManager, end to end through
+OpenPGPScheme and the key store.
+
+The key store is a LocalSoledad, and the calls that are normally deferred to
+threads are run synchronously, so each benchmark measures the real work done
+by KeyManager, gpg and the document handling without the reactor.
+
+Use --benchmark-json=<file> to get machine-readable results.
+"""
+
+import pytest
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from leap.bitmask import keymanager
+from leap.bitmask.keymanager import openpgp
+from leap.bitmask.keymanager.keys import OpenPGPKey
+from leap.bitmask.util import get_gpg_bin_path
+
+from common import ADDRESS
+from common import CIPHERTEXT
+from common import SIGNEDTEXT
+from common import PUBLIC_KEY
+from common import PRIVATE_KEY
+
+from local_soledad import LocalSoledad
+
+
+GROUP_CRYPTO = 'keymanager crypto'
+GROUP_GET_KEY = 'keymanager get_key'
+GROUP_GET_ALL_KEYS = 'keymanager get_all_keys'
+GROUP_PUT_RAW_KEY = 'keymanager put_raw_key'
+
+NUM_STORED_KEYS = [0, 10, 100, 1000]
+
+PLAINTEXT = ' ' * 10000  # 10 KB
+
+
+def run(d):
+    """
+    Return the result of an already fired deferred.
+    """
+    result = []
+    d.addBoth(result.append)
+    assert result, 'Deferred has not fired synchronously'
+    if isinstance(result[0], Failure):
+        result[0].raiseException()
+    return result[0]
+
+
+def store_keys(soledad, num_keys):
+    """
+    Store C{num_keys} public keys bound to different addresses directly in
+    the key store. Key material is not parsed on lookups, so all of them
+    reuse the same key data.
+    """
+    for i in xrange(num_keys):
+        key = OpenPGPKey(
+            address='user%d@leap.se' % (i,),
+            fingerprint='%040X' % (i,),
+            key_data=PUBLIC_KEY,
+            length=4096)
+        soledad.create_doc_from_json(key.get_json())
+        soledad.create_doc_from_json(key.get_active_json())
+
+
+@pytest.fixture
+def km(monkeypatch):
+    monkeypatch.setattr(
+        openpgp, 'from_thread',
+        lambda func, *args, **kw: defer.maybeDeferred(func, *args, **kw))
+    monkeypatch.setattr(keymanager, 'emit_async', lambda *args: None)
+
+    soledad = LocalSoledad()
+    km = keymanager.KeyManager(
+        ADDRESS, '', soledad, gpgbinary=get_gpg_bin_path())
+    run(km._openpgp.deferred_init)
+    return km
+
+
+@pytest.fixture
+def km_with_keys(km):
+    run(km.put_raw_key(PRIVATE_KEY, ADDRESS))
+    return km
+
+
+#
+# encrypt, decrypt, sign and verify
+#
+
+@pytest.mark.benchmark(group=GROUP_CRYPTO)
+def test_keymanager_encrypt(benchmark, km_with_keys):
+    encrypt = lambda: run(km_with_keys.encrypt(
+        PLAINTEXT, ADDRESS, fetch_remote=False))
+    ciphertext = benchmark(encrypt)
+    assert ciphertext
+
+
+@pytest.mark.benchmark(group=GROUP_CRYPTO)
+def test_keymanager_encrypt_and_sign(benchmark, km_with_keys):
+    encrypt = lambda: run(km_with_keys.encrypt(
+        PLAINTEXT, ADDRESS, sign=ADDRESS, fetch_remote=False))
+    ciphertext = benchmark(encrypt)
+    assert ciphertext
+
+
+@pytest.mark.benchmark(group=GROUP_CRYPTO)
+def test_keymanager_decrypt(benchmark, km_with_keys):
+    decrypt = lambda: run(km_with_keys.decrypt(CIPHERTEXT, ADDRESS))
+    plaintext, _ = benchmark(decrypt)
+    assert plaintext
+
+
+@pytest.mark.benchmark(group=GROUP_CRYPTO)
+def test_keymanager_sign(benchmark, km_with_keys):
+    sign = lambda: run(km_with_keys.sign(PLAINTEXT, ADDRESS))
+    signature = benchmark(sign)
+    assert '-----BEGIN PGP SIGNATURE-----' in signature
+
+
+@pytest.mark.benchmark(group=GROUP_CRYPTO)
+def test_keymanager_verify(benchmark, km_with_keys):
+    verify = lambda: run(km_with_keys.verify(
+        SIGNEDTEXT, ADDRESS, fetch_remote=False))
+    key = benchmark(verify)
+    assert key.address == ADDRESS
+
+
+#
+# key store scaling with the number of stored keys
+#
+
+@pytest.mark.benchmark(group=GROUP_GET_KEY)
+@pytest.mark.parametrize('num_keys', NUM_STORED_KEYS)
+def test_keymanager_get_key(benchmark, km_with_keys, num_keys):
+    store_keys(km_with_keys._soledad, num_keys)
+    get_key = lambda: run(km_with_keys.get_key(ADDRESS, fetch_remote=False))
+    key = benchmark(get_key)
+    assert key.address == ADDRESS
+
+
+@pytest.mark.benchmark(group=GROUP_GET_ALL_KEYS)
+@pytest.mark.parametrize('num_keys', NUM_STORED_KEYS)
+def test_keymanager_get_all_keys(benchmark, km_with_keys, num_keys):
+    store_keys(km_with_keys._soledad, num_keys)
+    get_all_keys = lambda: run(km_with_keys.get_all_keys())
+    keys = benchmark(get_all_keys)
+    assert len(keys) == num_keys + 1
+
+
+@pytest.mark.benchmark(group=GROUP_PUT_RAW_KEY)
+@pytest.mark.parametrize('num_keys', NUM_STORED_KEYS)
+def test_keymanager_put_raw_key(benchmark, km, num_keys):
+    store_keys(km._soledad, num_keys)
+    put_raw_key = lambda: run(km.put_raw_key(PUBLIC_KEY, ADDRESS))
+    benchmark(put_raw_key)
+    key = run(km.get_key(ADDRESS, fetch_remote=False))
+    assert key.address == ADDRESS
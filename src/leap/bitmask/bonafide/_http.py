@@ -20,22 +20,113 @@ twisted.web utils for bonafide.
 """
 import base64
 import cookielib
+import json
+import os
 import urllib
 
-from twisted.internet import defer, protocol, reactor
+from twisted.internet import defer, reactor
 from twisted.internet.ssl import Certificate
 from twisted.python.filepath import FilePath
-from twisted.web.client import Agent, CookieAgent
+from twisted.web.client import Agent, CookieAgent, HTTPConnectionPool
+from twisted.web.client import readBody
 from twisted.web.client import BrowserLikePolicyForHTTPS
+from twisted.web.error import Error
 from twisted.web.http_headers import Headers
 from twisted.web.iweb import IBodyProducer
 from zope.interface import implements
 
 
-def cookieAgentFactory(verify_path, connectTimeout=30):
+MAX_PERSISTENT_PER_HOST = 4
+CACHED_CONNECTION_TIMEOUT = 240  # seconds
+
+# ca cert path -> MeteredPool
+_pools = {}
+
+
+class MeteredPool(HTTPConnectionPool):
+
+    """
+    A persistent connection pool that counts how many requests could reuse
+    an idle connection.
+    """
+
+    def __init__(self, reactor, persistent=True):
+        HTTPConnectionPool.__init__(self, reactor, persistent=persistent)
+        self.requests = 0
+        self.reused = 0
+
+    def getConnection(self, key, endpoint):
+        self.requests += 1
+        if self._connections.get(key):
+            self.reused += 1
+        return HTTPConnectionPool.getConnection(self, key, endpoint)
+
+    def stats(self):
+        idle = sum(len(conns) for conns in self._connections.values())
+        return {'requests': self.requests, 'reused': self.reused,
+                'idle': idle}
+
+
+def getPool(verify_path, maxPersistentPerHost=MAX_PERSISTENT_PER_HOST,
+            cachedConnectionTimeout=CACHED_CONNECTION_TIMEOUT):
+    """
+    Get the connection pool shared by all the agents that verify the
+    provider api with the CA certificate in verify_path.
+
+    Connections are only shared between agents that trust the same
+    certificate, so a connection is never reused with a weaker verification
+    than the one it was opened with. The pool keeps the limits it was
+    created with, the ones passed by later callers are ignored.
+
+    :param verify_path: the path to the CA certificate of the provider
+    :type verify_path: str
+    :param maxPersistentPerHost: the maximum number of idle connections kept
+                                 open to each host
+    :type maxPersistentPerHost: int
+    :param cachedConnectionTimeout: the seconds an idle connection is kept
+                                    open
+    :type cachedConnectionTimeout: int
+    :rtype: MeteredPool
+    """
+    pool = _pools.get(verify_path)
+    if pool is None:
+        pool = _pools[verify_path] = MeteredPool(reactor)
+        pool.maxPersistentPerHost = maxPersistentPerHost
+        pool.cachedConnectionTimeout = cachedConnectionTimeout
+    return pool
+
+
+def getPoolStats():
+    """
+    :return: the usage of the connection pool of each provider.
+    :rtype: dict
+    """
+    return dict((path, pool.stats()) for path, pool in _pools.items())
+
+
+def closePools():
+    """
+    Close the idle connections of all the pools.
+
+    :rtype: Deferred
+    """
+    return defer.gatherResults(
+        [pool.closeCachedConnections() for pool in _pools.values()])
+
+
+def verifiedAgentFactory(verify_path, connectTimeout=30):
+    """
+    Return an agent that verifies the servers against the CA certificate in
+    verify_path, and keeps its connections in the shared pool for it.
+    """
     customPolicy = BrowserLikePolicyForHTTPS(
         Certificate.loadPEM(FilePath(verify_path).getContent()))
-    agent = Agent(reactor, customPolicy, connectTimeout=connectTimeout)
+    return Agent(reactor, customPolicy, connectTimeout=connectTimeout,
+                 pool=getPool(verify_path))
+
+
+def cookieAgentFactory(verify_path, connectTimeout=30):
+    agent = verifiedAgentFactory(verify_path, connectTimeout=connectTimeout)
     cookiejar = cookielib.CookieJar()
     return CookieAgent(agent, cookiejar)
 
@@ -50,25 +141,9 @@ def httpRequest(agent, url, values={}, headers={}, method='POST', token=None):
         headers['Authorization'] = ['Token token="%s"' % (bytes(token))]
 
     def handle_response(response):
-        # print "RESPONSE CODE", response.code
         if response.code == 204:
-            d = defer.succeed('')
-        else:
-            class SimpleReceiver(protocol.Protocol):
-                def __init__(s, d):
-                    s.buf = ''
-                    s.d = d
-
-                def dataReceived(s, data):
-                    s.buf += data
-
-                def connectionLost(s, reason):
-                    # TODO: test if reason is twisted.web.client.ResponseDone,
-                    # if not, do an errback
-                    s.d.callback(s.buf)
-            d = defer.Deferred()
-            response.deliverBody(SimpleReceiver(d))
-        return d
+            return defer.succeed('')
+        return readBody(response)
 
     d = agent.request(method, url, Headers(headers),
                       StringProducer(data) if data else None)
@@ -76,6 +151,64 @@ def httpRequest(agent, url, values={}, headers={}, method='POST', token=None):
     return d
 
 
+def conditionalDownload(agent, url, path, method='GET', headers=None):
+    """
+    Download url to path, unless the copy in path is still fresh.
+
+    The ETag and Last-Modified headers of the response are stored next to
+    the file, in path + '.http', and sent back in the next request as
+    If-None-Match and If-Modified-Since. The file is replaced atomically, so
+    readers never see a partial download.
+
+    :return: a deferred that fires with True if the file was downloaded, or
+             False if the server answered that it was not modified.
+    :rtype: Deferred
+    """
+    headers = dict(headers or {})
+    meta_path = path + '.http'
+    meta = {}
+    if os.path.isfile(path) and os.path.isfile(meta_path):
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except ValueError:
+            meta = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = [str(meta['etag'])]
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = [str(meta['last_modified'])]
+
+    def handle_response(response):
+        if response.code == 304:
+            d = readBody(response)
+            d.addCallback(lambda _: False)
+            return d
+        if response.code != 200:
+            raise Error(response.code, response.phrase)
+
+        def save(body):
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(body)
+            os.rename(tmp_path, path)
+
+            get = response.headers.getRawHeaders
+            new_meta = {
+                'etag': (get('etag') or [None])[0],
+                'last_modified': (get('last-modified') or [None])[0]}
+            with open(meta_path, 'w') as f:
+                json.dump(new_meta, f)
+            return True
+
+        d = readBody(response)
+        d.addCallback(save)
+        return d
+
+    d = agent.request(method, url, Headers(headers), None)
+    d.addCallback(handle_response)
+    return d
+
+
 class StringProducer(object):
 
     implements(IBodyProducer)
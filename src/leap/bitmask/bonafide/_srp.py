@@ -17,18 +17,95 @@
 
 """
 SRP Authentication.
-"""
 
-from twisted.logger import Logger
+The big number arithmetic of SRP takes a while, so it runs in a small pool of
+worker threads instead of the reactor. The srp module used for it can be
+changed with set_backend; by default the fastest one available is used.
+"""
 
 import binascii
+import importlib
 import json
 
+from twisted.internet import reactor, threads
+from twisted.logger import Logger
+from twisted.python.threadpool import ThreadPool
+
 import srp
 
 
 log = Logger()
 
+# srp implementations, from the fastest one. _ctsrp uses OpenSSL through
+# ctypes, _srp is the C extension of older releases of srp.
+BACKENDS = ('srp._ctsrp', 'srp._srp', 'srp._pysrp')
+MAX_SRP_THREADS = 2
+
+_backend = None
+_pool = None
+
+
+def get_backend():
+    """
+    :return: the module doing the srp computations.
+    :rtype: module
+    """
+    global _backend
+    if _backend is None:
+        _backend = _load_backend(BACKENDS)
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Use another srp implementation.
+
+    :param backend: the module, or its name, providing User, SHA256, NG_1024
+                    and create_salted_verification_key, like the srp module
+    :type backend: module or str
+    """
+    global _backend
+    if isinstance(backend, basestring):
+        backend = importlib.import_module(backend)
+    _backend = backend
+
+
+def _load_backend(names):
+    for name in names:
+        try:
+            backend = importlib.import_module(name)
+        except (ImportError, OSError):
+            continue
+        log.debug('Using %s for srp' % name)
+        return backend
+    return srp
+
+
+def deferToSRPThread(f, *args, **kw):
+    """
+    Run f in the srp worker threads.
+
+    :rtype: Deferred
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPool(minthreads=0, maxthreads=MAX_SRP_THREADS,
+                           name='srp')
+        _pool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', _stop_pool)
+    return threads.deferToThreadPool(reactor, _pool, f, *args, **kw)
+
+
+def _stop_pool():
+    """
+    Stop the srp worker threads, they are started again on the next call to
+    deferToSRPThread.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
 
 class SRPAuthMechanism(object):
 
@@ -38,24 +115,52 @@ class SRPAuthMechanism(object):
 
     def __init__(self, username, password):
         self.username = username
-        self.srp_user = srp.User(username, password,
-                                 srp.SHA256, srp.NG_1024)
-        _, A = self.srp_user.start_authentication()
-        self.A = A
+        self.password = password
+        self.srp_user = None
+        self.A = None
         self.M = None
         self.M2 = None
 
+    def start_authentication(self):
+        """
+        Generate the ephemeral values of a new authentication.
+
+        :return: a Deferred which fires when they are ready.
+        :rtype: Deferred
+        """
+        return deferToSRPThread(self._start_authentication)
+
+    def _start_authentication(self):
+        backend = get_backend()
+        self.srp_user = backend.User(self.username, self.password,
+                                     backend.SHA256, backend.NG_1024)
+        _, self.A = self.srp_user.start_authentication()
+        self.M = None
+        self.M2 = None
+
+    def authenticated(self):
+        return self.srp_user is not None and self.srp_user.authenticated()
+
     def get_handshake_params(self):
         return {'login': bytes(self.username),
                 'A': binascii.hexlify(self.A)}
 
     def process_handshake(self, handshake_response):
+        """
+        Compute the proof for the challenge of the server.
+
+        :return: a Deferred which fires when the proof is ready.
+        :rtype: Deferred
+        """
         challenge = json.loads(handshake_response)
         self._check_for_errors(challenge)
         salt = challenge.get('salt', None)
         B = challenge.get('B', None)
         unhex_salt, unhex_B = self._unhex_salt_B(salt, B)
-        self.M = self.srp_user.process_challenge(unhex_salt, unhex_B)
+        return deferToSRPThread(self._process_challenge, unhex_salt, unhex_B)
+
+    def _process_challenge(self, salt, B):
+        self.M = self.srp_user.process_challenge(salt, B)
 
     def get_authentication_params(self):
         # It looks A is not used server side
@@ -170,8 +275,9 @@ class SRPRecoveryCodeUpdateMechanism(object):
 
 
 def _get_salt_verifier(username, password):
-    return srp.create_salted_verification_key(bytes(username), bytes(password),
-                                              srp.SHA256, srp.NG_1024)
+    backend = get_backend()
+    return backend.create_salted_verification_key(
+        bytes(username), bytes(password), backend.SHA256, backend.NG_1024)
 
 
 def _safe_unhexlify(val):
@@ -30,9 +30,11 @@ from urlparse import urlparse
 from twisted.internet import defer, reactor
 from twisted.internet.ssl import ClientContextFactory
 from twisted.logger import Logger
-from twisted.web.client import Agent, downloadPage
+from twisted.web.client import Agent, BrowserLikePolicyForHTTPS
+from twisted.web.error import Error
 
-from leap.bitmask.bonafide._http import httpRequest
+from leap.bitmask.bonafide._http import httpRequest, conditionalDownload
+from leap.bitmask.bonafide._http import verifiedAgentFactory
 from leap.bitmask.bonafide.provider import Discovery
 from leap.bitmask.bonafide.errors import NotConfiguredError, NetworkError
 
@@ -115,6 +117,44 @@ def is_empty_file(path):
     return os.stat(path).st_size is 0
 
 
+# path -> (mtime, size, parsed json)
+_json_cache = {}
+
+
+def load_json(path):
+    """
+    Load a json file, parsing it again only if it changed since the last
+    time it was loaded.
+
+    The returned object is shared by all the callers, so it must not be
+    modified.
+
+    :param path: the path of the json file
+    :type path: str
+    :raises: IOError if the file can't be read.
+    :returns: the parsed json
+    """
+    stat = os.stat(path)
+    cached = _json_cache.get(path)
+    if cached and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+    with open(path, 'r') as f:
+        data = json.load(f)
+    _json_cache[path] = (stat.st_mtime, stat.st_size, data)
+    return data
+
+
+def invalidate_json(path):
+    """
+    Forget the cached contents of a json file. To be called after it is
+    rewritten, since the mtime might not change within the same second.
+
+    :param path: the path of the json file
+    :type path: str
+    """
+    _json_cache.pop(path, None)
+
+
 def make_address(user, provider):
     """
     Return a full identifier for an user, as a email-like
@@ -243,9 +283,8 @@ class Provider(object):
 
         path = self._get_service_config_path(service)
         try:
-            with open(path, 'r') as config:
-                config = Record(**json.load(config))
-        except IOError:
+            config = Record(**load_json(path))
+        except (IOError, OSError):
             raise ValueError("Service " + service +
                              " not found in provider " + self._domain)
         return config
@@ -307,23 +346,82 @@ class Provider(object):
             shutil.rmtree(folders)
             raise NetworkError(failure.getErrorMessage())
 
-        d = downloadPage(uri, provider_json, method=met)
+        d = self._download_page(uri, provider_json, method=met,
+                                agent=self._get_domain_agent())
         d.addCallback(lambda _: self._load_provider_json())
         d.addErrback(errback)
         return d
 
     def update_provider_info(self):
         """
-        Get more recent copy of provider.json from the api URL.
+        Get more recent copies of provider.json and the services configs
+        from the api URL.
+
+        The files are revalidated with conditional requests, so only the ones
+        that changed are downloaded.
+
+        :return: a deferred that fires with the paths of the updated files.
+        :rtype: Deferred
         """
-        pass
+        if not self.is_configured():
+            return defer.succeed([])
+
+        # provider.json is served from the main domain, with a certificate
+        # that is not signed by the provider CA
+        domain_agent = self._get_domain_agent()
+        api_agent = self._get_verified_agent()
+        downloads = [
+            (domain_agent, self._disco.get_provider_info_uri(),
+             self._disco.get_provider_info_method(),
+             self._get_provider_json_path())]
+        if self.has_fetched_services_config():
+            downloads.append(
+                (api_agent,) + self._get_configs_download_params())
+            base = self._disco.get_base_uri()
+            services_dict = self._load_provider_configs()
+            for service in self._provider_config.services:
+                for subservice in self.SERVICES_MAP.get(service, []):
+                    downloads.append(
+                        (api_agent, base + str(services_dict[subservice]),
+                         'GET', self._get_service_config_path(subservice)))
+
+        updated = []
+
+        def downloaded(changed, path):
+            if changed:
+                invalidate_json(path)
+                updated.append(path)
+
+        def failed(failure, uri):
+            # some providers need auth for the services configs, those are
+            # updated on login
+            if failure.check(Error) and int(failure.value.status) == 401:
+                return
+            self.log.warn(
+                'Could not update %s: %s' % (uri, failure.getErrorMessage()))
+
+        pending = []
+        for agent, uri, method, path in downloads:
+            d = conditionalDownload(agent, str(uri), path, method=method)
+            d.addCallbacks(downloaded, failed,
+                           callbackArgs=(path,), errbackArgs=(uri,))
+            pending.append(d)
+
+        def done(_):
+            if self._get_provider_json_path() in updated:
+                self._load_provider_json()
+            return updated
+
+        d = defer.gatherResults(pending)
+        d.addCallback(done)
+        return d
 
     def maybe_download_ca_cert(self, ignored):
         """
         :rtype: deferred
         """
 
-        def errback(self, failure):
+        def errback(failure):
             raise NetworkError(failure.getErrorMessage())
 
         path = self._get_ca_cert_path()
@@ -332,7 +430,7 @@ class Provider(object):
 
         uri = self._get_ca_cert_uri()
         mkdir_p(os.path.split(path)[0])
-        d = downloadPage(uri, path)
+        d = self._download_page(uri, path)
         d.addErrback(errback)
         return d
 
@@ -367,7 +465,7 @@ class Provider(object):
 
         uri, met, path = self._get_configs_download_params()
 
-        d = downloadPage(uri, path, method=met)
+        d = self._download_page(uri, path, method=met)
         d.addCallback(lambda _: self._load_provider_json())
         d.addCallback(
             lambda _: self._get_config_for_all_services(session=None))
@@ -499,8 +597,7 @@ class Provider(object):
             self.log.debug('cannot LOAD provider config path %s' % path)
             return
 
-        with open(path, 'r') as config:
-            self._provider_config = Record(**json.load(config))
+        self._provider_config = Record(**load_json(path))
 
         api_uri = self._provider_config.api_uri
         if api_uri:
@@ -509,9 +606,6 @@ class Provider(object):
 
     def _get_config_for_all_services(self, session):
         services_dict = self._load_provider_configs()
-        configs_path = self._get_configs_path()
-        with open(configs_path) as jsonf:
-            services_dict = Record(**json.load(jsonf)).services
         pending = []
         base = self._disco.get_base_uri()
         for service in self._provider_config.services:
@@ -529,17 +623,46 @@ class Provider(object):
 
     def _load_provider_configs(self):
         configs_path = self._get_configs_path()
-        with open(configs_path) as jsonf:
-            services_dict = Record(**json.load(jsonf)).services
+        services_dict = Record(**load_json(configs_path)).services
         return services_dict
 
     def _fetch_provider_configs_unauthenticated(self, uri, path):
         self.log.info('Downloading config for %s...' % uri)
-        d = downloadPage(uri, path, method='GET')
+        d = self._download_page(uri, path, method='GET')
         return d
 
+    def _download_page(self, uri, path, method='GET', agent=None):
+        if agent is None:
+            agent = self._agent
+            if self.contextFactory is None:
+                agent = self._get_verified_agent()
+
+        def downloaded(changed):
+            invalidate_json(path)
+            return changed
+
+        d = conditionalDownload(agent, str(uri), path, method=method)
+        d.addCallback(downloaded)
+        return d
+
+    def _get_verified_agent(self):
+        """
+        Return an agent that verifies the api certificates against the CA
+        certificate of the provider.
+        """
+        return verifiedAgentFactory(self._get_ca_cert_path())
+
+    def _get_domain_agent(self):
+        """
+        Return an agent for the main domain of the provider, that verifies
+        its certificate against the system trust roots, or the bootstrap
+        agent while the provider is not configured.
+        """
+        if self.contextFactory is None:
+            return Agent(reactor, BrowserLikePolicyForHTTPS())
+        return self._agent
+
     def _http_request(self, *args, **kw):
-        # XXX pass if-modified-since header
         return httpRequest(self._agent, *args, **kw)
 
 
@@ -21,17 +21,23 @@ Bonafide Service.
 import os
 from collections import defaultdict
 
+from leap.bitmask.bonafide import config
+from leap.bitmask.bonafide._http import closePools
 from leap.bitmask.bonafide._protocol import BonafideProtocol
 from leap.bitmask.hooks import HookableService
 from leap.common.config import get_path_prefix
 from leap.common.events import catalog, emit_async
 
 from twisted.internet import defer
+from twisted.internet.task import LoopingCall
 from twisted.logger import Logger
 
 
 _preffix = get_path_prefix()
 
+# how often the configs of the known providers are revalidated, in seconds
+PROVIDER_REFRESH_PERIOD = 6 * 60 * 60
+
 
 class BonafideService(HookableService):
 
@@ -43,10 +49,44 @@ class BonafideService(HookableService):
         self._basedir = os.path.expanduser(basedir)
         self._bonafide = BonafideProtocol()
         self.service_hooks = defaultdict(list)
+        self._refresh_loop = LoopingCall(self._refresh_providers)
 
     def startService(self):
         self.log.debug('Starting Bonafide Service')
         super(BonafideService, self).startService()
+        self._refresh_loop.start(PROVIDER_REFRESH_PERIOD, now=False)
+
+    def stopService(self):
+        if self._refresh_loop.running:
+            self._refresh_loop.stop()
+        closePools()
+        super(BonafideService, self).stopService()
+
+    def _refresh_providers(self):
+        """
+        Update the configs of the known providers in the background. Any
+        error is logged, so it never gets in the way of a login.
+        """
+        def log_error(failure, domain):
+            self.log.warn('Error updating provider %s: %s'
+                          % (domain, failure.getErrorMessage()))
+
+        def log_updated(updated, domain):
+            if updated:
+                self.log.info('Updated configs for provider %s: %s'
+                              % (domain, ', '.join(updated)))
+
+        pending = []
+        for domain in config.list_providers():
+            d = defer.maybeDeferred(self._update_provider, domain)
+            d.addCallbacks(log_updated, log_error,
+                           callbackArgs=(domain,), errbackArgs=(domain,))
+            pending.append(d)
+        return defer.gatherResults(pending)
+
+    def _update_provider(self, domain):
+        provider = config.Provider(domain, basedir=self._basedir)
+        return provider.update_provider_info()
 
     # Commands
 
@@ -23,6 +23,7 @@ from twisted.logger import Logger
 from leap.bitmask.bonafide import _srp
 from leap.bitmask.bonafide import provider
 from leap.bitmask.bonafide._http import httpRequest, cookieAgentFactory
+from leap.bitmask.bonafide.config import invalidate_json
 
 
 OK = 'ok'
@@ -86,19 +87,20 @@ class Session(object):
 
     @property
     def is_authenticated(self):
-        return self._srp_auth.srp_user.authenticated()
+        return self._srp_auth.authenticated()
 
     @defer.inlineCallbacks
     def authenticate(self):
         uri = self._api.get_handshake_uri()
         met = self._api.get_handshake_method()
         self.log.debug('%s to %s' % (met, uri))
+        yield self._srp_auth.start_authentication()
         params = self._srp_auth.get_handshake_params()
 
         handshake = yield self._request(self._agent, uri, values=params,
                                         method=met)
 
-        self._srp_auth.process_handshake(handshake)
+        yield self._srp_auth.process_handshake(handshake)
         uri = self._api.get_authenticate_uri(login=self.username)
         met = self._api.get_authenticate_method()
 
@@ -131,8 +133,8 @@ class Session(object):
     def change_password(self, password):
         uri = self._api.get_update_user_uri(uid=self._uuid)
         met = self._api.get_update_user_method()
-        params = self._srp_password.get_password_params(
-            self.username, password)
+        params = yield _srp.deferToSRPThread(
+            self._srp_password.get_password_params, self.username, password)
         update = yield self._request(self._agent, uri, values=params,
                                      method=met)
         self.password = password
@@ -144,7 +146,8 @@ class Session(object):
     def update_recovery_code(self, recovery_code):
         uri = self._api.get_update_user_uri(uid=self._uuid)
         met = self._api.get_update_user_method()
-        params = self._srp_recovery_code.get_recovery_code_params(
+        params = yield _srp.deferToSRPThread(
+            self._srp_recovery_code.get_recovery_code_params,
             self.username, recovery_code)
         update = yield self._request(self._agent, uri, values=params,
                                      method=met)
@@ -180,8 +183,8 @@ class Session(object):
         provider.validate_username(username)
         uri = self._api.get_signup_uri()
         met = self._api.get_signup_method()
-        params = self._srp_signup.get_signup_params(
-            username, password, invite)
+        params = yield _srp.deferToSRPThread(
+            self._srp_signup.get_signup_params, username, password, invite)
 
         signup = yield self._request(self._agent, uri, values=params,
                                      method=met)
@@ -202,6 +205,7 @@ class Session(object):
         config = yield self._request(self._agent, uri)
         with open(path, 'w') as cf:
             cf.write(config)
+        invalidate_json(path)
         defer.returnValue('ok')
 
 
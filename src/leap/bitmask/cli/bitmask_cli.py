@@ -18,7 +18,9 @@
 """
 Bitmask Command Line interface: zmq client.
 """
+import argparse
 import json
+import shlex
 import sys
 import signal
 import traceback
@@ -57,6 +59,9 @@ GENERAL COMMANDS:
   stop       stops the Bitmask backend daemon
   status     displays general status about the running Bitmask services
   stats      show some debug info about bitmask-core
+  memory     show the memory used by each part of bitmask-core
+  batch      runs the commands of a file (or stdin), one per line
+  shell      interactive shell to run commands over one connection
   help       show this help message
 
 OPTIONAL ARGUMENTS:
@@ -76,7 +81,7 @@ OPTIONAL ARGUMENTS:
         return mail.execute(raw_args)
 
     def vpn(self, raw_args):
-        vpn = VPN(self.cfg)
+        vpn = VPN(self.cfg, self.print_json)
         return vpn.execute(raw_args)
 
     def keys(self, raw_args):
@@ -134,6 +139,95 @@ OPTIONAL ARGUMENTS:
         self.data = ['core', 'stats']
         return self._send(printer=command.default_dict_printer)
 
+    def memory(self, raw_args):
+        self.data = ['core', 'memory']
+        return self._send(printer=command.default_dict_printer)
+
+    # Many commands over the same connection
+
+    def batch(self, raw_args):
+        parser = argparse.ArgumentParser(
+            description='Run bitmaskctl commands, one per line, and print '
+                        'the json response of each of them in a line',
+            prog='%s batch' % command.appname)
+        parser.add_argument('file', nargs='?', default='-',
+                            help='file with the commands (default: stdin)')
+        subargs = parser.parse_args(raw_args)
+
+        command.Command.json_indent = None
+        if subargs.file == '-':
+            return self._run_lines(iter(sys.stdin.readline, ''), True)
+
+        f = open(subargs.file)
+
+        def close(result):
+            f.close()
+            return result
+
+        d = self._run_lines(f, True)
+        d.addBoth(close)
+        return d
+
+    def shell(self, raw_args):
+        try:
+            import readline  # noqa: enables the line edition of raw_input
+        except ImportError:
+            pass
+
+        def read_lines():
+            while True:
+                try:
+                    line = raw_input('bitmask> ')
+                except EOFError:
+                    print('')
+                    return
+                if line.strip() in ('exit', 'quit'):
+                    return
+                yield line
+
+        print("Type 'help' to list the commands and 'exit' to leave.")
+        return self._run_lines(read_lines(), self.print_json)
+
+    @defer.inlineCallbacks
+    def _run_lines(self, lines, print_json):
+        for line in lines:
+            try:
+                args = shlex.split(line, comments=True)
+            except ValueError as e:
+                self._print_line_error(e, print_json)
+                continue
+            if not args:
+                continue
+            if args[0] in ('batch', 'shell'):
+                self._print_line_error(
+                    "'%s' can not be nested" % args[0], print_json)
+                continue
+            yield self._run_line(args, print_json)
+            sys.stdout.flush()
+
+    @defer.inlineCallbacks
+    def _run_line(self, args, print_json):
+        # the subcommands build their usage from sys.argv
+        argv = sys.argv
+        sys.argv = [argv[0]] + args
+        try:
+            # a new instance for each line, as the commands modify its data,
+            # but all of them share the connection to the daemon
+            cli = BitmaskCLI(self.cfg, print_json)
+            yield cli.execute(args)
+        except SystemExit:
+            pass
+        except Exception as e:
+            self._print_line_error(e, print_json)
+        finally:
+            sys.argv = argv
+
+    def _print_line_error(self, error, print_json):
+        if print_json:
+            print(json.dumps({'error': str(error), 'result': None}))
+        else:
+            print(Fore.RED + "ERROR: " + Fore.RESET + "%s" % error)
+
 
 @defer.inlineCallbacks
 def execute():
@@ -33,6 +33,23 @@ from leap.bitmask.core import ENDPOINT
 
 appname = 'bitmaskctl'
 
+# the connection to the daemon, shared by all the commands of the process
+_connection = None
+
+
+def get_connection():
+    """
+    Get the connection to the bitmask daemon, creating it on first use.
+
+    :rtype: ZmqREQConnection
+    """
+    global _connection
+    if _connection is None:
+        zf = ZmqFactory()
+        e = ZmqEndpoint(ZmqEndpointType.connect, ENDPOINT)
+        _connection = ZmqREQConnection(zf, e)
+    return _connection
+
 
 def _print_result(result):
     print Fore.GREEN + '%s' % result + Fore.RESET
@@ -88,14 +105,17 @@ class Command(object):
     epilog = ("Use bitmaskctl <subcommand> --help' to learn more "
               "about each command.")
     commands = []
+    # method names of the subcommands that can't be used as one, like the
+    # python reserved words
+    aliases = {}
+    # indentation of the printed json, None prints one response per line
+    json_indent = 2
 
     def __init__(self, cfg, print_json=False):
         self.cfg = cfg
 
         color_init()
-        zf = ZmqFactory()
-        e = ZmqEndpoint(ZmqEndpointType.connect, ENDPOINT)
-        self._conn = ZmqREQConnection(zf, e)
+        self._conn = get_connection()
 
         self.data = []
         if self.service:
@@ -117,15 +137,16 @@ class Command(object):
             self.data += [args.command] + raw_args[1:]
             return self._send(printer=default_dict_printer)
 
-        elif (args.command == 'execute' or
-                args.command.startswith('_') or
-                not hasattr(self, args.command)):
+        name = self.aliases.get(args.command, args.command)
+        if (name == 'execute' or
+                name.startswith('_') or
+                not hasattr(self, name)):
             print 'Unrecognized command'
             return self.help([])
 
         try:
             # use dispatch pattern to invoke method with same name
-            return getattr(self, args.command)(raw_args[1:])
+            return getattr(self, name)(raw_args[1:])
         except SystemExit:
             return defer.succeed(None)
 
@@ -146,7 +167,7 @@ class Command(object):
     def _check_err(self, stuff, printer):
         obj = json.loads(stuff[0])
         if self.print_json:
-            print(json.dumps(obj, indent=2))
+            print(json.dumps(obj, indent=self.json_indent))
         elif not obj['error']:
             if not obj['result']:
                 print (Fore.RED + 'ERROR: malformed response, expected'
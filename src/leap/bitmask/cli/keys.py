@@ -37,8 +37,11 @@ SUBCOMMANDS:
    list       List all known keys
    export     Export a given key
    insert     Insert a key to the key storage
+   import     Import all the keys of a keyring to the key storage
    delete     Delete a key from the key storage
 '''.format(name=command.appname)
+    # 'import' is a reserved word
+    aliases = {'import': 'import_keys'}
 
     def list(self, raw_args):
         parser = argparse.ArgumentParser(
@@ -107,6 +110,34 @@ SUBCOMMANDS:
 
         return self._send(self._print_key)
 
+    def import_keys(self, raw_args):
+        parser = argparse.ArgumentParser(
+            description='Bitmask import keyring',
+            prog='%s %s %s' % tuple(sys.argv[:3]))
+        parser.add_argument('-u', '--userid', default='',
+                            help='Select the userid of the keyring')
+        parser.add_argument('--validation', choices=list(ValidationLevels),
+                            default='Fingerprint',
+                            help='Validation level for the keys')
+        parser.add_argument('-a', '--address', default='',
+                            help='Bind all the keys to this email address '
+                                 '(by default the first uid of each key)')
+        parser.add_argument('file', nargs=1,
+                            help='keyring file or file with armored keys')
+        subargs = parser.parse_args(raw_args)
+
+        userid = subargs.userid
+        if not userid:
+            userid = self.cfg.get('bonafide', 'active')
+
+        with open(subargs.file[0], 'r') as keyfile:
+            rawkeys = keyfile.read()
+        self.data += ['import', userid, subargs.validation, rawkeys]
+        if subargs.address:
+            self.data += [subargs.address]
+
+        return self._send(self._print_key_list)
+
     def delete(self, raw_args):
         parser = argparse.ArgumentParser(
             description='Bitmask delete key',
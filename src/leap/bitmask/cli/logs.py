@@ -19,16 +19,18 @@ Bitmask Command Line interface: logs
 """
 import argparse
 import commands
+import json
 import os.path
 import sys
-import time
 
 from colorama import Fore
 
 from twisted.internet import defer
 from twisted.python.procutils import which
+from txzmq import ZmqRequestTimeoutError
 
 from leap.bitmask.cli import command
+from leap.bitmask.core.logs import LogFileTailer, POLL_TIMEOUT
 from leap.common.config import get_path_prefix
 
 
@@ -55,22 +57,70 @@ SUBCOMMANDS:
         return defer.succeed(None)
 
     def watch(self, raw_args):
-        def tail(_file):
-            _file.seek(0, 2)      # Go to the end of the file
-            while True:
-                line = _file.readline()
-                if not line:
-                    time.sleep(0.1)
-                    continue
-                yield line
-
-        _file = open(_log_path, 'r')
+        parser = argparse.ArgumentParser(
+            description='Bitmask watch logs',
+            prog='%s %s %s' % tuple(sys.argv[:3]))
+        parser.add_argument('-n', '--lines', type=int, default=20,
+                            help='number of past lines to show first')
+        parser.add_argument('-l', '--level', default='info',
+                            choices=('debug', 'info', 'warn', 'error',
+                                     'critical'),
+                            help='lowest level of the records to show')
+        parser.add_argument('-c', '--component', default='',
+                            help='only show the records of a component '
+                                 '(e.g. vpn)')
+        parser.add_argument('--file', action='store_true',
+                            help='follow the log file instead of the daemon')
+        subargs = parser.parse_args(raw_args)
+
+        if subargs.file:
+            return self._watch_file(subargs.lines)
+
+        d = self._watch_daemon(subargs)
+        d.addCallback(lambda _: self._watch_file(0))
+        return d
+
+    @defer.inlineCallbacks
+    def _watch_daemon(self, subargs):
+        """
+        Print the records that the daemon publishes, until it stops
+        answering.
+        """
+        print (Fore.GREEN + '[bitmask] ' +
+               Fore.RESET + 'Watching bitmaskd logs')
+        cursor = 0
+        limit = subargs.lines
+        while True:
+            data = ['logs', 'poll', str(cursor), subargs.level,
+                    subargs.component, str(limit)]
+            try:
+                response = yield self._conn.sendMsg(
+                    *data, timeout=POLL_TIMEOUT * 2)
+            except ZmqRequestTimeoutError:
+                error('bitmaskd is not answering')
+                return
+            obj = json.loads(response[0])
+            if obj['error']:
+                error(obj['error'])
+                return
+            cursor = obj['result']['cursor']
+            for record in obj['result']['records']:
+                print record['line'],
+            sys.stdout.flush()
+            limit = 0
+
+    def _watch_file(self, lines):
         print (Fore.GREEN + '[bitmask] ' +
                Fore.RESET + 'Watching log file %s' % _log_path)
-        for line in _file.readlines():
-            print line,
-        for line in tail(_file):
-            print line,
+
+        def print_line(line):
+            print line
+            sys.stdout.flush()
+
+        tailer = LogFileTailer(_log_path, print_line)
+        tailer.start(lines)
+        # follow it until the cli is interrupted
+        return defer.Deferred()
 
 
 _log_path = os.path.abspath(
@@ -36,6 +36,7 @@ SUBCOMMANDS:
    start      Start VPN
    stop       Stop VPN
    status     Display status about the VPN
+   stats      Display the traffic rates of the VPN
    check      Check whether VPN service is properly configured
    get_cert   Get VPN Certificate from provider
    install    Install helpers (needs root)
@@ -44,7 +45,7 @@ SUBCOMMANDS:
 '''.format(name=command.appname)
 
     commands = ['stop', 'install', 'uninstall',
-                'enable', 'disable']
+                'enable', 'disable', 'stats']
 
     def start(self, raw_args):
         parser = argparse.ArgumentParser(
@@ -14,7 +14,9 @@ def dummy_imports():
 APPNAME = "bitmask.core"
 if platform.system() == 'Windows':
     ENDPOINT = "tcp://127.0.0.1:5001"
+    EVENTS_ENDPOINT = "tcp://127.0.0.1:5002"
 else:
     ENDPOINT = "ipc:///tmp/%s.sock" % APPNAME
+    EVENTS_ENDPOINT = "ipc:///tmp/%s.events.sock" % APPNAME
 
 dummy_imports()
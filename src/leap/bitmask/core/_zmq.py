@@ -15,57 +15,173 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-ZMQ REQ-REP Dispatcher.
+ZMQ Dispatcher.
+
+The commands are received on a ROUTER socket, so the requests of all the
+clients are dispatched as soon as they arrive, and each one is answered when
+its command finishes: a slow command doesn't hold the others. The clients can
+be REQ sockets, or DEALER sockets (like txzmq's ZmqREQConnection) that send
+many requests at once, each one with its id before the empty delimiter frame:
+
+    [request id, '', command part, command part...]
+
+and get the response json with the same envelope.
+
+The events are published on a PUB socket, at EVENTS_ENDPOINT, with the event
+name as the tag and the json of its content as the message. The daemon only
+listens to the events that some client registered for, so a client registers
+them for the ``zmq`` subscriber (``events register <event> zmq``) before
+subscribing to their tags.
 """
+import json
 
 from twisted.application import service
 from twisted.internet import reactor
 from twisted.logger import Logger
+from twisted.python.failure import Failure
 
 from txzmq import ZmqEndpoint, ZmqEndpointType
-from txzmq import ZmqFactory, ZmqREPConnection
+from txzmq import ZmqFactory, ZmqPubConnection, ZmqRouterConnection
 
-from leap.bitmask.core import ENDPOINT
+from leap.bitmask.core import ENDPOINT, EVENTS_ENDPOINT
 from leap.bitmask.core.dispatcher import CommandDispatcher
+from leap.bitmask.core.dispatcher import _format_error
 
 
 log = Logger()
 
+# seconds to wait for a command before answering with an error
+COMMAND_TIMEOUT = 60
+
+# timeouts for some commands, by their first parts. None waits forever.
+TIMEOUTS = {
+    ('events', 'poll'): None,
+    ('vpn', 'start'): 5 * 60,
+    ('keys', 'list'): 5 * 60,
+    ('keys', 'import'): 5 * 60,
+    ('bonafide', 'user'): 5 * 60,
+}
+
+# the subscriber of the event stream that publishes on the PUB socket
+PUBLISHER = 'zmq'
+
+
+class CommandTimeoutError(Exception):
+    expected = True
+
 
 class ZMQServerService(service.Service):
 
-    def __init__(self, core):
+    def __init__(self, core, clock=reactor):
         self._core = core
+        self._clock = clock
+        self._conn = None
+        self._pub = None
 
     def startService(self):
         zf = ZmqFactory()
         e = ZmqEndpoint(ZmqEndpointType.bind, ENDPOINT)
+        self._conn = _DispatcherRouterConnection(
+            zf, e, self._core, self._clock)
+
+        pub = ZmqEndpoint(ZmqEndpointType.bind, EVENTS_ENDPOINT)
+        self._pub = ZmqPubConnection(zf, pub)
+        self._core.event_stream.push(PUBLISHER, self._publish)
 
-        self._conn = _DispatcherREPConnection(zf, e, self._core)
         reactor.callWhenRunning(self._conn.do_greet)
         service.Service.startService(self)
 
     def stopService(self):
+        self._core.event_stream.close(PUBLISHER)
+        if self._conn is not None:
+            self._conn.abort_requests()
+            self._conn.shutdown()
+            self._conn = None
+        if self._pub is not None:
+            self._pub.shutdown()
+            self._pub = None
         service.Service.stopService(self)
 
+    def stats(self):
+        """
+        :return: the counters of the requests of the zmq clients.
+        :rtype: dict
+        """
+        if self._conn is None:
+            return {}
+        return self._conn.stats()
 
-class _DispatcherREPConnection(ZmqREPConnection):
+    def _publish(self, event, content):
+        self._pub.publish(json.dumps(content), tag=event)
 
-    def __init__(self, zf, e, core):
-        ZmqREPConnection.__init__(self, zf, e)
-        self.dispatcher = CommandDispatcher(core)
 
-    def gotMessage(self, msgId, *parts):
+class _DispatcherRouterConnection(ZmqRouterConnection):
 
-        r = self.dispatcher.dispatch(parts)
-        r.addCallback(self.defer_reply, msgId)
-
-    def defer_reply(self, response, msgId):
-        reactor.callLater(0, self.reply, msgId, str(response))
-
-    def log_err(self, failure, msgId):
-        log.failure('Error on dispatcher')
-        self.defer_reply("ERROR: %r" % failure, msgId)
+    def __init__(self, zf, e, core, clock=reactor):
+        ZmqRouterConnection.__init__(self, zf, e)
+        self.dispatcher = CommandDispatcher(core)
+        self._clock = clock
+        # (sender, envelope) -> timeout call, or None
+        self._pending = {}
+        self._served = 0
+        self._timeouts = 0
+
+    def gotMessage(self, sender, *frames):
+        try:
+            i = frames.index('')
+        except ValueError:
+            log.warn('Dropping a zmq message without delimiter')
+            return
+        request = (sender, frames[:i])
+        parts = frames[i + 1:]
+        if request in self._pending:
+            log.warn('Dropping a repeated zmq request id')
+            return
+
+        timeout = TIMEOUTS.get(tuple(parts[:2]), COMMAND_TIMEOUT)
+        call = None
+        if timeout is not None:
+            call = self._clock.callLater(
+                timeout, self._timed_out, request, parts, timeout)
+        self._pending[request] = call
+
+        d = self.dispatcher.dispatch(parts)
+        d.addErrback(_format_error)
+        d.addCallback(self._reply, request)
+
+    def _reply(self, response, request):
+        if request not in self._pending:
+            # it timed out, the client already got an error
+            return
+        call = self._pending.pop(request)
+        if call is not None and call.active():
+            call.cancel()
+        self._served += 1
+        self._send(request, str(response))
+
+    def _timed_out(self, request, parts, timeout):
+        del self._pending[request]
+        self._timeouts += 1
+        log.warn('Command %r did not finish in %d seconds'
+                 % (' '.join(parts[:2]), timeout))
+        error = CommandTimeoutError(
+            'the command did not finish in %d seconds' % timeout)
+        self._send(request, _format_error(Failure(error)))
+
+    def _send(self, request, response):
+        sender, envelope = request
+        self.sendMultipart(sender, list(envelope) + ['', response])
+
+    def abort_requests(self):
+        for call in self._pending.values():
+            if call is not None and call.active():
+                call.cancel()
+        self._pending.clear()
+
+    def stats(self):
+        return {'in_flight': len(self._pending),
+                'served': self._served,
+                'timeouts': self._timeouts}
 
     def do_greet(self):
         log.info('Starting ZMQ dispatcher')
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# bootstrap.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Bootstrap of the user sessions.
+
+Each account goes through some stages (soledad, keymanager...) when it is
+started. The stages of different accounts run in parallel, but only a few at
+a time, since each of them runs KDFs, opens databases and spawns gpg.
+"""
+import time
+
+from twisted.internet import defer
+from twisted.logger import Logger
+from twisted.python.failure import Failure
+
+
+MAX_CONCURRENT_STAGES = 4
+
+
+class SessionBootstrap(object):
+
+    log = Logger()
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_STAGES):
+        self._semaphore = defer.DeferredSemaphore(max_concurrent)
+        # userid -> stage -> timings
+        self._stages = {}
+
+    def run(self, userid, stage, f, *args, **kw):
+        """
+        Run a bootstrap stage of the user, when there is room for it.
+
+        :param userid: the user being bootstrapped
+        :type userid: str
+        :param stage: the name of the stage
+        :type stage: str
+        :param f: the function that runs the stage. It can return a Deferred.
+        :type f: callable
+        :return: a Deferred which fires with the result of f.
+        :rtype: Deferred
+        """
+        timing = {'status': 'waiting', 'queued': time.time(),
+                  'waited': None, 'duration': None, 'error': None}
+        self._stages.setdefault(userid, {})[stage] = timing
+
+        def start():
+            started = time.time()
+            timing['status'] = 'running'
+            timing['waited'] = started - timing['queued']
+
+            def finished(result):
+                timing['duration'] = time.time() - started
+                if isinstance(result, Failure):
+                    timing['status'] = 'failure'
+                    timing['error'] = result.getErrorMessage()
+                    self.log.error(
+                        'Error on %s bootstrap for %s: %s'
+                        % (stage, userid, timing['error']))
+                else:
+                    timing['status'] = 'done'
+                return result
+
+            d = defer.maybeDeferred(f, *args, **kw)
+            d.addBoth(finished)
+            return d
+
+        return self._semaphore.run(start)
+
+    def status(self):
+        """
+        :return: the status and timings, in seconds, of the stages of each
+                 user.
+        :rtype: dict
+        """
+        status = {}
+        for userid, stages in self._stages.items():
+            status[userid] = dict(
+                (stage, {'status': timing['status'],
+                         'waited': timing['waited'],
+                         'duration': timing['duration'],
+                         'error': timing['error']})
+                for stage, timing in stages.items())
+        return status
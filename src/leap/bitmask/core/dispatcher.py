@@ -19,20 +19,13 @@ Command dispatcher.
 """
 import json
 
-try:
-    from Queue import Queue
-except ImportError:
-    from queue import Queue
-
 from twisted.internet import defer
 from twisted.python import failure
 from twisted.logger import Logger
 
-from leap.common.events import register_async as register
-from leap.common.events import unregister_async as unregister
-from leap.common.events import catalog
-
 from .api import APICommand, register_method
+from .event_stream import DEFAULT_SUBSCRIBER
+from .metrics import OTHER, command_name, command_stats
 
 
 log = Logger()
@@ -197,6 +190,12 @@ class VPNCmd(SubCommand):
         d = vpn.do_status()
         return d
 
+    @register_method('dict')
+    def do_STATS(self, vpn, *parts):
+        history = len(parts) > 2 and parts[2] == 'history'
+        d = vpn.do_stats(history)
+        return d
+
     @register_method('dict')
     def do_START(self, vpn, *parts):
         try:
@@ -333,6 +332,20 @@ class KeysCmd(SubCommand):
 
         return service.do_insert(uid, address, rawkey, validation)
 
+    @register_method("[dict]")
+    def do_IMPORT(self, service, *parts, **kw):
+        if len(parts) < 5:
+            raise ValueError("A keyring is needed")
+        uid = parts[2]
+        validation = parts[3]
+        rawkeys = parts[4]
+
+        address = None
+        if len(parts) > 5:
+            address = parts[5]
+
+        return service.do_import(uid, rawkeys, validation, address)
+
     @register_method('str')
     def do_DELETE(self, service, *parts, **kw):
         if len(parts) < 4:
@@ -351,38 +364,61 @@ class EventsCmd(SubCommand):
 
     label = 'events'
 
-    def __init__(self):
-        self.queue = Queue()
-        self.waiting = []
+    @register_method("")
+    def do_REGISTER(self, stream, *parts, **kw):
+        event = parts[2]
+        subscriber = _get_subscriber(parts, 3)
+        stream.register(event, subscriber)
 
     @register_method("")
-    def do_REGISTER(self, _, *parts, **kw):
-        event = getattr(catalog, parts[2])
-        register(event, self._callback)
+    def do_UNREGISTER(self, stream, *parts, **kw):
+        event = parts[2]
+        subscriber = _get_subscriber(parts, 3)
+        stream.unregister(event, subscriber)
+
+    @register_method("[(str, [])]")
+    def do_POLL(self, stream, *parts, **kw):
+        subscriber = _get_subscriber(parts, 2)
+        if subscriber != DEFAULT_SUBSCRIBER:
+            return stream.poll(subscriber)
+
+        # clients that don't identify themselves get one event per poll
+        d = defer.maybeDeferred(stream.poll, subscriber, limit=1)
+        d.addCallback(lambda events: events[0] if events else None)
+        return d
 
     @register_method("")
-    def do_UNREGISTER(self, _, *parts, **kw):
-        event = getattr(catalog, parts[2])
-        unregister(event)
+    def do_CLOSE(self, stream, *parts, **kw):
+        subscriber = _get_subscriber(parts, 2)
+        stream.close(subscriber)
 
-    @register_method("(str, [])")
-    def do_POLL(self, _, *parts, **kw):
-        if not self.queue.empty():
-            return self.queue.get()
 
-        d = defer.Deferred()
-        self.waiting.append(d)
-        return d
+class LogsCmd(SubCommand):
+
+    label = 'logs'
+
+    @register_method("{'cursor': int, 'records': [{'seq': int, "
+                     "'level': str, 'component': str, 'line': str}]}")
+    def do_POLL(self, stream, *parts, **kw):
+        cursor = int(_get_arg(parts, 2, 0))
+        level = _get_arg(parts, 3, 'info')
+        component = _get_arg(parts, 4, '')
+        limit = int(_get_arg(parts, 5, 0))
+        return stream.poll(cursor, level, component, limit)
 
-    def _callback(self, event, *content):
-        payload = (str(event), content)
-        if not self.waiting:
-            self.queue.put(payload)
-            return
 
-        while self.waiting:
-            d = self.waiting.pop()
-            d.callback(payload)
+def _get_arg(parts, index, default):
+    try:
+        return parts[index] or default
+    except IndexError:
+        return default
+
+
+def _get_subscriber(parts, index):
+    try:
+        return parts[index]
+    except IndexError:
+        return DEFAULT_SUBSCRIBER
 
 
 class CoreCmd(SubCommand):
@@ -393,6 +429,11 @@ class CoreCmd(SubCommand):
     def do_STATS(self, core, *parts):
         return core.do_stats()
 
+    @register_method("{'containers': {str: {'bytes': int, 'owners': int}}, "
+                     "'allocated': {str: int}, 'rss': int}")
+    def do_MEMORY(self, core, *parts):
+        return core.do_memory()
+
     @register_method("{version_core': '0.0.0'}")
     def do_VERSION(self, core, *parts):
         return core.do_version()
@@ -410,20 +451,21 @@ class CommandDispatcher(object):
 
     __metaclass__ = APICommand
 
-    def __init__(self, core):
+    def __init__(self, core, stats=command_stats):
 
         self.core = core
+        self.stats = stats
         self.subcommand_core = CoreCmd()
         self.subcommand_bonafide = BonafideCmd()
         self.subcommand_vpn = VPNCmd()
         self.subcommand_mail = MailCmd()
         self.subcommand_keys = KeysCmd()
         self.subcommand_events = EventsCmd()
+        self.subcommand_logs = LogsCmd()
         self.subcommand_webui = WebUICmd()
 
     def do_CORE(self, *parts):
         d = self.subcommand_core.dispatch(self.core, *parts)
-        d.addCallbacks(_format_result, _format_error)
         return d
 
     def do_BONAFIDE(self, *parts):
@@ -431,14 +473,13 @@ class CommandDispatcher(object):
         bonafide.local_tokens = self.core.tokens
 
         d = self.subcommand_bonafide.dispatch(bonafide, *parts)
-        d.addCallbacks(_format_result, _format_error)
         return d
 
     def do_VPN(self, *parts):
         vpn = self._get_service(self.subcommand_vpn.label)
         subcmd = parts[1]
         if subcmd != 'enable' and not vpn:
-            return _format_result({'vpn': 'disabled'})
+            return {'vpn': 'disabled'}
 
         dispatch = self.subcommand_vpn.dispatch
         if subcmd in ('enable', 'disable'):
@@ -446,7 +487,6 @@ class CommandDispatcher(object):
         else:
             d = dispatch(vpn, *parts)
 
-        d.addCallbacks(_format_result, _format_error)
         return d
 
     def do_MAIL(self, *parts):
@@ -461,14 +501,13 @@ class CommandDispatcher(object):
         kw = {'bonafide': bonafide}
 
         if not mail:
-            return _format_result({'mail': 'disabled'})
+            return {'mail': 'disabled'}
 
         if subcmd == 'disable':
             d = dispatch(self.core, *parts)
         elif subcmd != 'enable':
             d = dispatch(mail, *parts, **kw)
 
-        d.addCallbacks(_format_result, _format_error)
         return d
 
     def do_WEBUI(self, *parts):
@@ -483,13 +522,12 @@ class CommandDispatcher(object):
         kw = {}
 
         if not webui:
-            return _format_result({'webui': 'disabled'})
+            return {'webui': 'disabled'}
         if subcmd == 'disable':
             d = dispatch(self.core, *parts)
         elif subcmd != 'enable':
             d = dispatch(webui, *parts, **kw)
 
-        d.addCallbacks(_format_result, _format_error)
         return d
 
     def do_KEYS(self, *parts):
@@ -501,26 +539,49 @@ class CommandDispatcher(object):
         kw = {'bonafide': bonafide}
 
         if not keymanager:
-            return _format_result('keymanager: disabled')
+            return 'keymanager: disabled'
 
         d = dispatch(keymanager, *parts, **kw)
-        d.addCallbacks(_format_result, _format_error)
         return d
 
     def do_EVENTS(self, *parts):
         dispatch = self.subcommand_events.dispatch
-        d = dispatch(None, *parts)
-        d.addCallbacks(_format_result, _format_error)
+        d = dispatch(self.core.event_stream, *parts)
+        return d
+
+    def do_LOGS(self, *parts):
+        dispatch = self.subcommand_logs.dispatch
+        d = dispatch(self.core.log_stream, *parts)
         return d
 
     def dispatch(self, msg):
+        """
+        Run a command and time it.
+
+        :return: a Deferred which fires with the json of the result, or of
+                 the error.
+        :rtype: Deferred
+        """
         cmd = msg[0]
         _method = getattr(self, 'do_' + cmd.upper(), None)
 
         if not _method:
-            return defer.fail(failure.Failure(RuntimeError('No such command')))
+            started = self.stats.started(OTHER)
+            d = defer.fail(failure.Failure(RuntimeError('No such command')))
+        else:
+            started = self.stats.started(command_name(msg))
+            d = defer.maybeDeferred(_method, *msg)
+        d.addCallbacks(self._succeeded, self._failed,
+                       callbackArgs=(started,), errbackArgs=(started,))
+        return d
+
+    def _succeeded(self, result, started):
+        self.stats.finished(started)
+        return _format_result(result)
 
-        return defer.maybeDeferred(_method, *msg)
+    def _failed(self, failure, started):
+        self.stats.finished(started, failed=True)
+        return _format_error(failure)
 
     def _get_service(self, name):
         try:
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# event_stream.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Fan-out of leap.common.events to the clients of the core.
+
+Every event is appended, with a sequence number, to a bounded ring buffer.
+Each client (web UI, GUI, cli...) is a subscriber with its own cursor in that
+buffer, so all of them get every event they registered for, and a poll returns
+all the events that arrived since the previous one.
+
+The clients that don't identify themselves share the default subscriber, and
+its cursor. Each of their polls waits on its own, so they don't cancel each
+other, but an event is only returned to the polls that are waiting for it or
+to the first one that comes after it.
+"""
+import time
+
+from collections import deque
+from itertools import islice
+
+from twisted.internet import defer
+from twisted.logger import Logger
+
+from leap.common.events import register_async as register
+from leap.common.events import unregister_async as unregister
+from leap.common.events import catalog
+
+from leap.bitmask import memory
+
+
+BUFFER_SIZE = 1000
+SUBSCRIBER_TIMEOUT = 5 * 60  # seconds
+
+# events published by the services of the core, not in the leap.common
+# catalog
+LOCAL_EVENTS = frozenset(['VPN_TRAFFIC'])
+
+# the subscriber used by the clients that don't identify themselves
+DEFAULT_SUBSCRIBER = ''
+
+
+class Subscriber(object):
+
+    def __init__(self, subscriber_id, cursor):
+        self.id = subscriber_id
+        self.cursor = cursor
+        self.events = set()
+        # (d, limit, since) of the polls waiting for an event
+        self.waiting = []
+        self.listener = None
+        self.last_seen = time.time()
+
+
+class EventStream(object):
+
+    log = Logger()
+
+    def __init__(self, size=BUFFER_SIZE):
+        # (seq, event, content)
+        self._buffer = deque(maxlen=size)
+        self._seq = 0
+        self._subscribers = {}
+        # event name -> number of subscribers registered to it
+        self._registered = {}
+        self._get_subscriber(DEFAULT_SUBSCRIBER)
+        memory.register('core.events', self, '_buffer', '_subscribers')
+
+    def register(self, event, subscriber_id=DEFAULT_SUBSCRIBER):
+        """
+        Deliver C{event} to the subscriber.
+
+        :param event: the name of the event in leap.common.events.catalog,
+                      or in LOCAL_EVENTS
+        :type event: str
+        :param subscriber_id: the id chosen by the client
+        :type subscriber_id: str
+        """
+        if event not in LOCAL_EVENTS:
+            getattr(catalog, event)
+        subscriber = self._get_subscriber(subscriber_id)
+        if event in subscriber.events:
+            return
+        subscriber.events.add(event)
+        self._ref_event(event)
+
+    def unregister(self, event, subscriber_id=DEFAULT_SUBSCRIBER):
+        subscriber = self._subscribers.get(subscriber_id)
+        if subscriber is None or event not in subscriber.events:
+            return
+        subscriber.events.discard(event)
+        self._unref_event(event)
+
+    def poll(self, subscriber_id=DEFAULT_SUBSCRIBER, limit=None):
+        """
+        Get the events that the subscriber has not seen yet.
+
+        If there are none, wait for the next one. A new poll from the same
+        subscriber fires the previous one, if it is still waiting, with an
+        empty list, except for the default subscriber that is shared by all
+        the anonymous clients.
+
+        :param limit: the maximum number of events to return, all of them if
+                      None.
+        :type limit: int
+        :return: a list of (event, content), or a Deferred for it.
+        :rtype: list or Deferred
+        """
+        subscriber = self._get_subscriber(subscriber_id)
+        subscriber.last_seen = time.time()
+        if subscriber_id != DEFAULT_SUBSCRIBER:
+            self._release(subscriber)
+
+        pending = self._pending(subscriber, limit)
+        if pending:
+            return pending
+
+        d = defer.Deferred()
+        subscriber.waiting.append((d, limit, subscriber.last_seen))
+        return d
+
+    def push(self, subscriber_id, callback):
+        """
+        Push the events of the subscriber, as they arrive, to
+        C{callback(event, content)} instead of waiting for it to poll them.
+        """
+        subscriber = self._get_subscriber(subscriber_id)
+        subscriber.cursor = self._seq
+        subscriber.listener = callback
+
+    def publish(self, event, *content):
+        """
+        Deliver one of the LOCAL_EVENTS to its subscribers.
+        """
+        if event in self._registered:
+            self._callback(event, *content)
+
+    def close(self, subscriber_id):
+        """
+        Forget the subscriber and unregister from its events.
+        """
+        subscriber = self._subscribers.pop(subscriber_id, None)
+        if subscriber is None:
+            return
+        self._release(subscriber)
+        for event in subscriber.events:
+            self._unref_event(event)
+
+    def _get_subscriber(self, subscriber_id):
+        subscriber = self._subscribers.get(subscriber_id)
+        if subscriber is None:
+            subscriber = Subscriber(subscriber_id, self._seq)
+            self._subscribers[subscriber_id] = subscriber
+        return subscriber
+
+    def _release(self, subscriber, since=None):
+        """
+        Fire the waiting polls of the subscriber, the ones that started
+        before C{since} or all of them, with an empty list.
+
+        :return: whether any poll was fired.
+        :rtype: bool
+        """
+        released = [w for w in subscriber.waiting
+                    if since is None or w[2] < since]
+        if not released:
+            return False
+        subscriber.waiting = [w for w in subscriber.waiting
+                              if w not in released]
+        for d, _, _ in released:
+            d.callback([])
+        return True
+
+    def _pending(self, subscriber, limit=None):
+        if not self._buffer:
+            return []
+        oldest = self._buffer[0][0]
+        if subscriber.cursor + 1 < oldest:
+            self.log.warn(
+                'Subscriber %r lost %d events' % (
+                    subscriber.id, oldest - subscriber.cursor - 1))
+        # the buffer is ordered by seq, so skip what was already seen
+        start = max(subscriber.cursor + 1 - oldest, 0)
+        events = []
+        for seq, event, content in islice(self._buffer, start, None):
+            subscriber.cursor = seq
+            if event in subscriber.events:
+                events.append((event, content))
+                if len(events) == limit:
+                    break
+        return events
+
+    def _ref_event(self, event):
+        count = self._registered.get(event, 0)
+        self._registered[event] = count + 1
+        if not count and event not in LOCAL_EVENTS:
+            register(getattr(catalog, event), self._callback)
+
+    def _unref_event(self, event):
+        count = self._registered.get(event, 0) - 1
+        if count > 0:
+            self._registered[event] = count
+            return
+        self._registered.pop(event, None)
+        if event not in LOCAL_EVENTS:
+            unregister(getattr(catalog, event))
+
+    def _callback(self, event, *content):
+        name = str(event)
+        self._seq += 1
+        self._buffer.append((self._seq, name, content))
+
+        self._expire_subscribers()
+        for subscriber in self._subscribers.values():
+            if name not in subscriber.events:
+                continue
+            if subscriber.listener is not None:
+                subscriber.cursor = self._seq
+                subscriber.listener(name, content)
+            elif subscriber.waiting:
+                self._deliver(subscriber)
+
+    def _deliver(self, subscriber):
+        """
+        Fire the waiting polls of the subscriber with its pending events.
+        """
+        waiting = subscriber.waiting
+        subscriber.waiting = []
+        cursor = last = subscriber.cursor
+        for d, limit, _ in waiting:
+            # every poll gets the events from the same cursor, and the
+            # subscriber keeps the cursor of the one that got the most
+            subscriber.cursor = cursor
+            events = self._pending(subscriber, limit)
+            last = max(last, subscriber.cursor)
+            d.callback(events)
+        subscriber.cursor = last
+
+    def _expire_subscribers(self):
+        now = time.time()
+        expired = now - SUBSCRIBER_TIMEOUT
+        for subscriber in self._subscribers.values():
+            if subscriber.listener:
+                continue
+            # the client of a poll waiting this long may be gone, so it is
+            # answered and the subscriber is expired if it doesn't poll again
+            if self._release(subscriber, expired):
+                subscriber.last_seen = now
+                continue
+            if subscriber.waiting or subscriber.id == DEFAULT_SUBSCRIBER:
+                continue
+            if subscriber.last_seen < expired:
+                self.close(subscriber.id)
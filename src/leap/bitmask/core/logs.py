@@ -1,10 +1,36 @@
+import os
+
+from collections import deque
 from os import makedirs
-from os.path import abspath, join, isfile, isdir
+from os.path import abspath, basename, dirname, join, isdir
 
+from twisted.internet import defer, reactor, task
+from twisted.logger import LogLevel
+from twisted.logger import formatEventAsClassicLogText as formatEvent
 from twisted.python import logfile
+from twisted.python import threadable
+from twisted.python.filepath import FilePath
 
+from leap.bitmask import memory
 from leap.common.config import get_path_prefix
 
+try:
+    from twisted.internet import inotify
+except ImportError:
+    inotify = None
+
+
+# the log file is rotated when it grows over this size, instead of on every
+# start, so a restart doesn't move the file under the clients following it
+ROTATE_LENGTH = 5 * 1024 * 1024
+
+BACKLOG_SIZE = 1000
+POLL_TIMEOUT = 30  # seconds
+
+# how often the file is checked when inotify is not available
+TAIL_INTERVAL = 1  # seconds
+TAIL_BLOCK_SIZE = 8 * 1024
+
 
 def getLogPath():
     configdir = abspath(join(get_path_prefix(), 'leap'))
@@ -16,8 +42,265 @@ def getLogPath():
 
 def logFileFactory():
     log_path = getLogPath()
-    rotate = isfile(log_path)
-    _logfile = logfile.LogFile.fromFullPath(log_path, maxRotatedFiles=5)
-    if rotate:
-        _logfile.rotate()
-    return _logfile
+    return logfile.LogFile.fromFullPath(
+        log_path, rotateLength=ROTATE_LENGTH, maxRotatedFiles=5)
+
+
+class LogStream(object):
+
+    """
+    A log observer that keeps the last records of the daemon in a bounded
+    backlog, so the clients can follow them without reading the log file.
+
+    A client polls with the cursor it got in the previous poll, and gets the
+    records that arrived since then, or waits for the next one.
+    """
+
+    def __init__(self, size=BACKLOG_SIZE, clock=reactor):
+        # (seq, level, record)
+        self._backlog = deque(maxlen=size)
+        self._seq = 0
+        self._clock = clock
+        # (d, level, component, call)
+        self._waiting = []
+        memory.register('core.logs', self, '_backlog')
+
+    def __call__(self, event):
+        if threadable.ioThread is not None and not threadable.isInIOThread():
+            # the observers run in the thread that logs, like the threads of
+            # the soledad database pool, and the polls are answered from the
+            # reactor. before it runs there is no thread to hop to.
+            reactor.callFromThread(self, event)
+            return
+
+        line = formatEvent(event)
+        if not line:
+            return
+        level = event.get('log_level', LogLevel.info)
+        self._seq += 1
+        seq = self._seq
+        record = {'seq': seq,
+                  'level': level.name,
+                  'component': event.get('log_namespace', ''),
+                  'line': line}
+        self._backlog.append((seq, level, record))
+
+        # answering a poll can log, and call this again, so the waiting list
+        # is replaced before any of them is answered
+        matched = []
+        waiting = []
+        for item in self._waiting:
+            d, min_level, component, call = item
+            if _matches(level, record, min_level, component):
+                matched.append(item)
+            else:
+                waiting.append(item)
+        self._waiting = waiting
+
+        for d, _, _, call in matched:
+            call.cancel()
+            d.callback({'cursor': seq, 'records': [record]})
+
+    def poll(self, cursor=0, level='info', component='', limit=None,
+             timeout=POLL_TIMEOUT):
+        """
+        Get the records after the cursor. If there are none, wait for the
+        next one, or C{timeout} seconds.
+
+        :param cursor: the cursor returned by the previous poll, 0 to get
+                       the backlog.
+        :type cursor: int
+        :param level: the name of the lowest level of the records
+        :type level: str
+        :param component: only get the records of the loggers in this
+                          component (e.g. 'vpn' or 'leap.bitmask.mail'),
+                          all of them if empty.
+        :type component: str
+        :param limit: the maximum number of records to get, the newest ones.
+        :type limit: int
+        :return: a dict with the cursor for the next poll and the records, or
+                 a Deferred for it.
+        :rtype: dict or Deferred
+        """
+        min_level = LogLevel.levelWithName(level)
+        records = [
+            record for seq, lvl, record in self._backlog
+            if seq > cursor and _matches(lvl, record, min_level, component)]
+        if limit:
+            records = records[-limit:]
+        if records:
+            return {'cursor': self._seq, 'records': records}
+
+        d = defer.Deferred()
+        call = self._clock.callLater(timeout, self._timed_out, d)
+        self._waiting.append((d, min_level, component, call))
+        return d
+
+    def _timed_out(self, d):
+        self._waiting = [w for w in self._waiting if w[0] is not d]
+        d.callback({'cursor': self._seq, 'records': []})
+
+
+def _matches(level, record, min_level, component):
+    if level < min_level:
+        return False
+    if not component:
+        return True
+    # the component is a whole part, or parts, of the logger namespace
+    namespace = '.%s.' % record['component']
+    return ('.%s.' % component) in namespace
+
+
+# the records of this daemon, the log observer is set up in bitmaskd.tac
+log_stream = LogStream()
+
+
+class LogFileTailer(object):
+
+    """
+    Follow the lines written to a log file, for when the daemon is not
+    running.
+
+    The file is read from an offset, so only its last lines are read when
+    starting, and it is reopened if it was rotated. It is watched with
+    inotify when available, or checked every TAIL_INTERVAL seconds.
+    """
+
+    def __init__(self, path, callback, clock=reactor):
+        self._path = path
+        self._callback = callback
+        self._clock = clock
+        self._file = None
+        self._partial = ''
+        self._notifier = None
+        self._loop = None
+        self.offset = 0
+
+    def start(self, lines=10, offset=None):
+        """
+        Start following the file.
+
+        :param lines: how many of the last lines of the file to get first.
+        :type lines: int
+        :param offset: the offset to start reading from, instead of the last
+                       lines.
+        :type offset: int
+        """
+        self._open()
+        if self._file is not None:
+            if offset is None:
+                offset = _last_lines_offset(self._file, lines)
+            self.offset = offset
+        self._watch()
+        self.read()
+
+    def stop(self):
+        if self._notifier is not None:
+            self._notifier.loseConnection()
+            self._notifier = None
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self._loop = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self):
+        """
+        Pass to the callback the lines written since the last read.
+        """
+        if self._rotated():
+            # finish the old file before following the new one
+            self._read_lines()
+            self._open()
+            self.offset = 0
+            self._partial = ''
+        self._read_lines()
+
+    def _read_lines(self):
+        if self._file is None:
+            return
+        self._file.seek(self.offset)
+        data = self._file.read()
+        if not data:
+            return
+        self.offset += len(data)
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._callback(line)
+
+    def _open(self):
+        if self._file is not None:
+            self._file.close()
+        try:
+            self._file = open(self._path, 'rb')
+        except IOError:
+            self._file = None
+
+    def _rotated(self):
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return False
+        if self._file is None:
+            return True
+        current = os.fstat(self._file.fileno())
+        return (stat.st_ino != current.st_ino or
+                stat.st_size < self.offset)
+
+    def _watch(self):
+        notifier = None
+        if inotify is not None:
+            try:
+                notifier = inotify.INotify()
+            except inotify.INotifyError:
+                pass
+        if notifier is None:
+            self._loop = task.LoopingCall(self.read)
+            self._loop.clock = self._clock
+            self._loop.start(TAIL_INTERVAL, now=False)
+            return
+
+        name = basename(self._path)
+
+        def notified(ignored, filepath, mask):
+            if filepath.basename() == name:
+                self.read()
+
+        notifier.startReading()
+        # watch the directory, the file is replaced when rotated
+        mask = (inotify.IN_MODIFY | inotify.IN_CREATE |
+                inotify.IN_MOVED_TO | inotify.IN_DELETE)
+        notifier.watch(FilePath(dirname(self._path)), mask=mask,
+                       callbacks=[notified])
+        self._notifier = notifier
+
+
+def _last_lines_offset(f, lines):
+    """
+    Get the offset of the last lines of a file, reading it backwards from the
+    end in blocks.
+    """
+    f.seek(0, os.SEEK_END)
+    end = offset = f.tell()
+    if not lines:
+        return end
+    found = 0
+    while offset > 0:
+        size = min(TAIL_BLOCK_SIZE, offset)
+        offset -= size
+        f.seek(offset)
+        block = f.read(size)
+        # the newline at the end of the file doesn't start a line
+        if offset + size == end and block.endswith('\n'):
+            block = block[:-1]
+        index = len(block)
+        while True:
+            index = block.rfind('\n', 0, index)
+            if index == -1:
+                break
+            found += 1
+            if found == lines:
+                return offset + index + 1
+    return 0
@@ -31,10 +31,12 @@ from twisted.application import service
 from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.internet import task
+from twisted.internet import threads
 from twisted.logger import Logger
 
 from leap.common.events import catalog, emit_async
 from leap.common.files import check_and_fix_urw_only
+from leap.bitmask import memory
 from leap.bitmask import pix
 from leap.bitmask.hooks import HookableService
 from leap.bitmask.bonafide import config
@@ -47,9 +49,11 @@ from leap.bitmask.mail.imap import service as imap_service
 from leap.bitmask.mail.smtp import service as smtp_service
 from leap.bitmask.mail.incoming.service import IncomingMail
 from leap.bitmask.mail.incoming.service import INCOMING_CHECK_PERIOD
+from leap.bitmask.mail.incoming.scheduler import sync as sync_soledad
 from leap.bitmask.util import get_gpg_bin_path, merge_status
 from leap.soledad.client.api import Soledad
 
+from leap.bitmask.core.bootstrap import SessionBootstrap
 from leap.bitmask.core.uuid_map import UserMap
 from leap.bitmask.core.configurable import DEFAULT_BASEDIR
 
@@ -67,34 +71,75 @@ class Container(object):
     def add_instance(self, key, data):
         self._instances[key] = data
 
+    def __len__(self):
+        return len(self._instances)
+
 
 class ImproperlyConfigured(Exception):
     pass
 
 
+class UUIDNotFound(Exception):
+    pass
+
+
 class SoledadContainer(Container):
 
     def __init__(self, service=None, basedir=DEFAULT_BASEDIR):
         self._basedir = os.path.expanduser(basedir)
         self._usermap = UserMap()
+        self._starting = {}
+        self._tokens = {}
         super(SoledadContainer, self).__init__(service=service)
+        memory.register('soledad.instances', self, '_instances')
 
     def add_instance(self, userid, passphrase, uuid=None, token=None):
+        if token:
+            # an authentication can arrive while soledad is starting, keep
+            # the newest token for when the instance is created
+            self._tokens[userid] = token
+        if userid in self._starting:
+            return self._starting[userid]
+
+        d = self.service.bootstrap.run(
+            userid, 'soledad', self._add_instance,
+            userid, passphrase, uuid, token)
+
+        def started(result):
+            self._starting.pop(userid, None)
+            self._tokens.pop(userid, None)
+            return result
+
+        # set before the callback, which clears it when the stage already
+        # finished
+        self._starting[userid] = d
+        d.addBoth(started)
+        return d
 
+    @defer.inlineCallbacks
+    def _add_instance(self, userid, passphrase, uuid, token):
+        # the uuid map runs a KDF and the provider config is read from disk,
+        # so keep them out of the reactor
         if not uuid:
-            bootstrapped_uuid = self._usermap.lookup_uuid(userid, passphrase)
-            uuid = bootstrapped_uuid
+            uuid = yield threads.deferToThread(
+                self._usermap.lookup_uuid, userid, passphrase)
             if not uuid:
-                return
+                # fail the stage, so it is reported and can be run again
+                raise UUIDNotFound('No uuid found for %s' % userid)
         else:
-            self._usermap.add(userid, uuid, passphrase)
+            yield threads.deferToThread(
+                self._usermap.add, userid, uuid, passphrase)
 
         user, provider = userid.split('@')
 
         soledad_path = os.path.join(self._basedir, 'soledad')
-        soledad_url = _get_soledad_uri(self._basedir, provider)
+        soledad_url = yield threads.deferToThread(
+            _get_soledad_uri, self._basedir, provider)
         cert_path = _get_ca_cert_path(self._basedir, provider)
 
+        # soledad sets up its database pool with the reactor, so it is created
+        # here and not in a thread
+        token = self._tokens.get(userid, token)
         soledad = self._create_soledad_instance(
             uuid, passphrase, soledad_path, soledad_url,
             cert_path, token)
@@ -124,7 +169,7 @@ class SoledadContainer(Container):
         self.get_instance(userid).token = token
 
     def sync(self, userid):
-        self.get_instance(userid).sync()
+        return sync_soledad(self.get_instance(userid))
 
 
 def _get_provider_from_full_userid(userid):
@@ -151,15 +196,24 @@ class SoledadService(HookableService):
 
     log = Logger()
 
-    def __init__(self, basedir):
+    def __init__(self, basedir, bootstrap=None):
         service.Service.__init__(self)
         self._basedir = basedir
+        self.bootstrap = bootstrap or SessionBootstrap()
 
     def startService(self):
         self.log.info('Starting Soledad Service')
         self._container = SoledadContainer(service=self)
         super(SoledadService, self).startService()
 
+    def open_instances(self):
+        """
+        :return: the number of soledad instances, one for each user.
+        :rtype: int
+        """
+        container = getattr(self, '_container', None)
+        return len(container) if container is not None else 0
+
     # hooks
 
     def hook_on_passphrase_entry(self, **kw):
@@ -223,12 +277,14 @@ class KeymanagerContainer(Container):
         self._basedir = os.path.expanduser(basedir)
         self._status = {}
         super(KeymanagerContainer, self).__init__(service=service)
+        memory.register('keymanager.instances', self, '_instances')
 
     def add_instance(self, userid, token, uuid, soledad):
         self.log.debug('Adding Keymanager instance for: %s' % userid)
         self._set_status(userid, "starting")
         keymanager = self._create_keymanager_instance(
             userid, token, uuid, soledad)
+        keymanager.start_usage_queue()
         super(KeymanagerContainer, self).add_instance(userid, keymanager)
         d = self._get_or_generate_keys(keymanager, userid)
         d.addCallback(self._on_keymanager_ready_cb, userid, soledad)
@@ -238,6 +294,18 @@ class KeymanagerContainer(Container):
     def set_remote_auth_token(self, userid, token):
         self.get_instance(userid).token = token
 
+    def stop_instances(self):
+        """
+        Stop the usage queues of all the keymanager instances, writing their
+        pending flags.
+
+        :return: A Deferred which fires when the flags are written.
+        :rtype: Deferred
+        """
+        deferreds = [keymanager.stop_usage_queue()
+                     for keymanager in self._instances.values()]
+        return defer.gatherResults(deferreds)
+
     def status(self, userid):
         if userid not in self._status:
             return {'status': 'off', 'error': None, 'keys': None}
@@ -253,35 +321,50 @@ class KeymanagerContainer(Container):
         self.service.trigger_hook('on_new_keymanager_instance', **data)
 
     def _get_or_generate_keys(self, keymanager, userid):
-
-        def _get_key(_):
-            self.log.info('Looking up private key for %s' % userid)
-            return keymanager.get_key(userid, private=True, fetch_remote=False)
+        # only the first sync and getting or generating the key run as
+        # bootstrap stages, waiting for a token doesn't hold one of their
+        # slots
+        run = self.service.bootstrap.run
 
         def _found_key(key):
             self.log.info('Found key: %r' % key)
+            return False
 
         def _if_not_found_generate(failure):
             failure.trap(KeyNotFound)
             self.log.info('Key not found, generating key for %s' % (userid,))
             self._set_status(userid, "starting", keys="generating")
             d = keymanager.gen_key()
-            d.addCallbacks(_send_key, _log_key_error("generating"))
+            d.addCallbacks(_key_generated, _log_key_error("generating"))
+            return d
+
+        def _key_generated(key):
+            self.log.info('Key generated for %s' % userid)
+            return True
+
+        def _get_or_generate_key():
+            self.log.info('Looking up private key for %s' % userid)
+            d = keymanager.get_key(userid, private=True, fetch_remote=False)
+            d.addCallbacks(_found_key, _if_not_found_generate)
             return d
 
-        def _send_key(ignored):
+        def _run_key_stage(_):
+            return run(userid, 'keymanager', _get_or_generate_key)
+
+        def _send_key(generated):
             # ----------------------------------------------------------------
             # It might be the case that we have generated a key-pair
             # but this hasn't been successfully uploaded. How do we know that?
             # XXX Should this be a method of bonafide instead?
             # -----------------------------------------------------------------
-            self.log.info('Key generated for %s' % userid)
+            if not generated:
+                return
 
             if not keymanager.token:
                 self.log.debug(
                     'Token not available, scheduling '
                     'a new key sending attempt...')
-                return task.deferLater(reactor, 5, _send_key, None)
+                return task.deferLater(reactor, 5, _send_key, generated)
 
             self.log.info('Sending public key to server')
             d = keymanager.send_key()
@@ -314,13 +397,13 @@ class KeymanagerContainer(Container):
 
             self.log.debug('Syncing soledad for the first time...')
             self._set_status(userid, "starting", keys="sync")
-            return keymanager._soledad.sync()
+            return run(userid, 'first sync', sync_soledad, keymanager._soledad)
 
         self.log.debug('Checking if soledad has ever synced...')
         d = keymanager.ever_synced()
         d.addCallback(_sync_if_never_synced)
-        d.addCallback(_get_key)
-        d.addCallbacks(_found_key, _if_not_found_generate)
+        d.addCallback(_run_key_stage)
+        d.addCallback(_send_key)
         d.addCallback(lambda _: keymanager)
         return d
 
@@ -336,11 +419,15 @@ class KeymanagerContainer(Container):
 
         km_args = (userid, nickserver_uri, soledad)
 
+        usage_journal_path = os.path.join(
+            self._basedir, 'soledad', '%s.keyusage' % uuid)
+
         km_kwargs = {
             "token": token, "uid": uuid,
             "api_uri": api_uri, "api_version": "1",
             "ca_cert_path": cert_path,
-            "gpgbinary": get_gpg_bin_path()
+            "gpgbinary": get_gpg_bin_path(),
+            "usage_journal_path": usage_journal_path
         }
         keymanager = KeyManager(*km_args, **km_kwargs)
         return keymanager
@@ -360,10 +447,11 @@ class KeymanagerService(HookableService):
 
     log = Logger()
 
-    def __init__(self, basedir=DEFAULT_BASEDIR):
+    def __init__(self, basedir=DEFAULT_BASEDIR, bootstrap=None):
         service.Service.__init__(self)
         self._basedir = basedir
         self._container = None
+        self.bootstrap = bootstrap or SessionBootstrap()
 
     def startService(self):
         self.log.debug('Starting Keymanager Service')
@@ -372,6 +460,14 @@ class KeymanagerService(HookableService):
         self.tokens = {}
         super(KeymanagerService, self).startService()
 
+    def stopService(self):
+        self.log.debug('Stopping Keymanager Service')
+        d = None
+        if self._container is not None:
+            d = self._container.stop_instances()
+        super(KeymanagerService, self).stopService()
+        return d
+
     # hooks
 
     def hook_on_new_soledad_instance(self, **kw):
@@ -440,6 +536,18 @@ class KeymanagerService(HookableService):
         d.addCallback(lambda key: dict(key))
         return d
 
+    def do_import(self, userid, rawkeys, validation='Fingerprint',
+                  address=None):
+        km = self._container.get_instance(userid)
+        if km is None:
+            return defer.fail(ValueError("User " + userid + " has no active "
+                                         "keymanager"))
+
+        validation = ValidationLevels.get(validation)
+        d = km.put_raw_keys(rawkeys, address=address, validation=validation)
+        d.addCallback(lambda keys: [dict(key) for key in keys])
+        return d
+
     @defer.inlineCallbacks
     def do_delete(self, userid, address, private=False):
         km = self._container.get_instance(userid)
@@ -767,6 +875,7 @@ class IncomingMailService(service.MultiService):
         incoming = self.getServiceNamed(userid)
         if ['status'] == 'on':
             status['unread'] = yield incoming.unread()
+        status['sync'] = incoming.sync_stats()
         defer.returnValue(status)
 
     def _set_status(self, address, status, error=None, unread=None):
@@ -848,14 +957,11 @@ def _get_config_for_service(service, basedir, provider):
     config_path = os.path.join(
         basedir, 'providers', provider, '%s-service.json' % service)
     try:
-        with open(config_path) as config:
-            config = json.loads(config.read())
-    except IOError:
+        return config.load_json(config_path)
+    except (IOError, OSError):
         # FIXME might be that the provider DOES NOT offer this service!
         raise ImproperlyConfigured(
             'could not open config file %s' % config_path)
-    else:
-        return config
 
 
 def first(xs):
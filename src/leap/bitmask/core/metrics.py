@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# metrics.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Timing of the commands run through the dispatchers of the core.
+"""
+import time
+
+from bisect import bisect_left
+
+
+# upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+# commands are named after their first parts, which come from the clients, so
+# only this many different names are kept
+MAX_COMMANDS = 200
+OTHER = 'other'
+
+
+class LatencyHistogram(object):
+
+    """
+    Counts of the latencies of a command in fixed buckets.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # the last count is for the latencies over the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        self.counts[bisect_left(self.buckets, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, p):
+        """
+        :return: the upper bound of the bucket of the p percentile, or the
+                 maximum latency if it is over the last bucket.
+        :rtype: float
+        """
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        buckets = [[bound, count]
+                   for bound, count in zip(self.buckets, self.counts)]
+        buckets.append(['inf', self.counts[-1]])
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': buckets,
+        }
+
+
+class CommandStats(object):
+
+    """
+    Latency histograms, error and in-flight counts of each command.
+    """
+
+    def __init__(self, max_commands=MAX_COMMANDS):
+        self._max_commands = max_commands
+        # name -> LatencyHistogram
+        self._latencies = {}
+        self._errors = {}
+        self._in_flight = {}
+
+    def started(self, name):
+        """
+        Count a command as running.
+
+        :return: the name it is accounted under and its start time, to pass
+                 to finished()
+        :rtype: tuple
+        """
+        if name not in self._latencies:
+            if len(self._latencies) >= self._max_commands:
+                name = OTHER
+            self._latencies.setdefault(name, LatencyHistogram())
+            self._errors.setdefault(name, 0)
+            self._in_flight.setdefault(name, 0)
+        self._in_flight[name] += 1
+        return name, time.time()
+
+    def finished(self, started, failed=False):
+        name, start = started
+        self._in_flight[name] -= 1
+        self._latencies[name].add(time.time() - start)
+        if failed:
+            self._errors[name] += 1
+
+    def as_dict(self):
+        stats = {}
+        for name, latencies in self._latencies.items():
+            command = latencies.as_dict()
+            command['errors'] = self._errors[name]
+            command['in_flight'] = self._in_flight[name]
+            stats[name] = command
+        return stats
+
+
+def command_name(parts):
+    """
+    Name a command after its command and subcommand, like 'keys list', or
+    'bonafide user authenticate' for the commands with a second level.
+    """
+    depth = 3 if parts and parts[0] == 'bonafide' else 2
+    return ' '.join(parts[:depth])
+
+
+def threadpool_stats(pool):
+    """
+    :return: the number of threads of a twisted ThreadPool, how many of them
+             are working, and the length of its queue of jobs.
+    :rtype: dict
+    """
+    team = getattr(pool, '_team', None)
+    if team is not None:
+        # twisted >= 15.5
+        stats = team.statistics()
+        return {'threads': stats.busyWorkerCount + stats.idleWorkerCount,
+                'working': stats.busyWorkerCount,
+                'queued': stats.backloggedWorkCount,
+                'max': pool.max}
+    return {'threads': len(pool.threads),
+            'working': len(pool.working),
+            'queued': pool.q.qsize(),
+            'max': pool.max}
+
+
+# shared by all the dispatchers of the core
+command_stats = CommandStats()
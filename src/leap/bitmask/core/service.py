@@ -30,11 +30,18 @@ from twisted.internet.endpoints import TCP4ServerEndpoint
 from twisted.logger import Logger
 
 from leap.bitmask import __version__
+from leap.bitmask import memory
+from leap.bitmask.bonafide._http import getPoolStats
 from leap.bitmask.core import configurable
 from leap.bitmask.core import manhole
 from leap.bitmask.core import flags
+from leap.bitmask.core import logs
 from leap.bitmask.core import _zmq
 from leap.bitmask.core import _session
+from leap.bitmask.core.bootstrap import SessionBootstrap
+from leap.bitmask.core.event_stream import EventStream
+from leap.bitmask.core.metrics import command_stats, threadpool_stats
+from leap.bitmask.core.watchdog import Watchdog
 from leap.bitmask.core.web.service import HTTPDispatcherService
 from leap.bitmask.vpn.service import VPNService
 from leap.common.events import server as event_server
@@ -66,6 +73,13 @@ class BitmaskBackend(configurable.ConfigurableService):
 
         configurable.ConfigurableService.__init__(self, basedir)
         self.core_commands = BackendCommands(self)
+        # shared by all the dispatchers, so every client gets every event
+        self.event_stream = EventStream()
+        # the records of the log, for the clients that follow it
+        self.log_stream = logs.log_stream
+        # shared by the services that start the user sessions, so they are
+        # bootstrapped in parallel but not too many at the same time
+        self.bootstrap = SessionBootstrap()
 
         # The global token is used for authenticating some of the channels that
         # expose the dispatcher. For the moment being, this is the REST API.
@@ -96,6 +110,7 @@ class BitmaskBackend(configurable.ConfigurableService):
         on_start(self.init_events)
         on_start(self.init_bonafide)
         on_start(self.init_sessions)
+        on_start(self.init_watchdog)
 
         if enabled('mail'):
             on_start(self._init_mail_services)
@@ -144,6 +159,9 @@ class BitmaskBackend(configurable.ConfigurableService):
         sessions = _session.SessionService(self.basedir, self.tokens)
         sessions.setServiceParent(self)
 
+    def init_watchdog(self):
+        self._maybe_init_service('watchdog', Watchdog)
+
     def _start_child_service(self, name):
         log.debug('Starting backend child service: %s' % name)
         service = self.getServiceNamed(name)
@@ -174,7 +192,7 @@ class BitmaskBackend(configurable.ConfigurableService):
     def _init_soledad(self):
         service = mail_services.SoledadService
         sol = self._maybe_init_service(
-            'soledad', service, self.basedir)
+            'soledad', service, self.basedir, bootstrap=self.bootstrap)
         if sol:
             sol.register_hook(
                 'on_new_soledad_instance', listener='keymanager')
@@ -191,7 +209,7 @@ class BitmaskBackend(configurable.ConfigurableService):
     def _init_keymanager(self):
         service = mail_services.KeymanagerService
         km = self._maybe_init_service(
-            'keymanager', service, self.basedir)
+            'keymanager', service, self.basedir, bootstrap=self.bootstrap)
         if km:
             km.register_hook('on_new_keymanager_instance', listener='mail')
 
@@ -203,8 +221,7 @@ class BitmaskBackend(configurable.ConfigurableService):
         self._maybe_init_service('vpn', VPNService)
 
     def _init_zmq(self):
-        zs = _zmq.ZMQServerService(self)
-        zs.setServiceParent(self)
+        self._maybe_init_service('zmq', _zmq.ZMQServerService, self)
 
     def _init_web(self, onion=False):
         service = HTTPDispatcherService
@@ -237,6 +254,9 @@ class BitmaskBackend(configurable.ConfigurableService):
     def do_stats(self):
         return self.core_commands.do_stats()
 
+    def do_memory(self):
+        return self.core_commands.do_memory()
+
     def do_status(self):
         return self.core_commands.do_status()
 
@@ -300,6 +320,7 @@ class BackendCommands(object):
                 pass
             status[name] = _status
         status['backend'] = flags.BACKEND
+        status['bootstrap'] = self.core.bootstrap.status()
 
         return json.dumps(status)
 
@@ -308,7 +329,24 @@ class BackendCommands(object):
 
     def do_stats(self):
         mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-        return {'mem_usage': '%s MB' % (mem / 1024)}
+        stats = {'mem_usage': '%s MB' % (mem / 1024),
+                 'http_pools': getPoolStats(),
+                 'commands': command_stats.as_dict(),
+                 'threadpool': threadpool_stats(reactor.getThreadPool())}
+        try:
+            soledad = self.core.getServiceNamed('soledad')
+            stats['soledad_instances'] = soledad.open_instances()
+        except KeyError:
+            pass
+        for name in ('zmq', 'watchdog'):
+            try:
+                stats[name] = self.core.getServiceNamed(name).stats()
+            except KeyError:
+                pass
+        return stats
+
+    def do_memory(self):
+        return memory.accounting.report()
 
     def do_stop(self):
         self.core.stopService()
@@ -19,19 +19,25 @@ UUID Map: a persistent mapping between user-ids and uuids.
 """
 
 import base64
+import hashlib
+import hmac
 import os
 import re
 import platform
+import threading
 
 import scrypt
 
+from cryptography.fernet import Fernet
+from cryptography.fernet import InvalidToken
+from cryptography.hazmat.backends import default_backend
+
 from leap.common.config import get_path_prefix
 
 IS_WIN = platform.system() == "Windows"
 
 if IS_WIN:
     import socket
-    from cryptography.fernet import Fernet
     from cryptography.hazmat.backends.multibackend import MultiBackend
     from cryptography.hazmat.backends.openssl.backend \
         import Backend as OpenSSLBackend
@@ -40,6 +46,19 @@ if IS_WIN:
 
 MAP_PATH = os.path.join(get_path_prefix(), 'leap', 'uuids')
 
+# The records of the map are indexed by a keyed hash of the userid, so a
+# lookup derives the keys from the password once and decrypts only the
+# matching record. The first line of the file holds the salt of the KDF:
+#
+#   v2 <salt>
+#   <hmac(userid)> <fernet(userid, uuid)>
+#   ...
+#
+# Lines without an index are records of the old format, that can only be
+# found trying to decrypt all of them.
+MAP_VERSION = 'v2'
+SALT_LENGTH = 16
+
 
 class UserMap(object):
 
@@ -47,11 +66,14 @@ class UserMap(object):
     A persistent mapping between user-ids and uuids.
     """
 
-    # TODO Add padding to the encrypted string
-
     def __init__(self):
         self._d = {}
-        self._lines = set([])
+        self._uuids = {}
+        self._salt = None
+        self._index = {}
+        self._legacy_lines = []
+        # lookups and additions can run in threads, see SoledadContainer
+        self._lock = threading.Lock()
         if os.path.isfile(MAP_PATH):
             self.load()
 
@@ -61,71 +83,125 @@ class UserMap(object):
         password.
         """
         self._add_to_cache(userid, uuid)
-        self._lines.add(_encode_uuid_map(userid, uuid, passwd))
-        self.dump()
+        with self._lock:
+            if self._salt is None:
+                self._salt = os.urandom(SALT_LENGTH)
+                self.dump()
+        keys = _derive_keys(passwd, self._salt)
+        tag = _index_tag(keys, userid)
+        if _decode_record(self._index.get(tag), keys) == (userid, uuid):
+            return
+        record = _encode_record(userid, uuid, keys)
+        with self._lock:
+            self._index[tag] = record
+            with open(MAP_PATH, 'a') as out:
+                out.write('%s %s\n' % (tag, record))
 
     def _add_to_cache(self, userid, uuid):
+        old_uuid = self._d.get(userid)
+        if old_uuid is not None:
+            self._uuids.pop(old_uuid, None)
         self._d[userid] = uuid
+        self._uuids[uuid] = userid
 
     def load(self):
         """
         Load a mapping from a default file.
         """
         with open(MAP_PATH, 'r') as infile:
-            lines = infile.readlines()
-            self._lines = set(lines)
+            for line in infile:
+                fields = line.split()
+                if len(fields) == 1:
+                    self._legacy_lines.append(fields[0])
+                elif len(fields) == 2 and fields[0] == MAP_VERSION:
+                    self._salt = base64.urlsafe_b64decode(fields[1])
+                elif len(fields) == 2:
+                    tag, record = fields
+                    self._index[tag] = record
 
     def dump(self):
         """
         Dump the mapping to a default file.
         """
         with open(MAP_PATH, 'w') as out:
-            out.write('\n'.join(self._lines))
+            if self._salt is not None:
+                out.write('%s %s\n' % (
+                    MAP_VERSION, base64.urlsafe_b64encode(self._salt)))
+            for line in self._legacy_lines:
+                out.write('%s\n' % (line,))
+            for tag, record in self._index.items():
+                out.write('%s %s\n' % (tag, record))
 
     def lookup_uuid(self, userid, passwd=None):
         """
         Lookup the uuid for a given userid.
 
         If no password is given, try to lookup on cache.
-        Else, try to decrypt all the records that we know about with the
-        passed password.
+        Else, decrypt the record indexed for this userid and password, or, if
+        there is none, try to decrypt all the records of the old format.
         """
         if not passwd:
             return self._d.get(userid)
 
-        for line in self._lines:
+        if self._salt is not None:
+            keys = _derive_keys(passwd, self._salt)
+            guess = _decode_record(
+                self._index.get(_index_tag(keys, userid)), keys)
+            if guess and guess[0] == userid:
+                uuid = guess[1]
+                self._add_to_cache(userid, uuid)
+                return uuid
+
+        for line in self._legacy_lines:
             guess = _decode_uuid_line(line, passwd)
             if guess:
                 record_userid, uuid = guess
                 if record_userid == userid:
-                    self._add_to_cache(userid, uuid)
+                    # index it, so next time there is no need to scan
+                    self.add(userid, uuid, passwd)
                     return uuid
 
     def lookup_userid(self, uuid):
         """
         Get the userid for the given uuid from cache.
         """
-        rev_d = {v: k for (k, v) in self._d.items()}
-        return rev_d.get(uuid)
+        return self._uuids.get(uuid)
 
 
-def _encode_uuid_map(userid, uuid, passwd):
-    data = 'userid:%s:uuid:%s' % (userid, uuid)
+def _derive_keys(passwd, salt):
+    """
+    Derive from the password the keys to index and to encrypt the records.
 
-    # FIXME scrypt.encrypt is broken in windows.
-    # This is a quick hack. The hostname might not be unique enough though.
-    # We could use a long random hash per entry and store it in the file.
-    # Other option is to use a different KDF that is supported by cryptography
-    # (ie, pbkdf)
+    :return: a tuple with the key for the index hmac and the fernet key.
+    :rtype: tuple
+    """
+    key = scrypt.hash(passwd, salt, buflen=64)
+    return key[:32], base64.urlsafe_b64encode(key[32:])
 
-    if IS_WIN:
-        key = scrypt.hash(passwd, socket.gethostname())
-        key = base64.urlsafe_b64encode(key[:32])
-        f = Fernet(key, backend=crypto_backend)
-        encrypted = f.encrypt(data)
-    else:
-        encrypted = scrypt.encrypt(data, passwd, maxtime=0.05)
-    return base64.urlsafe_b64encode(encrypted)
+
+def _index_tag(keys, userid):
+    index_key, _ = keys
+    digest = hmac.new(index_key, userid, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest)
+
+
+def _encode_record(userid, uuid, keys):
+    _, fernet_key = keys
+    data = 'userid:%s:uuid:%s' % (userid, uuid)
+    return Fernet(fernet_key, backend=default_backend()).encrypt(data)
+
+
+def _decode_record(record, keys):
+    if record is None:
+        return None
+    _, fernet_key = keys
+    try:
+        data = Fernet(fernet_key, backend=default_backend()).decrypt(record)
+    except InvalidToken:
+        return None
+    match = re.findall("userid\:(.+)\:uuid\:(.+)", data)
+    if match:
+        return match[0]
 
 
 def _decode_uuid_line(line, passwd):
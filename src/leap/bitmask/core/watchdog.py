@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# watchdog.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Watchdog of the reactor of the core.
+
+A periodic call measures how late the reactor runs it (the lag), and the
+queue of the reactor threadpool. A sampler thread looks at the reactor thread
+while it is blocked, and keeps the stacks of the places where it blocks the
+most.
+"""
+import sys
+import thread
+import threading
+import traceback
+
+from twisted.application import service
+from twisted.internet import reactor, task
+from twisted.logger import Logger
+
+from leap.bitmask.core.metrics import threadpool_stats
+
+
+TICK_INTERVAL = 0.5  # seconds
+
+# the reactor is considered blocked when a tick is this late
+LAG_THRESHOLD = 0.5  # seconds
+# warn when there are this many calls waiting for a thread of the pool
+QUEUE_THRESHOLD = 10
+# don't repeat a warning before this many seconds
+WARN_INTERVAL = 60
+
+SAMPLE_INTERVAL = 0.1  # seconds
+STACK_DEPTH = 8
+MAX_SITES = 10
+
+
+class Watchdog(service.Service):
+
+    log = Logger()
+
+    def __init__(self, clock=reactor, threadpool=None,
+                 lag_threshold=LAG_THRESHOLD,
+                 queue_threshold=QUEUE_THRESHOLD):
+        self._clock = clock
+        self._threadpool = threadpool
+        self.lag_threshold = lag_threshold
+        self.queue_threshold = queue_threshold
+
+        self._loop = None
+        self._expected = None
+        self._last_tick = None
+        self._warned = {}
+
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.max_queued = 0
+
+        # sampled by the sampler thread, read from the reactor
+        self._lock = threading.Lock()
+        # (filename, lineno, function) -> site
+        self._sites = {}
+        self._reactor_thread = None
+        self._sampler = None
+        self._stop_sampling = threading.Event()
+
+    def startService(self):
+        service.Service.startService(self)
+        self._expected = self._clock.seconds() + TICK_INTERVAL
+        self._last_tick = self._clock.seconds()
+        self._loop = task.LoopingCall(self._tick)
+        self._loop.clock = self._clock
+        self._loop.start(TICK_INTERVAL, now=False)
+
+        self._reactor_thread = thread.get_ident()
+        self._stop_sampling = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._run_sampler, name='watchdog')
+        self._sampler.daemon = True
+        self._sampler.start()
+
+    def stopService(self):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self._loop = None
+        self._stop_sampling.set()
+        self._sampler = None
+        service.Service.stopService(self)
+
+    def stats(self):
+        """
+        :return: the lag of the reactor, the state of its threadpool and the
+                 places where the reactor was blocked the longest.
+        :rtype: dict
+        """
+        pool = threadpool_stats(self._get_threadpool())
+        pool['max_queued'] = self.max_queued
+        with self._lock:
+            sites = sorted(self._sites.values(),
+                           key=lambda site: site['samples'], reverse=True)
+            sites = [dict(site) for site in sites[:MAX_SITES]]
+        return {'lag': {'last': self.last_lag,
+                        'max': self.max_lag,
+                        'stalls': self.stalls},
+                'threadpool': pool,
+                'blocking': sites}
+
+    def _get_threadpool(self):
+        if self._threadpool is not None:
+            return self._threadpool
+        return reactor.getThreadPool()
+
+    def _tick(self):
+        now = self._clock.seconds()
+        self._last_tick = now
+        lag = max(now - self._expected, 0.0)
+        self._expected = now + TICK_INTERVAL
+
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        if lag >= self.lag_threshold:
+            self.stalls += 1
+            self._warn('lag', now, 'The reactor was blocked for %.2f seconds'
+                       % lag)
+
+        queued = threadpool_stats(self._get_threadpool())['queued']
+        self.max_queued = max(self.max_queued, queued)
+        if queued >= self.queue_threshold:
+            self._warn('threadpool', now,
+                       '%d calls are waiting for a thread of the reactor '
+                       'threadpool' % queued)
+
+    def _warn(self, kind, now, message):
+        last = self._warned.get(kind)
+        if last is not None and now - last < WARN_INTERVAL:
+            return
+        self._warned[kind] = now
+        self.log.warn(message)
+
+    # sampler thread
+
+    def _run_sampler(self):
+        stop = self._stop_sampling
+        while not stop.wait(SAMPLE_INTERVAL):
+            blocked = self._clock.seconds() - self._last_tick
+            if blocked >= TICK_INTERVAL + self.lag_threshold:
+                self._sample(blocked)
+
+    def _sample(self, blocked):
+        """
+        Record where the reactor thread is, as it has been blocked for
+        C{blocked} seconds.
+        """
+        frame = sys._current_frames().get(self._reactor_thread)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame, STACK_DEPTH)
+        del frame
+        filename, lineno, function, _ = stack[-1]
+        key = (filename, lineno, function)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                if len(self._sites) >= MAX_SITES * 10:
+                    return
+                site = {'site': '%s:%d in %s' % key,
+                        'samples': 0, 'longest': 0.0,
+                        'stack': ['%s:%d in %s' % entry[:3]
+                                  for entry in stack]}
+                self._sites[key] = site
+            site['samples'] += 1
+            site['longest'] = max(site['longest'], blocked)
@@ -19,11 +19,15 @@
 WebSockets Dispatcher Service.
 """
 
+import json
 import os
 import pkg_resources
+import uuid
 
+from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.application import service
+from twisted.python import failure
 
 from twisted.web.server import Site
 from twisted.web.static import File
@@ -31,8 +35,12 @@ from twisted.web.static import File
 from autobahn.twisted.resource import WebSocketResource
 from autobahn.twisted.websocket import WebSocketServerFactory
 from autobahn.twisted.websocket import WebSocketServerProtocol
+from autobahn.websocket.compress import PerMessageDeflateOffer
+from autobahn.websocket.compress import PerMessageDeflateOfferAccept
 
 from leap.bitmask.core.dispatcher import CommandDispatcher
+from leap.bitmask.core.dispatcher import _format_error
+from leap.bitmask.core.dispatcher import _format_result
 
 
 class WebSocketsDispatcherService(service.Service):
@@ -41,10 +49,11 @@ class WebSocketsDispatcherService(service.Service):
     A Dispatcher for BitmaskCore exposing a WebSockets Endpoint.
     """
 
-    def __init__(self, core, port=8080, debug=False):
+    def __init__(self, core, port=8080, debug=False, compression=True):
         self._core = core
         self.port = port
         self.debug = debug
+        self.compression = compression
 
     def startService(self):
 
@@ -52,6 +61,9 @@ class WebSocketsDispatcherService(service.Service):
                                          debug=self.debug)
         factory.protocol = DispatcherProtocol
         factory.protocol.dispatcher = CommandDispatcher(self._core)
+        if self.compression:
+            factory.setProtocolOptions(
+                perMessageCompressionAccept=_accept_deflate)
 
         # FIXME: Site.start/stopFactory should start/stop factories wrapped as
         # Resources
@@ -83,11 +95,87 @@ class WebSocketsDispatcherService(service.Service):
 
 class DispatcherProtocol(WebSocketServerProtocol):
 
+    """
+    Dispatches the commands received through a websocket.
+
+    A message can be a plain command, with its parts separated by spaces,
+    which is answered in order with the result json. Or it can be a json
+    request with an id:
+
+        {"id": 1, "command": ["keys", "list", "user@provider"]}
+
+    that is answered, as soon as the command finishes and maybe out of
+    order, with:
+
+        {"id": 1, "error": null, "result": [...]}
+
+    so many commands can be running at the same time over one connection.
+    The events streamed to the client (see 'events stream') are sent as:
+
+        {"id": null, "event": "KEYMANAGER_KEY_FOUND", "content": [...]}
+    """
+
+    subscriber = None
+
     def onMessage(self, msg, binary):
+        if msg.lstrip().startswith('{'):
+            self.on_request(msg, binary)
+            return
+
         parts = msg.split()
+        if parts[:2] == ['events', 'stream']:
+            self.stream_events(parts, binary)
+            self.defer_reply(
+                _format_result({'subscriber': self.subscriber}), binary)
+            return
         r = self.dispatcher.dispatch(parts)
         r.addCallback(self.defer_reply, binary)
 
+    def on_request(self, msg, binary):
+        try:
+            request = json.loads(msg)
+            request_id = request['id']
+            command = [_to_str(part) for part in request['command']]
+        except (ValueError, TypeError, KeyError) as e:
+            self.reply(_frame(_format_error(failure.Failure(e)), None),
+                       binary)
+            return
+
+        if command[:2] == ['events', 'stream']:
+            self.stream_events(command, binary, framed=True)
+            d = defer.succeed(_format_result({'subscriber': self.subscriber}))
+        else:
+            d = self.dispatcher.dispatch(command)
+            d.addErrback(_format_error)
+        d.addCallback(_frame, request_id)
+        d.addCallback(self.reply, binary)
+
+    def onClose(self, wasClean, code, reason):
+        if self.subscriber is not None:
+            self.dispatcher.core.event_stream.close(self.subscriber)
+            self.subscriber = None
+
+    def stream_events(self, parts, binary, framed=False):
+        """
+        Push the events registered by the subscriber through this connection
+        instead of having the client poll for them.
+        """
+        try:
+            subscriber = parts[2]
+        except IndexError:
+            subscriber = uuid.uuid4().hex
+
+        def push(event, content):
+            if framed:
+                message = json.dumps(
+                    {'id': None, 'event': event, 'content': content})
+            else:
+                message = json.dumps([event, content])
+            self.sendMessage(message, binary)
+
+        self.dispatcher.core.event_stream.push(subscriber, push)
+        self.subscriber = subscriber
+
     def reply(self, response, binary):
         self.sendMessage(response, binary)
 
@@ -96,3 +184,28 @@ class DispatcherProtocol(WebSocketServerProtocol):
 
     def _get_service(self, name):
         return self.core.getServiceNamed(name)
+
+
+def _accept_deflate(offers):
+    """
+    Accept per-message compression if the client offers it.
+    """
+    for offer in offers:
+        if isinstance(offer, PerMessageDeflateOffer):
+            return PerMessageDeflateOfferAccept(offer)
+
+
+def _frame(response, request_id):
+    """
+    Add the request id to a response json from the dispatcher.
+    """
+    # the dispatcher responses are always json objects, so there is no need
+    # to decode them to add a key
+    return '{"id": %s, %s' % (json.dumps(request_id), response.lstrip()[1:])
+
+
+def _to_str(part):
+    # same conversion than the REST api does for the parameters
+    if isinstance(part, basestring):
+        return part.encode('ascii', 'replace')
+    return str(part)
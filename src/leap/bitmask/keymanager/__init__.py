@@ -37,6 +37,7 @@ from leap.bitmask.keymanager import errors as keymanager_errors
 from leap.bitmask.keymanager.errors import KeyNotFound
 from leap.bitmask.keymanager.nicknym import Nicknym
 from leap.bitmask.keymanager.refresher import RandomRefreshPublicKey
+from leap.bitmask.keymanager.usage import KeyUsageQueue
 from leap.bitmask.keymanager.validation import ValidationLevels, can_upgrade
 from leap.bitmask.keymanager.openpgp import OpenPGPScheme
 
@@ -54,7 +55,8 @@ class KeyManager(object):
 
     def __init__(self, address, nickserver_uri, soledad, token=None,
                  ca_cert_path=None, api_uri=None, api_version=None, uid=None,
-                 gpgbinary=None, combined_ca_bundle=None):
+                 gpgbinary=None, combined_ca_bundle=None,
+                 usage_journal_path=None):
         """
         Initialize a Key Manager for user's C{address} with provider's
         nickserver reachable in C{nickserver_uri}.
@@ -77,6 +79,9 @@ class KeyManager(object):
         :type uid: str
         :param gpgbinary: Name for GnuPG binary executable.
         :type gpgbinary: C{str}
+        :param usage_journal_path: The file where key usage flags pending to
+                                   be stored are journaled.
+        :type usage_journal_path: C{str}
         """
         self._address = address
         self._nickserver_uri = nickserver_uri
@@ -97,6 +102,7 @@ class KeyManager(object):
         self._nicknym = Nicknym(self._nickserver_uri,
                                 self._ca_cert_path, self._token)
         self.refresher = None
+        self._usage_journal_path = usage_journal_path
         self._init_gpg(soledad, gpgbinary)
 
     #
@@ -105,6 +111,7 @@ class KeyManager(object):
 
     def _init_gpg(self, soledad, gpgbinary):
         self._openpgp = OpenPGPScheme(soledad, gpgbinary=gpgbinary)
+        self._usage = KeyUsageQueue(self._openpgp, self._usage_journal_path)
 
     def start_refresher(self):
         self.refresher = RandomRefreshPublicKey(self._openpgp, self)
@@ -113,6 +120,12 @@ class KeyManager(object):
     def stop_refresher(self):
         self.refresher.stop()
 
+    def start_usage_queue(self):
+        self._usage.start()
+
+    def stop_usage_queue(self):
+        return self._usage.stop()
+
     def _create_combined_bundle_file(self):
         leap_ca_bundle = ca_bundle.where()
 
@@ -308,7 +321,7 @@ class KeyManager(object):
 
         def key_found(key):
             emit_async(catalog.KEYMANAGER_KEY_FOUND, address)
-            return key
+            return self._usage.update(key)
 
         def key_not_found(failure):
             if not failure.check(keymanager_errors.KeyNotFound):
@@ -343,7 +356,9 @@ class KeyManager(object):
         :return: A Deferred which fires with a list of all keys in local db.
         :rtype: Deferred
         """
-        return self._openpgp.get_all_keys(private)
+        d = self._openpgp.get_all_keys(private)
+        d.addCallback(lambda keys: map(self._usage.update, keys))
+        return d
 
     def gen_key(self):
         """
@@ -458,7 +473,7 @@ class KeyManager(object):
                 cipher_algo=cipher_algo)
             if not pubkey.encr_used:
                 pubkey.encr_used = True
-                yield self._openpgp.put_key(pubkey)
+                self._usage.mark_encr_used(pubkey)
             defer.returnValue(encrypted)
 
         dpub = self.get_key(address, private=False,
@@ -511,8 +526,7 @@ class KeyManager(object):
                 signature = pubkey
                 if not pubkey.sign_used:
                     pubkey.sign_used = True
-                    yield self._openpgp.put_key(pubkey)
-                    defer.returnValue((decrypted, signature))
+                    self._usage.mark_sign_used(pubkey)
             else:
                 signature = keymanager_errors.InvalidSignature(
                     'Failed to verify signature with key %s' %
@@ -600,9 +614,7 @@ class KeyManager(object):
             if signed:
                 if not pubkey.sign_used:
                     pubkey.sign_used = True
-                    d = self._openpgp.put_key(pubkey)
-                    d.addCallback(lambda _: pubkey)
-                    return d
+                    self._usage.mark_sign_used(pubkey)
                 return pubkey
             else:
                 raise keymanager_errors.InvalidSignature(
@@ -650,6 +662,8 @@ class KeyManager(object):
                 return failure
 
         def check_upgrade(old_key):
+            if old_key is not None:
+                old_key = self._usage.update(old_key)
             if key.private or can_upgrade(key, old_key):
                 return self._openpgp.put_key(key)
             else:
@@ -696,6 +710,56 @@ class KeyManager(object):
             d.addCallback(lambda _: self.put_key(privkey))
         return d
 
+    @defer.inlineCallbacks
+    def put_raw_keys(self, keys, address=None,
+                     validation=ValidationLevels.Weak_Chain):
+        """
+        Put all the keys contained in a keyring or in several concatenated
+        ascii-armored key blocks in local storage.
+
+        Keys are parsed in parallel, validated against the stored keys in one
+        pass and written to soledad at once.
+
+        :param keys: The keyring data to be stored
+        :type keys: str
+        :param address: address for which the keys will be active, if None
+                        each key will be active for the first address on its
+                        uids
+        :type address: str
+        :param validation: validation level for the public keys
+                           (default: 'Weak_Chain')
+        :type validation: ValidationLevels
+
+        :return: A Deferred which fires with the list of stored public keys,
+                 or which fails with KeyNotFound if no OpenPGP material was
+                 found in keys or fails with KeyAddressMismatch if address
+                 doesn't match any uid on a key or fails with
+                 KeyNotValidUpgrade if a key with the same uid exists and
+                 the new one is not a valid update for it.
+        :rtype: Deferred
+        """
+        keypairs = yield self._openpgp.parse_keys(keys, address)
+        if not keypairs:
+            raise keymanager_errors.KeyNotFound(keys)
+
+        docs_index = yield self._openpgp.get_docs_index()
+        to_put = []
+        for pubkey, privkey in keypairs:
+            pubkey.validation = validation
+            old_key = docs_index.get_key(pubkey.address, private=False)
+            if old_key is not None:
+                old_key = self._usage.update(old_key)
+            if not can_upgrade(pubkey, old_key):
+                raise keymanager_errors.KeyNotValidUpgrade(
+                    "Key %s can not be upgraded by new key %s"
+                    % (old_key.fingerprint, pubkey.fingerprint))
+            to_put.append(pubkey)
+            if privkey is not None:
+                to_put.append(privkey)
+
+        yield self._openpgp.put_keys(to_put, docs_index)
+        defer.returnValue([pubkey for pubkey, _ in keypairs])
+
     @defer.inlineCallbacks
     def fetch_key(self, address, uri, validation=ValidationLevels.Weak_Chain):
         """
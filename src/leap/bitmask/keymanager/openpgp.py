@@ -119,7 +119,8 @@ class OpenPGPScheme(object):
         self._gpgbinary = gpgbinary
         self.deferred_init = init_indexes(soledad)
         self.deferred_init.addCallback(self._migrate_documents_schema)
-        self._wait_indexes("get_key", "put_key", "get_all_keys")
+        self._wait_indexes("get_key", "put_key", "get_all_keys",
+                           "get_docs_index")
 
     def _migrate_documents_schema(self, _):
         from leap.bitmask.keymanager.migrator import KeyDocumentsMigrator
@@ -341,6 +342,70 @@ class OpenPGPScheme(object):
 
         return (openpgp_pubkey, openpgp_privkey)
 
+    def parse_keys(self, key_data, address=None):
+        """
+        Parse a keyring, or several concatenated ascii-armored key blocks,
+        and return the OpenPGPKey keys found on it.
+
+        Each armored block is processed in its own temporary keyring on a
+        worker thread, so big keyrings are parsed in parallel.
+
+        :param key_data: the keyring data to be parsed.
+        :type key_data: str or unicode
+        :param address: Active address for the keys. If None each key will be
+                        bound to the first address found on its uids.
+        :type address: str
+
+        :return: A Deferred which fires with a list of (public, private)
+                 tuples of OpenPGPKey, private might be None.
+        :rtype: Deferred
+        """
+        leap_assert_type(key_data, (str, unicode))
+
+        def build_keys(results):
+            processed = {}
+            order = []
+            for result in results:
+                for pub_info, pubkey, priv_info, privkey in result:
+                    fingerprint = pub_info['fingerprint']
+                    if fingerprint not in processed:
+                        order.append(fingerprint)
+                    elif processed[fingerprint][3] is not None:
+                        # we already have the key pair for this fingerprint
+                        continue
+                    processed[fingerprint] = (
+                        pub_info, pubkey, priv_info, privkey)
+
+            keys = []
+            for fingerprint in order:
+                pub_info, pubkey, priv_info, privkey = processed[fingerprint]
+                openpgp_pubkey = self._build_key_from_gpg(
+                    pub_info, pubkey, address)
+                openpgp_privkey = None
+                if privkey:
+                    openpgp_privkey = self._build_key_from_gpg(
+                        priv_info, privkey, address)
+
+                if address is None:
+                    uids = filter(None, openpgp_pubkey.uids)
+                    if not uids:
+                        self.log.warn('Ignoring key %s without any address'
+                                      % (fingerprint,))
+                        continue
+                    openpgp_pubkey.address = uids[0]
+                    if openpgp_privkey is not None:
+                        openpgp_privkey.address = uids[0]
+                keys.append((openpgp_pubkey, openpgp_privkey))
+            return keys
+
+        deferreds = []
+        for block in split_key_blocks(key_data):
+            d = from_thread(process_keys, block, self._gpgbinary)
+            deferreds.append(d)
+        d = defer.gatherResults(deferreds, consumeErrors=True)
+        d.addCallbacks(build_keys, lambda f: f.value.subFailure)
+        return d
+
     def put_raw_key(self, key_data, address):
         """
         Put key contained in C{key_data} in local storage.
@@ -425,6 +490,157 @@ class OpenPGPScheme(object):
         d.addCallback(merge_and_put)
         return d
 
+    def get_docs_index(self):
+        """
+        Fetch all the key and active documents stored in soledad.
+
+        :return: A Deferred which fires with a KeyDocsIndex.
+        :rtype: Deferred
+        """
+        deferreds = []
+        for tag in (KEYMANAGER_KEY_TAG, KEYMANAGER_ACTIVE_TAG):
+            for private in ('0', '1'):
+                d = self._soledad.get_from_index(
+                    TAGS_PRIVATE_INDEX, tag, private)
+                deferreds.append(d)
+
+        def build_index(results):
+            key_docs = results[0] + results[1]
+            active_docs = results[2] + results[3]
+            return KeyDocsIndex(key_docs, active_docs)
+
+        d = defer.gatherResults(deferreds, consumeErrors=True)
+        d.addCallbacks(build_index, lambda f: f.value.subFailure)
+        return d
+
+    @defer.inlineCallbacks
+    def put_keys(self, keys, docs_index=None):
+        """
+        Put several C{keys} in local storage at once.
+
+        The existing documents are looked up in C{docs_index}, and all the
+        documents are written at once. If several keys are bound to the same
+        address only the last one will be active.
+
+        :param keys: The keys to be stored.
+        :type keys: list(OpenPGPKey)
+        :param docs_index: The stored documents, if None they will be fetched.
+        :type docs_index: KeyDocsIndex
+
+        :return: A Deferred which fires when the keys are in the storage.
+        :rtype: Deferred
+        """
+        if docs_index is None:
+            docs_index = yield self.get_docs_index()
+
+        last_active = {}
+        for key in keys:
+            last_active[(key.address, key.private)] = key
+
+        def merge_key(key, keydoc, activedoc):
+            active_content = None
+            if activedoc:
+                active_content = activedoc.content
+            oldkey = build_key_from_dict(keydoc.content, active_content)
+            key.merge(oldkey)
+            return key
+
+        operations = []
+        merges = []
+        for key in keys:
+            keydoc = docs_index.key_docs.get((key.fingerprint, key.private))
+            activedoc = None
+            if last_active[(key.address, key.private)] is key:
+                activedoc = docs_index.active_docs.get(
+                    (key.address, key.private))
+            else:
+                key.set_unactive()
+
+            if not keydoc:
+                if activedoc:
+                    operations.append(('delete_doc', activedoc))
+                operations.append(('create_doc_from_json', key.get_json()))
+                if key.is_active():
+                    operations.append(
+                        ('create_doc_from_json', key.get_active_json()))
+                continue
+
+            merges.append((key, keydoc, activedoc))
+
+        # merging keys needs gpg, so let's do it in parallel out of the
+        # reactor thread
+        deferreds = [from_thread(merge_key, *merge) for merge in merges]
+        yield defer.gatherResults(deferreds, consumeErrors=True)
+
+        for key, keydoc, activedoc in merges:
+            keydoc.set_json(key.get_json())
+            operations.append(('put_doc', keydoc))
+            if activedoc:
+                activedoc.set_json(key.get_active_json())
+                operations.append(('put_doc', activedoc))
+            elif key.is_active():
+                operations.append(
+                    ('create_doc_from_json', key.get_active_json()))
+
+        yield self._write_docs(operations)
+
+    def put_keys_usage(self, usage):
+        """
+        Store the usage flags of several public keys at once.
+
+        Keys that are no longer active for their address are skipped.
+
+        :param usage: the flags ('encr' and/or 'sign') to be set, by
+                      (address, fingerprint)
+        :type usage: dict
+
+        :return: A Deferred which fires when the flags are in the storage.
+        :rtype: Deferred
+        """
+        flag_keys = {'encr': KEY_ENCR_USED_KEY, 'sign': KEY_SIGN_USED_KEY}
+
+        def update_active_docs(active_docs):
+            operations = []
+            for activedoc in active_docs:
+                content = activedoc.content
+                entry = (content[KEY_ADDRESS_KEY],
+                         content[KEY_FINGERPRINT_KEY])
+                if entry not in usage:
+                    continue
+                changed = False
+                for flag in usage[entry]:
+                    if not content[flag_keys[flag]]:
+                        content[flag_keys[flag]] = True
+                        changed = True
+                if changed:
+                    activedoc.content = content
+                    operations.append(('put_doc', activedoc))
+            return self._write_docs(operations)
+
+        d = self._soledad.get_from_index(
+            TAGS_PRIVATE_INDEX, KEYMANAGER_ACTIVE_TAG, '0')
+        d.addCallback(update_active_docs)
+        return d
+
+    def _write_docs(self, operations):
+        """
+        Run all the write C{operations} on soledad at once.
+
+        The writes are not atomic, if one of them fails the others may
+        already be stored.
+
+        :param operations: pairs of (soledad method name, argument).
+        :type operations: list(tuple(str, object))
+
+        :return: A Deferred which fires when the documents are written.
+        :rtype: Deferred
+        """
+        deferreds = []
+        for method, arg in operations:
+            d = getattr(self._soledad, method)(arg)
+            deferreds.append(d)
+        return defer.gatherResults(deferreds, consumeErrors=True)
+
     def _get_key_doc(self, address, private=False):
         """
         Get the document with a key (public, by default) bound to C{address}.
@@ -877,6 +1093,87 @@ class OpenPGPScheme(object):
         return d
 
 
+class KeyDocsIndex(object):
+    """
+    In memory index of the key and active documents stored in soledad.
+
+    It allows to check and write many keys without querying soledad for
+    each one of them.
+    """
+
+    def __init__(self, key_docs, active_docs):
+        self.key_docs = {}
+        for doc in key_docs:
+            content = doc.content
+            self.key_docs[(content[KEY_FINGERPRINT_KEY],
+                           content[KEY_PRIVATE_KEY])] = doc
+        self.active_docs = {}
+        for doc in active_docs:
+            content = doc.content
+            self.active_docs[(content[KEY_ADDRESS_KEY],
+                              content[KEY_PRIVATE_KEY])] = doc
+
+    def get_key(self, address, private=False):
+        """
+        Get the active key bound to C{address}.
+
+        :return: the key or None if there is no active key for the address.
+        :rtype: OpenPGPKey
+        """
+        activedoc = self.active_docs.get((address, private))
+        if activedoc is None:
+            return None
+        keydoc = self.key_docs.get(
+            (activedoc.content[KEY_FINGERPRINT_KEY], private))
+        if keydoc is None:
+            return None
+        return build_key_from_dict(keydoc.content, activedoc.content)
+
+
+KEY_BLOCK_RE = re.compile(
+    r'-----BEGIN PGP (PUBLIC|PRIVATE) KEY BLOCK-----.*?'
+    r'-----END PGP \1 KEY BLOCK-----', re.DOTALL)
+
+
+def split_key_blocks(key_data):
+    """
+    Split C{key_data} in its ascii-armored key blocks.
+
+    :return: the list of armored blocks, or a list with C{key_data} itself if
+             it doesn't contain armored blocks (i.e. a binary keyring).
+    :rtype: list(str)
+    """
+    blocks = [m.group(0) for m in KEY_BLOCK_RE.finditer(key_data)]
+    if not blocks:
+        return [key_data]
+    return blocks
+
+
+def process_keys(key_data, gpgbinary):
+    """
+    Import C{key_data}, that might contain several keys, and export each of
+    the keys found.
+
+    :return: a list of (pub_info, pubkey, priv_info, privkey) for each key,
+             priv_info and privkey are ({}, None) for public only keys.
+    :rtype: list(tuple)
+    """
+    keys = []
+    with TempGPGWrapper(gpgbinary=gpgbinary) as gpg:
+        gpg.import_keys(key_data)
+        secret = dict((info['fingerprint'], info)
+                      for info in gpg.list_keys(secret=True))
+        for info in gpg.list_keys():
+            fingerprint = info['fingerprint']
+            pubkey = gpg.export_keys(fingerprint)
+            priv_info, privkey = {}, None
+            if fingerprint in secret:
+                priv_info = secret[fingerprint]
+                privkey = gpg.export_keys(fingerprint, secret=True)
+            keys.append((info, pubkey, priv_info, privkey))
+    return keys
+
+
 def process_key(key_data, gpgbinary, secret=False):
     with TempGPGWrapper(gpgbinary=gpgbinary) as gpg:
         try:
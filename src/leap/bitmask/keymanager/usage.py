@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# usage.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Write-behind queue for the usage flags (encr_used, sign_used) of public keys.
+
+Setting a usage flag used to mean a soledad write in the middle of every
+encrypt/decrypt/verify that used a key for the first time. Instead, flags are
+kept in memory, appended to a small journal file so they survive a crash, and
+written to soledad in batches.
+"""
+import os
+
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.logger import Logger
+
+from leap.bitmask import memory
+
+
+FLUSH_PERIOD = 30  # seconds
+MAX_PENDING = 50
+
+ENCR_USED = 'encr'
+SIGN_USED = 'sign'
+
+
+class KeyUsageQueue(object):
+
+    log = Logger()
+
+    def __init__(self, openpgp, journal_path=None):
+        """
+        Initialize the queue, loading the usage flags that were not flushed
+        to soledad in a previous run.
+
+        :param openpgp: Openpgp object.
+        :param journal_path: The file where pending flags are journaled. If
+                             None they will be kept only in memory.
+        :type journal_path: str
+        """
+        self._openpgp = openpgp
+        self._journal_path = journal_path
+        self._journal = None
+        # (address, fingerprint) -> set of flags
+        self._pending = {}
+        self._flushing = None
+        self._loop = LoopingCall(self.flush)
+        self._shutdown_trigger = None
+        self._load_journal()
+        memory.register('keymanager.usage', self, '_pending')
+
+    def start(self):
+        """
+        Start flushing the pending flags periodically.
+        """
+        self._loop.start(FLUSH_PERIOD, now=False)
+        self._shutdown_trigger = reactor.addSystemEventTrigger(
+            'before', 'shutdown', self.flush)
+
+    def stop(self):
+        """
+        Stop the periodic flushing and flush the pending flags.
+
+        :return: A Deferred which fires when the flags are written.
+        :rtype: Deferred
+        """
+        if self._loop.running:
+            self._loop.stop()
+        if self._shutdown_trigger is not None:
+            reactor.removeSystemEventTrigger(self._shutdown_trigger)
+            self._shutdown_trigger = None
+        return self.flush()
+
+    def mark_encr_used(self, key):
+        self._mark(key, ENCR_USED)
+
+    def mark_sign_used(self, key):
+        self._mark(key, SIGN_USED)
+
+    def update(self, key):
+        """
+        Set on C{key} the usage flags that are not yet stored.
+
+        :param key: The key fetched from the storage.
+        :type key: OpenPGPKey
+        :return: the same key.
+        :rtype: OpenPGPKey
+        """
+        if key.private:
+            return key
+        flags = self._pending.get((key.address, key.fingerprint))
+        if flags:
+            key.encr_used = key.encr_used or ENCR_USED in flags
+            key.sign_used = key.sign_used or SIGN_USED in flags
+        return key
+
+    def flush(self):
+        """
+        Write all the pending flags to soledad at once.
+
+        :return: A Deferred which fires when the flags are written.
+        :rtype: Deferred
+        """
+        if self._flushing is not None:
+            # the flags marked after the running flush started are not
+            # written by it, so flush again when it finishes
+            d = defer.Deferred()
+
+            def flush_again(written):
+                if written:
+                    self.flush().chainDeferred(d)
+                else:
+                    d.callback(None)
+                return written
+
+            self._flushing.addCallback(flush_again)
+            return d
+        if not self._pending:
+            return defer.succeed(None)
+
+        usage = self._pending
+        self._pending = {}
+        done = defer.Deferred()
+
+        def written(_):
+            self._flushing = None
+            try:
+                self._rewrite_journal()
+            except (IOError, OSError) as e:
+                # the flags are in soledad, they will only be written again
+                self.log.error('Error rewriting keys usage journal: %s' % (e,))
+            return True
+
+        def failed(failure):
+            self._flushing = None
+            self.log.error('Error writing keys usage: %s' % (failure,))
+            for entry, flags in usage.items():
+                self._pending.setdefault(entry, set()).update(flags)
+            return False
+
+        def finished(result):
+            done.callback(None)
+            return result
+
+        d = self._openpgp.put_keys_usage(usage)
+        d.addCallbacks(written, failed)
+        d.addBoth(finished)
+        if not d.called:
+            self._flushing = d
+        return done
+
+    def _mark(self, key, flag):
+        entry = (key.address, key.fingerprint)
+        flags = self._pending.setdefault(entry, set())
+        if flag in flags:
+            return
+        flags.add(flag)
+        self._append_journal(flag, entry)
+        if len(self._pending) >= MAX_PENDING:
+            self.flush()
+
+    #
+    # journal
+    #
+
+    def _load_journal(self):
+        if not self._journal_path or not os.path.isfile(self._journal_path):
+            return
+        with open(self._journal_path, 'r') as journal:
+            for line in journal:
+                try:
+                    flag, address, fingerprint = line.split()
+                except ValueError:
+                    # a partial line written while crashing
+                    continue
+                entry = (address, fingerprint)
+                self._pending.setdefault(entry, set()).add(flag)
+
+    def _append_journal(self, flag, (address, fingerprint)):
+        if not self._journal_path:
+            return
+        if self._journal is None:
+            self._journal = open(self._journal_path, 'a')
+        self._journal.write('%s %s %s\n' % (flag, address, fingerprint))
+        self._journal.flush()
+
+    def _rewrite_journal(self):
+        """
+        Replace the journal with the flags still pending.
+        """
+        if not self._journal_path:
+            return
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        tmp_path = self._journal_path + '.tmp'
+        with open(tmp_path, 'w') as journal:
+            for (address, fingerprint), flags in self._pending.items():
+                for flag in flags:
+                    journal.write('%s %s %s\n' % (flag, address, fingerprint))
+        os.rename(tmp_path, self._journal_path)
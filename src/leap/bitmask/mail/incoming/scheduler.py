@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# scheduler.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Scheduling of the soledad syncs that bring in the incoming mail.
+"""
+import random
+import time
+
+from weakref import WeakKeyDictionary
+
+from twisted.internet import defer, reactor
+from twisted.logger import Logger
+from twisted.python.failure import Failure
+
+
+JITTER = 0.1
+
+# soledad -> list of deferreds waiting for the running sync
+_running_syncs = WeakKeyDictionary()
+# soledad -> SyncStats
+_sync_stats = WeakKeyDictionary()
+
+
+class SyncStats(object):
+
+    """
+    Timing of the syncs of a soledad instance.
+    """
+
+    def __init__(self):
+        self.syncs = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.last_sync = None
+        self.last_duration = None
+        self.total_duration = 0.0
+
+    def add(self, started, failed):
+        self.last_sync = time.time()
+        self.last_duration = self.last_sync - started
+        self.total_duration += self.last_duration
+        self.syncs += 1
+        if failed:
+            self.errors += 1
+
+    def as_dict(self):
+        mean = self.total_duration / self.syncs if self.syncs else None
+        return {
+            'syncs': self.syncs,
+            'errors': self.errors,
+            'coalesced': self.coalesced,
+            'last_sync': self.last_sync,
+            'last_duration': self.last_duration,
+            'mean_duration': mean,
+        }
+
+
+def sync(soledad):
+    """
+    Sync soledad with the server. If a sync of the same instance is already
+    running, wait for it instead of starting another one.
+
+    :param soledad: the soledad instance to sync
+    :type soledad: Soledad
+    :return: a Deferred which fires with the result of the sync.
+    :rtype: Deferred
+    """
+    stats = get_sync_stats(soledad)
+    d = defer.Deferred()
+
+    waiting = _running_syncs.get(soledad)
+    if waiting is not None:
+        stats.coalesced += 1
+        waiting.append(d)
+        return d
+
+    waiting = [d]
+    _running_syncs[soledad] = waiting
+    started = time.time()
+
+    def finished(result):
+        del _running_syncs[soledad]
+        stats.add(started, isinstance(result, Failure))
+        for d in waiting:
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+
+    defer.maybeDeferred(soledad.sync).addBoth(finished)
+    return d
+
+
+def get_sync_stats(soledad):
+    stats = _sync_stats.get(soledad)
+    if stats is None:
+        stats = _sync_stats[soledad] = SyncStats()
+    return stats
+
+
+class SyncScheduler(object):
+
+    """
+    Calls a function periodically, adapting the period to the activity.
+
+    The function returns (or fires a Deferred with) True if there was
+    activity. After activity the period goes back to C{min_period}; when
+    there was none, or the function failed, it is doubled up to
+    C{max_period}. Each period is randomized by C{jitter} so many clients
+    don't hit the server at the same time.
+    """
+
+    log = Logger()
+
+    def __init__(self, f, min_period, max_period, jitter=JITTER,
+                 clock=reactor):
+        self._f = f
+        self.min_period = min_period
+        self.max_period = max(min_period, max_period)
+        self.period = min_period
+        self._jitter = jitter
+        self._clock = clock
+        self._call = None
+        self._running = None
+        self.running = False
+
+    def start(self, now=True):
+        if self.running:
+            return
+        self.running = True
+        self.period = self.min_period
+        self._schedule(0 if now else self.period)
+
+    def stop(self):
+        self.running = False
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def _run(self):
+        self._call = None
+        if self._running is not None:
+            return self._running
+        d = defer.maybeDeferred(self._f)
+        # set before the callbacks, which clear it when f already finished
+        self._running = d
+        d.addCallbacks(self._succeeded, self._failed)
+        return d
+
+    def _succeeded(self, activity):
+        if activity:
+            self.period = self.min_period
+        else:
+            self._backoff()
+        self._finished()
+
+    def _failed(self, failure):
+        self.log.error('Scheduled call failed: {0!r}'.format(failure))
+        self._backoff()
+        self._finished()
+
+    def _backoff(self):
+        self.period = min(self.period * 2, self.max_period)
+
+    def _finished(self):
+        self._running = None
+        if self.running:
+            self._schedule(self.period)
+
+    def _schedule(self, delay):
+        if delay:
+            delay *= random.uniform(1 - self._jitter, 1 + self._jitter)
+        self._call = self._clock.callLater(delay, self._run)
@@ -33,7 +33,6 @@ from twisted.application.service import Service
 from twisted.application.service import IService
 from twisted.logger import Logger
 from twisted.internet import defer, reactor
-from twisted.internet.task import LoopingCall
 from twisted.internet.task import deferLater
 
 from zope.interface import implements
@@ -43,6 +42,7 @@ from leap.common.check import leap_assert, leap_assert_type
 from leap.common.mail import get_email_charset
 from leap.bitmask.keymanager import errors as keymanager_errors
 from leap.bitmask.mail.adaptors import soledad_indexes as fields
+from leap.bitmask.mail.incoming import scheduler
 from leap.bitmask.mail.generator import Generator
 from leap.bitmask.mail.utils import json_loads, empty
 from leap.soledad.client import Soledad
@@ -58,6 +58,9 @@ PGP_END = "-----END PGP MESSAGE-----"
 # The period between succesive checks of the incoming mail
 # queue (in seconds)
 INCOMING_CHECK_PERIOD = int(os.environ.get('INCOMING_CHECK_PERIOD', 60))
+# The longest period between checks when no mail is arriving
+INCOMING_MAX_CHECK_PERIOD = int(
+    os.environ.get('INCOMING_MAX_CHECK_PERIOD', 15 * 60))
 
 
 class MalformedMessage(Exception):
@@ -73,9 +76,9 @@ class IncomingMail(Service):
 
     This object implements IService interface, has public methods
     startService and stopService that will actually initiate a
-    LoopingCall with check_period recurrency.
-    The LoopingCall itself will invoke the fetch method each time
-    that the check_period expires.
+    SyncScheduler that invokes the fetch method every check_period seconds
+    while mail is arriving, backing off up to max_check_period when it is
+    not.
 
     This loop will sync the soledad db with the remote server and
     process all the documents found tagged as incoming mail.
@@ -104,7 +107,8 @@ class IncomingMail(Service):
     log = Logger()
 
     def __init__(self, keymanager, soledad, inbox, userid,
-                 check_period=INCOMING_CHECK_PERIOD):
+                 check_period=INCOMING_CHECK_PERIOD,
+                 max_check_period=INCOMING_MAX_CHECK_PERIOD):
 
         """
         Initialize IncomingMail..
@@ -121,6 +125,10 @@ class IncomingMail(Service):
 
         :param check_period: the period to fetch new mail, in seconds.
         :type check_period: int
+
+        :param max_check_period: the longest period to fetch new mail when
+                                 none is arriving, in seconds.
+        :type max_check_period: int
         """
         leap_assert(keymanager, "need a keymanager to initialize")
         leap_assert_type(soledad, Soledad)
@@ -136,6 +144,7 @@ class IncomingMail(Service):
         self._listeners = []
         self._loop = None
         self._check_period = check_period
+        self._max_check_period = max_check_period
 
         # initialize a mail parser only once
         self._parser = Parser()
@@ -162,6 +171,11 @@ class IncomingMail(Service):
         Fetch incoming mail, to be called periodically.
 
         Calls a deferred that will execute the fetch callback.
+
+        :returns: a deferred that fires with the incoming mail documents
+                  processed, or None if there were none. It fails if the
+                  sync fails, so the scheduler backs off.
+        :rtype: Deferred
         """
         def _sync_errback(failure):
             self.log.error(
@@ -178,8 +192,8 @@ class IncomingMail(Service):
         self.log.debug("fetching mail for: %s %s" % (
             self._soledad.uuid, self._userid))
         d = self._sync_soledad()
-        d.addCallbacks(syncSoledadCallback, self._errback)
-        d.addCallbacks(self._signal_fetch_to_ui, self._errback)
+        d.addCallback(syncSoledadCallback)
+        d.addCallback(self._signal_fetch_to_ui)
         return d
 
     def startService(self):
@@ -191,8 +205,9 @@ class IncomingMail(Service):
 
         Service.startService(self)
         if self._loop is None:
-            self._loop = LoopingCall(self.fetch)
-        self._loop.start(self._check_period)
+            self._loop = scheduler.SyncScheduler(
+                self.fetch, self._check_period, self._max_check_period)
+        self._loop.start()
 
     def stopService(self):
         """
@@ -206,6 +221,16 @@ class IncomingMail(Service):
             self._loop = None
         Service.stopService(self)
 
+    def sync_stats(self):
+        """
+        :returns: the timing of the syncs of this user and the current
+                  period between them.
+        :rtype: dict
+        """
+        stats = scheduler.get_sync_stats(self._soledad).as_dict()
+        stats['check_period'] = self._loop.period if self._loop else None
+        return stats
+
     def unread(self):
         """
         :returns: a deferred that will be fired with the number of unread
@@ -241,7 +266,7 @@ class IncomingMail(Service):
             emit_async(catalog.SOLEDAD_INVALID_AUTH_TOKEN, self._userid)
 
         self.log.info('starting sync...')
-        d = self._soledad.sync()
+        d = scheduler.sync(self._soledad)
         d.addCallbacks(_log_synced, _handle_invalid_auth_token_error)
         return d
 
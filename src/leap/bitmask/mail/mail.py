@@ -35,6 +35,7 @@ from twisted.logger import Logger
 
 from leap.common.check import leap_assert_type
 from leap.common.events import emit_async, catalog
+from leap.bitmask import memory
 from leap.bitmask.mail.adaptors.soledad import SoledadMailAdaptor
 from leap.bitmask.mail.constants import INBOX_NAME
 from leap.bitmask.mail.constants import MessageFlags
@@ -864,6 +865,10 @@ class MessageCollection(object):
         return final
 
 
+memory.register('mail.pending_inserts', MessageCollection,
+                '_pending_inserts')
+
+
 class Account(object):
     """
     Account is the top level abstraction to access collections of messages
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# memory.py
+# Copyright (C) 2017 LEAP Encryption Acess Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Accounting of the memory used by the subsystems of bitmask.
+
+The caches and queues of the subsystems register themselves, by the owner
+object and the names of its attributes, and their size and number of items
+are measured walking them. The containers of the soledad and keymanager
+instances of the users are registered too, so their number is always
+reported. When python traces the memory allocations (tracemalloc, not
+available in python 2), the live bytes allocated by the code of each
+subsystem are reported too.
+"""
+import os
+import sys
+import weakref
+
+from collections import deque
+from itertools import chain
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# the walk of a container stops after this many objects, so measuring stays
+# cheap enough to be done periodically
+MAX_OBJECTS = 100000
+
+# the code of each subsystem, for the allocations traced by tracemalloc
+SUBSYSTEMS = (
+    ('mail', os.path.join('leap', 'bitmask', 'mail')),
+    ('keymanager', os.path.join('leap', 'bitmask', 'keymanager')),
+    ('bonafide', os.path.join('leap', 'bitmask', 'bonafide')),
+    ('vpn', os.path.join('leap', 'bitmask', 'vpn')),
+    ('core', os.path.join('leap', 'bitmask', 'core')),
+    ('soledad', os.path.join('leap', 'soledad')),
+    ('twisted', os.path.join('twisted', '')),
+)
+
+_CONTAINERS = (list, tuple, set, frozenset, deque)
+
+
+def get_size(item, limit=MAX_OBJECTS):
+    """
+    Get the size of an object and of the items it contains, if it is a
+    dict, list, tuple, set or deque, recursively. Other objects are measured
+    without what they reference, and each object is only counted once.
+
+    :param item: the object to measure
+    :param limit: the maximum number of objects to measure
+    :type limit: int
+    :return: the size in bytes
+    :rtype: int
+    """
+    seen = set()
+    pending = [item]
+    size = 0
+    while pending and len(seen) < limit:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            pending.extend(chain.from_iterable(item.iteritems()))
+        elif isinstance(item, _CONTAINERS):
+            pending.extend(item)
+    return size
+
+
+class MemoryAccounting(object):
+
+    """
+    Registry of the caches and queues whose memory is accounted.
+    """
+
+    def __init__(self):
+        # name -> list of (weakref to owner, attribute names)
+        self._sources = {}
+
+    def register(self, name, owner, *attrs):
+        """
+        Account the attributes of an object under C{name}. Many objects can
+        be registered with the same name, like the caches of each user, and
+        they are forgotten when the object is.
+
+        :param name: the name it is reported under, like 'mail.pending'
+        :type name: str
+        :param owner: the object, or class, that holds the containers
+        :param attrs: the names of the attributes of owner to measure
+        :type attrs: str
+        """
+        self._sources.setdefault(name, []).append(
+            (weakref.ref(owner), attrs))
+
+    def sizes(self):
+        """
+        :return: the bytes used by the containers registered with each name,
+                 the number of items in them, and how many owners they have.
+        :rtype: dict
+        """
+        sizes = {}
+        for name, sources in self._sources.items():
+            alive = []
+            size = 0
+            items = 0
+            for ref, attrs in sources:
+                owner = ref()
+                if owner is None:
+                    continue
+                alive.append((ref, attrs))
+                containers = [getattr(owner, attr, None) for attr in attrs]
+                size += get_size(containers)
+                items += sum(len(container) for container in containers
+                             if hasattr(container, '__len__'))
+            if alive:
+                self._sources[name] = alive
+                sizes[name] = {'bytes': size, 'items': items,
+                               'owners': len(alive)}
+            else:
+                del self._sources[name]
+        return sizes
+
+    def report(self):
+        """
+        :return: the sizes of the registered containers, the bytes that each
+                 subsystem allocated if tracemalloc is tracing, and the
+                 resident memory.
+        :rtype: dict
+        """
+        return {'containers': self.sizes(),
+                'allocated': get_allocated(),
+                'rss': get_rss()}
+
+
+def get_allocated():
+    """
+    :return: the live bytes allocated by the code of each subsystem, or None
+             if tracemalloc is not tracing.
+    :rtype: dict
+    """
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    allocated = dict((name, 0) for name, _ in SUBSYSTEMS)
+    allocated['other'] = 0
+    snapshot = tracemalloc.take_snapshot()
+    for stat in snapshot.statistics('filename'):
+        filename = stat.traceback[0].filename
+        for name, path in SUBSYSTEMS:
+            if path in filename:
+                allocated[name] += stat.size
+                break
+        else:
+            allocated['other'] += stat.size
+    return allocated
+
+
+def get_rss():
+    """
+    :return: the resident memory of the process in bytes, or None if it is
+             not known.
+    :rtype: int
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, ValueError, IndexError, AttributeError, OSError):
+        return None
+
+
+# shared by all the subsystems
+accounting = MemoryAccounting()
+
+
+def register(name, owner, *attrs):
+    accounting.register(name, owner, *attrs)
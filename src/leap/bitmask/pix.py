@@ -17,7 +17,6 @@
 """
 Pixelated plugin integration.
 """
-import json
 import os
 import sys
 
@@ -25,6 +24,7 @@ from twisted.internet import defer, reactor
 from twisted.logger import Logger
 
 from leap.common.config import get_path_prefix
+from leap.bitmask.bonafide.config import load_json
 from leap.bitmask.mail.mail import Account
 from leap.bitmask.keymanager import KeyNotFound
 
@@ -88,7 +88,7 @@ def start_pixelated_user_agent(userid, soledad, keymanager):
 def get_smtp_config(provider):
     config_path = os.path.join(
         get_path_prefix(), 'leap', 'providers', provider, 'smtp-service.json')
-    json_config = json.loads(open(config_path).read())
+    json_config = load_json(config_path)
     chosen_host = json_config['hosts'].keys()[0]
     hostname = json_config['hosts'][chosen_host]['hostname']
     port = json_config['hosts'][chosen_host]['port']
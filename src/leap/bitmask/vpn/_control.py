@@ -1,20 +1,15 @@
 import os
 import subprocess
 
-from twisted.internet.task import LoopingCall
-from twisted.internet import reactor
+from twisted.internet import defer, reactor
 from twisted.logger import Logger
 
 from .process import VPNProcess
+from ._traffic import TrafficStats
 from .constants import IS_MAC
 
 log = Logger()
 
-# NOTE: We need to set a bigger poll time in OSX because it seems
-# openvpn malfunctions when you ask it a lot of things in a short
-# amount of time.
-POLL_TIME = 2.5 if IS_MAC else 1.0
-
 
 class VPNControl(object):
     """
@@ -23,8 +18,8 @@ class VPNControl(object):
 
     On start, it spawns a VPNProcess instance that will use a vpnlauncher
     suited for the running platform and connect to the management interface
-    opened by the openvpn process, executing commands over that interface on
-    demand.
+    opened by the openvpn process, which notifies the changes of state and
+    traffic.
     """
     TERMINATE_MAXTRIES = 10
     TERMINATE_WAIT = 1  # secs
@@ -35,7 +30,8 @@ class VPNControl(object):
     def __init__(self, remotes, vpnconfig,
                  providerconfig, socket_host, socket_port):
         self._vpnproc = None
-        self._pollers = []
+        # shared by the successive openvpn processes
+        self.traffic = TrafficStats()
 
         self._openvpn_verb = None
         self._user_stopped = False
@@ -46,20 +42,21 @@ class VPNControl(object):
         self._host = socket_host
         self._port = socket_port
 
+    @defer.inlineCallbacks
     def start(self):
         log.debug('VPN: start')
 
         self._user_stopped = False
-        self._stop_pollers()
 
         vpnproc = VPNProcess(
             self._vpnconfig, self._providerconfig, self._host,
             self._port, openvpn_verb=7, remotes=self._remotes,
-            restartfun=self.restart)
+            restartfun=self.restart, traffic=self.traffic)
 
-        if vpnproc.get_openvpn_process():
+        process = yield vpnproc.get_openvpn_process()
+        if process:
             log.info('Another vpn process is running. Will try to stop it.')
-            vpnproc.stop_if_already_running()
+            yield vpnproc.stop_if_already_running(process)
 
         try:
             cmd = vpnproc.getCommand()
@@ -73,16 +70,7 @@ class VPNControl(object):
 
         reactor.spawnProcess(vpnproc, cmd[0], cmd, env)
         self._vpnproc = vpnproc
-
-        # add pollers for status and state
-        # this could be extended to a collection of
-        # generic watchers
-
-        poll_list = [LoopingCall(vpnproc.pollStatus),
-                     LoopingCall(vpnproc.pollState)]
-        self._pollers.extend(poll_list)
-        self._start_pollers()
-        return True
+        defer.returnValue(True)
 
     def restart(self):
         self.stop(shutdown=False, restart=True)
@@ -101,8 +89,6 @@ class VPNControl(object):
         :param restart: whether this stop is part of a hard restart.
         :type restart: bool
         """
-        self._stop_pollers()
-
         # First we try to be polite and send a SIGTERM...
         if self._vpnproc is not None:
             # We assume that the only valid stops are initiated
@@ -151,7 +137,6 @@ class VPNControl(object):
         """
         Sends a kill signal to the process.
         """
-        self._stop_pollers()
         if self._vpnproc is None:
             log.debug("There's no vpn process running to kill.")
         else:
@@ -183,21 +168,3 @@ class VPNControl(object):
             self._killit()
         except OSError:
             log.error('Could not kill process!')
-
-    def _start_pollers(self):
-        """
-        Iterate through the registered observers
-        and start the looping call for them.
-        """
-        for poller in self._pollers:
-            poller.start(POLL_TIME)
-
-    def _stop_pollers(self):
-        """
-        Iterate through the registered observers
-        and stop the looping calls if they are running.
-        """
-        for poller in self._pollers:
-            if poller.running:
-                poller.stop()
-        self._pollers = []
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# _gateways.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Ranking of the vpn gateways.
+
+The round trip time to each gateway is measured by opening a TCP connection
+to its vpn port; a refused connection measures it as well. The gateways are
+ordered by that time, in steps of RTT_BUCKET so the jitter of a measure
+doesn't decide, and then by the distance from the local timezone to the
+timezone of their location. Gateways that don't answer go last.
+"""
+import time
+
+from twisted.internet import defer, error, reactor
+from twisted.internet.endpoints import TCP4ClientEndpoint, connectProtocol
+from twisted.internet.protocol import Protocol
+from twisted.logger import Logger
+
+
+PROBE_TIMEOUT = 2  # seconds
+PROBE_TTL = 5 * 60  # seconds
+# round trip times within the same step are considered equal
+RTT_BUCKET = 0.02  # seconds
+
+
+def _local_timezone():
+    offset = time.altzone if time.localtime().tm_isdst else time.timezone
+    return -offset / 3600.0
+
+
+def _timezone_distance(tz1, tz2):
+    distance = abs(tz1 - tz2) % 24
+    return min(distance, 24 - distance)
+
+
+class GatewayRanker(object):
+
+    log = Logger()
+
+    def __init__(self, timeout=PROBE_TIMEOUT, ttl=PROBE_TTL, clock=reactor):
+        self._timeout = timeout
+        self._ttl = ttl
+        self._clock = clock
+        # (ip, port) -> (measured at, rtt or None)
+        self._rtts = {}
+        self._ranking = []
+
+    def rank(self, gateways, locations=None):
+        """
+        Order the gateways, from the best one.
+
+        :param gateways: the gateways of the eip-service.json of the provider
+        :type gateways: list of dict
+        :param locations: the locations of the eip-service.json
+        :type locations: dict
+        :return: a Deferred which fires with the sorted list of gateways.
+        :rtype: Deferred
+        """
+        locations = locations or {}
+        local_tz = _local_timezone()
+        gateways = list(gateways)
+        d = defer.gatherResults([self._get_rtt(gw) for gw in gateways])
+
+        def sort(rtts):
+            ranking = []
+            for index, (gw, rtt) in enumerate(zip(gateways, rtts)):
+                location = locations.get(gw.get('location'), {})
+                try:
+                    tz = float(location.get('timezone'))
+                    distance = _timezone_distance(local_tz, tz)
+                except (TypeError, ValueError):
+                    distance = 24
+                bucket = int(rtt / RTT_BUCKET) if rtt is not None else None
+                key = (rtt is None, bucket, distance, rtt, index)
+                ranking.append((key, gw, rtt))
+            ranking.sort(key=lambda item: item[0])
+
+            self._ranking = [
+                {'host': gw.get('host'),
+                 'ip': gw.get('ip_address'),
+                 'port': _port(gw),
+                 'location': gw.get('location'),
+                 'rtt': rtt}
+                for _, gw, rtt in ranking]
+            self.log.debug('Gateway ranking: %r' % (self._ranking,))
+            return [gw for _, gw, _ in ranking]
+
+        d.addCallback(sort)
+        return d
+
+    def status(self):
+        """
+        :return: the gateways in the order of the last ranking, with their
+                 round trip times in seconds (None if they didn't answer).
+        :rtype: list of dict
+        """
+        return list(self._ranking)
+
+    def _get_rtt(self, gateway):
+        key = (gateway.get('ip_address'), _port(gateway))
+        cached = self._rtts.get(key)
+        now = self._clock.seconds()
+        if cached is not None and now - cached[0] < self._ttl:
+            return defer.succeed(cached[1])
+
+        def store(rtt):
+            self._rtts[key] = (self._clock.seconds(), rtt)
+            return rtt
+
+        d = self._probe(*key)
+        d.addCallback(store)
+        return d
+
+    def _probe(self, ip, port):
+        """
+        :return: a Deferred which fires with the round trip time to the
+                 gateway, or None if it didn't answer.
+        :rtype: Deferred
+        """
+        endpoint = TCP4ClientEndpoint(
+            self._clock, ip, int(port), timeout=self._timeout)
+        started = time.time()
+
+        def connected(protocol):
+            protocol.transport.abortConnection()
+            return time.time() - started
+
+        def failed(failure):
+            if failure.check(error.ConnectionRefusedError):
+                return time.time() - started
+            self.log.debug('Gateway %s:%s is not answering: %s'
+                           % (ip, port, failure.getErrorMessage()))
+            return None
+
+        d = connectProtocol(endpoint, Protocol())
+        d.addCallbacks(connected, failed)
+        return d
+
+
+def _port(gateway):
+    return gateway.get('capabilities', {}).get('ports', ['1194'])[0]
@@ -1,21 +1,16 @@
 import os
 import shutil
-import socket
+from collections import deque
 
 from twisted.internet import defer, reactor
+from twisted.internet.endpoints import TCP4ClientEndpoint, UNIXClientEndpoint
+from twisted.internet.endpoints import connectProtocol
+from twisted.internet.protocol import ReconnectingClientFactory
+from twisted.internet.task import deferLater
 from twisted.logger import Logger
+from twisted.protocols.basic import LineReceiver
 
-import psutil
-try:
-    # psutil < 2.0.0
-    from psutil.error import AccessDenied as psutil_AccessDenied
-    PSUTIL_2 = False
-except ImportError:
-    # psutil >= 2.0.0
-    from psutil import AccessDenied as psutil_AccessDenied
-    PSUTIL_2 = True
-
-from ._telnet import UDSTelnet
+from leap.bitmask.vpn import _registry
 
 
 class OpenVPNAlreadyRunning(Exception):
@@ -28,152 +23,240 @@ class AlienOpenVPNAlreadyRunning(Exception):
                "not be stopped because it was not launched by LEAP.")
 
 
-class VPNManagement(object):
+class ManagementError(Exception):
+    """
+    The management interface answered a command with an error.
     """
-    This is a mixin that we use in the VPNProcess class.
-    Here we get together all methods related with the openvpn management
-    interface.
 
-    For more info about management methods::
 
-      zcat `dpkg -L openvpn | grep management`
+class ManagementProtocol(LineReceiver):
+    """
+    Client side of the openvpn management interface.
+
+    Commands are written as soon as they are sent, without waiting for the
+    answers to the previous ones, and openvpn answers them in order. Lines
+    starting with '>' are real-time notifications; they are passed to the
+    notificationReceived method of the handler.
     """
     log = Logger()
 
-    # Timers, in secs
-    CONNECTION_RETRY_TIME = 1
+    delimiter = b'\n'
+    MAX_LENGTH = 64 * 1024
 
-    def __init__(self):
-        self._tn = None
-        self.aborted = False
+    def __init__(self, handler=None):
+        self.handler = handler
+        # deferreds and output lines of the commands waiting for an answer
+        self._pending = deque()
 
-    def _seek_to_eof(self):
-        """
-        Read as much as available. Position seek pointer to end of stream
-        """
-        try:
-            self._tn.read_eager()
-        except EOFError:
-            self.log.debug('Could not read from socket. Assuming it died.')
-            return
+    def connectionMade(self):
+        if self.handler is not None:
+            self.handler.managementConnected(self)
+
+    def connectionLost(self, reason):
+        pending, self._pending = self._pending, deque()
+        for d, _ in pending:
+            d.errback(reason)
+        if self.handler is not None:
+            self.handler.managementDisconnected(self)
 
-    def _send_command(self, command, until=b"END"):
+    def sendCommand(self, command):
         """
-        Sends a command to the telnet connection and reads until END
-        is reached.
+        Send a command to the management interface.
 
         :param command: command to send
         :type command: str
+        :return: a Deferred which fires with the lines of the answer, or
+                 fails with ManagementError.
+        :rtype: Deferred
+        """
+        d = defer.Deferred()
+        self._pending.append((d, []))
+        self.sendLine(command)
+        return d
+
+    def lineReceived(self, line):
+        line = line.rstrip(b'\r')
+        if line.startswith(b'>'):
+            kind, _, data = line[1:].partition(b':')
+            if self.handler is not None:
+                self.handler.notificationReceived(kind, data)
+            return
 
-        :param until: byte delimiter string for reading command output
-        :type until: byte str
+        if not self._pending:
+            self.log.debug('Unexpected management output: %s' % line)
+            return
 
-        :return: response read
-        :rtype: list
-        """
-        # leap_assert(self._tn, "We need a tn connection!")
-
-        try:
-            self._tn.write("%s\n" % (command,))
-            buf = self._tn.read_until(until, 2)
-            self._seek_to_eof()
-            blist = buf.split('\r\n')
-            if blist[-1].startswith(until):
-                del blist[-1]
-                return blist
-            else:
-                return []
-
-        except socket.error:
-            # XXX should get a counter and repeat only
-            # after mod X times.
-            self.log.warn('Socket error (command was: "%s")' % (command,))
-            self._close_management_socket(announce=False)
-            self.log.debug('Trying to connect to management again')
-            self.try_to_connect_to_management(max_retries=5)
-            return []
+        d, lines = self._pending[0]
+        if not lines and line.startswith(b'SUCCESS:'):
+            self._pending.popleft()
+            d.callback([line[8:].strip()])
+        elif not lines and line.startswith(b'ERROR:'):
+            self._pending.popleft()
+            d.errback(ManagementError(line[6:].strip()))
+        elif line == b'END':
+            self._pending.popleft()
+            d.callback(lines)
+        else:
+            lines.append(line)
 
-        except Exception as e:
-            self.log.warn("Error sending command %s: %r" %
-                          (command, e))
-        return []
+    def quit(self):
+        self.sendLine(b'quit')
+        self.transport.loseConnection()
 
-    def _close_management_socket(self, announce=True):
-        """
-        Close connection to openvpn management interface.
-        """
-        if announce:
-            self._tn.write("quit\n")
-            self._tn.read_all()
-        self._tn.get_socket().close()
-        self._tn = None
 
-    def _connect_management(self, socket_host, socket_port):
-        """
-        Connects to the management interface on the specified
-        socket_host socket_port.
+class ManagementClientFactory(ReconnectingClientFactory):
+    """
+    Keeps a connection to the management interface while openvpn is alive,
+    reconnecting with an exponential backoff.
+    """
+    initialDelay = 0.5
+    factor = 2
+    maxDelay = 10
+
+    def __init__(self, handler, maxRetries=None):
+        self.handler = handler
+        self.maxRetries = maxRetries
+
+    def buildProtocol(self, addr):
+        self.resetDelay()
+        p = ManagementProtocol(self.handler)
+        p.factory = self
+        return p
+
+    def clientConnectionLost(self, connector, reason):
+        if self.handler.should_reconnect():
+            ReconnectingClientFactory.clientConnectionLost(
+                self, connector, reason)
+
+    def clientConnectionFailed(self, connector, reason):
+        if not self.handler.should_reconnect():
+            return
+        ReconnectingClientFactory.clientConnectionFailed(
+            self, connector, reason)
+        if self.maxRetries is not None and self.retries > self.maxRetries:
+            self.handler.managementAborted()
 
-        :param socket_host: either socket path (unix) or socket IP
-        :type socket_host: str
 
-        :param socket_port: either string "unix" if it's a unix
-                            socket, or port otherwise
-        :type socket_port: str
-        """
-        if self.is_connected():
-            self._close_management_socket()
+def _connect(host, port, factory):
+    if port == 'unix':
+        return reactor.connectUNIX(host, factory)
+    return reactor.connectTCP(host, int(port), factory)
 
-        try:
-            self._tn = UDSTelnet(socket_host, socket_port)
 
-            # XXX make password optional
-            # specially for win. we should generate
-            # the pass on the fly when invoking manager
-            # from conductor
+def connect_to_management(host, port):
+    """
+    Open a single connection to a management interface, without
+    reconnections.
+
+    :param host: either socket path (unix) or socket IP
+    :type host: str
+    :param port: either string "unix" if it's a unix socket, or port
+                 otherwise
+    :type port: str
+    :return: a Deferred which fires with the connected ManagementProtocol.
+    :rtype: Deferred
+    """
+    if port == 'unix':
+        endpoint = UNIXClientEndpoint(reactor, host)
+    else:
+        endpoint = TCP4ClientEndpoint(reactor, host, int(port))
+    return connectProtocol(endpoint, ManagementProtocol())
 
-            # self.tn.read_until('ENTER PASSWORD:', 2)
-            # self.tn.write(self.password + '\n')
-            # self.tn.read_until('SUCCESS:', 2)
-            if self._tn:
-                self._tn.read_eager()
 
-        except Exception as e:
-            self.log.warn('Could not connect to OpenVPN yet: %r' % (e,))
-            self._tn = None
+class VPNManagement(object):
+    """
+    This is a mixin that we use in the VPNProcess class.
+    Here we get together all methods related with the openvpn management
+    interface.
 
-    def _connectCb(self, *args):
-        """
-        Callback for connection.
+    Instead of polling, the state and the traffic counters are updated with
+    the real-time notifications of the management interface.
 
-        :param args: not used
-        """
-        if not self._tn:
-            self.log.warn('Cannot connect to management...')
+    For more info about management methods::
 
-    def _connectErr(self, failure):
-        """
-        Errorback for connection.
+      zcat `dpkg -L openvpn | grep management`
+    """
+    log = Logger()
 
-        :param failure: Failure
-        """
-        self.log.failure('Error while connecting to management!')
+    # interval of the traffic notifications, in secs
+    BYTECOUNT_INTERVAL = 1
+    # Timers, in secs
+    STOP_TIMEOUT = 5
+    STOP_CHECK_TIME = 0.5
 
-    def connect_to_management(self, host, port):
-        """
-        Connect to a management interface.
+    def __init__(self):
+        self._management = None
+        self._factory = None
+        self._connector = None
+        self.aborted = False
 
-        :param host: the host of the management interface
-        :type host: str
+    # management connection
 
-        :param port: the port of the management interface
-        :type port: str
+    def try_to_connect_to_management(self, max_retries=None):
+        """
+        Connect to the management interface of our openvpn, and keep
+        reconnecting to it until it dies or max_retries consecutive
+        attempts fail.
 
-        :returns: a deferred
+        :param max_retries: the max consecutive attempts
+        :type max_retries: int
         """
-        self.connectd = defer.maybeDeferred(
-            self._connect_management, host, port)
-        self.connectd.addCallbacks(self._connectCb, self._connectErr)
-        return self.connectd
+        # _alive flag is set in the VPNProcess class.
+        if not self._alive:
+            self.log.debug('Tried to connect to management but process is '
+                           'not alive.')
+            return
+        if self._factory is not None:
+            return
+        self._factory = ManagementClientFactory(self, max_retries)
+        self._connector = _connect(
+            self._socket_host, self._socket_port, self._factory)
+
+    def should_reconnect(self):
+        return self._alive and not self.aborted and self._factory is not None
+
+    def managementConnected(self, management):
+        self._management = management
+        self.log.debug('Connected to management')
+        # all pipelined, openvpn answers them in order
+        self._send_command('state on')
+        self._send_command('bytecount %d' % self.BYTECOUNT_INTERVAL)
+        self.get_state()
+        self.get_status()
+
+    def managementDisconnected(self, management):
+        if self._management is management:
+            self._management = None
+
+    def managementAborted(self):
+        self.log.warn(
+            'Max retries reached while attempting to connect '
+            'to management. Aborting.')
+        self.aborted = True
+        self._factory = None
+
+    def notificationReceived(self, kind, data):
+        """
+        Handle a real-time notification of the management interface.
+
+        :param kind: the kind of notification, like STATE or BYTECOUNT
+        :type kind: str
+        :param data: the rest of the notification line
+        :type data: str
+        """
+        if kind == 'STATE':
+            self._parse_state_and_notify([data])
+        elif kind == 'BYTECOUNT':
+            try:
+                down, up = data.split(',')
+            except ValueError:
+                self.log.debug('Could not parse bytecount %s' % data)
+                return
+            self._notify_traffic_status((up, down))
+        elif kind == 'FATAL':
+            self.log.error('OpenVPN: %s' % data)
+        else:
+            self.log.debug('OpenVPN %s: %s' % (kind, data))
 
     def is_connected(self):
         """
@@ -182,56 +265,59 @@ class VPNManagement(object):
         :returns: True if connected, False otherwise
         :rtype: bool
         """
-        return True if self._tn else False
+        return self._management is not None
 
-    def try_to_connect_to_management(self, retry=0, max_retries=None):
+    def _send_command(self, command):
         """
-        Attempts to connect to a management interface, and retries
-        after CONNECTION_RETRY_TIME if not successful.
+        Send a command to the management interface.
 
-        :param retry: number of the retry
-        :type retry: int
+        :param command: command to send
+        :type command: str
+        :return: a Deferred which fires with the lines of the answer, or an
+                 empty list if it could not be sent or failed.
+        :rtype: Deferred
         """
-        if max_retries and retry > max_retries:
-            self.log.warn(
-                'Max retries reached while attempting to connect '
-                'to management. Aborting.')
-            self.aborted = True
-            return
+        if not self.is_connected():
+            return defer.succeed([])
 
-        # _alive flag is set in the VPNProcess class.
-        if not self._alive:
-            self.log.debug('Tried to connect to management but process is '
-                           'not alive.')
-            return
-        if not self.aborted and not self.is_connected():
-            self.connect_to_management(self._socket_host, self._socket_port)
-            reactor.callLater(
-                self.CONNECTION_RETRY_TIME,
-                self.try_to_connect_to_management, retry + 1)
+        def log_error(failure):
+            self.log.warn('Error sending command %s: %s' %
+                          (command, failure.getErrorMessage()))
+            return []
+
+        d = self._management.sendCommand(command)
+        d.addErrback(log_error)
+        return d
+
+    def _close_management_socket(self, announce=True):
+        """
+        Close connection to openvpn management interface, and stop
+        reconnecting to it.
+        """
+        factory, self._factory = self._factory, None
+        if factory is not None:
+            factory.stopTrying()
+        management, self._management = self._management, None
+        if management is not None:
+            if announce:
+                management.quit()
+            else:
+                management.transport.loseConnection()
 
     def _parse_state_and_notify(self, output):
         """
-        Parses the output of the state command, and trigger a state transition
-        when the state changes.
+        Parses the output of the state command, or state notifications, and
+        trigger a state transition when the state changes.
 
-        :param output: list of lines that the state command printed as
-                       its output
+        :param output: list of lines like
+                       'timestamp,STATE,description,ip,remote,...'
         :type output: list
         """
         for line in output:
-            stripped = line.strip()
-            if stripped == "END":
-                continue
-            parts = stripped.split(",")
-            if len(parts) < 5:
+            parts = line.strip().split(",")
+            if len(parts) < 2:
                 continue
-            try:
-                ts, status_step, ok, ip, remote, port, _, _, _ = parts
-            except ValueError:
-                ts, status_step, ok, ip, remote, port, _, _ = parts
-
-            state = status_step
+            state = parts[1]
             if state != self._last_state:
                 # XXX this status object is the vpn status observer
                 if self._status:
@@ -252,7 +338,7 @@ class VPNManagement(object):
 
         for line in output:
             stripped = line.strip()
-            if stripped.endswith("STATISTICS") or stripped == "END":
+            if stripped.endswith("STATISTICS"):
                 continue
             parts = stripped.split(",")
             if len(parts) < 2:
@@ -271,32 +357,40 @@ class VPNManagement(object):
             #   "Auth read bytes"
 
             if text == "TUN/TAP read bytes":
-                tun_tap_read = value  # download
+                tun_tap_read = value  # upload
             elif text == "TUN/TAP write bytes":
-                tun_tap_write = value  # upload
+                tun_tap_write = value  # download
 
-        traffic_status = (tun_tap_read, tun_tap_write)
-        if traffic_status != self._last_status:
-            # XXX this status object is the vpn status observer
-            if self._status:
-                self._status.set_traffic_status(traffic_status)
-            self._last_status = traffic_status
+        self._notify_traffic_status((tun_tap_read, tun_tap_write))
+
+    def _notify_traffic_status(self, traffic_status):
+        # every sample is notified, even if unchanged, so the traffic rates
+        # go down to zero when idle
+        # XXX this status object is the vpn status observer
+        if self._status:
+            self._status.set_traffic_status(traffic_status)
+        self._last_status = traffic_status
 
     def get_state(self):
         """
-        Notifies the gui of the output of the state command over
-        the openvpn management interface.
+        Ask the management interface for the current state, and notify it.
+
+        :rtype: Deferred
         """
-        if self.is_connected():
-            return self._parse_state_and_notify(self._send_command("state"))
+        d = self._send_command("state")
+        d.addCallback(self._parse_state_and_notify)
+        return d
 
     def get_status(self):
         """
-        Notifies the gui of the output of the status command over
-        the openvpn management interface.
+        Ask the management interface for the traffic counters, and notify
+        them.
+
+        :rtype: Deferred
         """
-        if self.is_connected():
-            return self._parse_status_and_notify(self._send_command("status"))
+        d = self._send_command("status")
+        d.addCallback(self._parse_status_and_notify)
+        return d
 
     @property
     def vpn_env(self):
@@ -335,51 +429,33 @@ class VPNManagement(object):
         """
         Looks for openvpn instances running.
 
-        :rtype: process
+        :return: a Deferred which fires with the process, or None.
+        :rtype: Deferred
         """
-        openvpn_process = None
-        for p in psutil.process_iter():
-            try:
-                # XXX Not exact!
-                # Will give false positives.
-                # we should check that cmdline BEGINS
-                # with openvpn or with our wrapper
-                # (pkexec / osascript / whatever)
-
-                # This needs more work, see #3268, but for the moment
-                # we need to be able to filter out arguments in the form
-                # --openvpn-foo, since otherwise we are shooting ourselves
-                # in the feet.
-
-                if PSUTIL_2:
-                    cmdline = p.cmdline()
-                else:
-                    cmdline = p.cmdline
-                if any(map(lambda s: s.find(
-                        "LEAPOPENVPN") != -1, cmdline)):
-                    openvpn_process = p
-                    break
-            except psutil_AccessDenied:
-                pass
-        return openvpn_process
-
-    def stop_if_already_running(self):
+        return _registry.find_openvpn_process()
+
+    @defer.inlineCallbacks
+    def stop_if_already_running(self, process=None):
         """
         Checks if VPN is already running and tries to stop it.
 
-        Might raise OpenVPNAlreadyRunning.
-
-        :return: True if stopped, False otherwise
+        Might fail with OpenVPNAlreadyRunning.
 
+        :param process: the running openvpn, if it was already looked up
+        :type process: psutil.Process
+        :return: a Deferred which fires with True if stopped, None if there
+                 was nothing to stop.
+        :rtype: Deferred
         """
-        process = self.get_openvpn_process()
+        if process is None:
+            process = yield self.get_openvpn_process()
         if not process:
             self.log.debug('Could not find openvpn process while '
                            'trying to stop it.')
             return
 
         self.log.debug('OpenVPN is already running, trying to stop it...')
-        cmdline = process.cmdline
+        cmdline = _registry.get_cmdline(process)
 
         manag_flag = "--management"
 
@@ -404,7 +480,7 @@ class VPNManagement(object):
                 port = cmdline[index + 2]
                 self.log.debug("Trying to connect to %s:%s"
                                % (host, port))
-                self.connect_to_management(host, port)
+                management = yield connect_to_management(host, port)
 
                 # XXX this has a problem with connections to different
                 # remotes. So the reconnection will only work when we are
@@ -413,18 +489,24 @@ class VPNManagement(object):
                 # provider, we will get:
                 # TLS Error: local/remote TLS keys are out of sync
                 # However, that should be a rare case right now.
-                self._send_command("signal SIGTERM")
-                self._close_management_socket(announce=True)
-            except (Exception, AssertionError):
+                yield management.sendCommand("signal SIGTERM")
+                management.quit()
+            except Exception:
                 self.log.failure('Problem trying to terminate OpenVPN')
         else:
             self.log.debug('Could not find the expected openvpn command line.')
 
-        process = self.get_openvpn_process()
-        if process is None:
+        waited = 0
+        running = process.is_running()
+        while running and waited < self.STOP_TIMEOUT:
+            yield deferLater(reactor, self.STOP_CHECK_TIME, lambda: None)
+            waited += self.STOP_CHECK_TIME
+            running = process.is_running()
+
+        if not running:
             self.log.debug('Successfully finished already running '
                            'openvpn process.')
-            return True
+            defer.returnValue(True)
         else:
             self.log.warn('Unable to terminate OpenVPN')
             raise OpenVPNAlreadyRunning
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# _registry.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+Registry of the openvpn process we launched.
+
+When openvpn is launched its pid, start time and management location are
+written to a file, so a stale openvpn can be found later by looking at a few
+processes instead of all the processes of the system. The full scan is only
+done, in a thread, when there is no registry.
+"""
+import json
+import os
+
+from twisted.internet import defer, threads
+from twisted.logger import Logger
+
+from leap.common.config import get_path_prefix
+
+import psutil
+try:
+    # psutil < 2.0.0
+    from psutil.error import AccessDenied as psutil_AccessDenied
+    from psutil.error import NoSuchProcess as psutil_NoSuchProcess
+    PSUTIL_2 = False
+except ImportError:
+    # psutil >= 2.0.0
+    from psutil import AccessDenied as psutil_AccessDenied
+    from psutil import NoSuchProcess as psutil_NoSuchProcess
+    PSUTIL_2 = True
+
+
+log = Logger()
+
+REGISTRY_PATH = os.path.join(get_path_prefix(), 'leap', 'openvpn.pid')
+
+# marker in the environment setting of the command line of our openvpn
+OPENVPN_MARKER = 'LEAPOPENVPN'
+
+
+def _get(process, attr):
+    value = getattr(process, attr)
+    return value() if PSUTIL_2 else value
+
+
+def get_cmdline(process):
+    return _get(process, 'cmdline')
+
+
+def _children(process):
+    if PSUTIL_2:
+        return process.children(recursive=True)
+    return process.get_children(recursive=True)
+
+
+def _is_leap_openvpn(process):
+    # XXX Not exact!
+    # Will give false positives.
+    # we should check that cmdline BEGINS
+    # with openvpn or with our wrapper
+    # (pkexec / osascript / whatever)
+
+    # This needs more work, see #3268, but for the moment
+    # we need to be able to filter out arguments in the form
+    # --openvpn-foo, since otherwise we are shooting ourselves
+    # in the feet.
+    return any(OPENVPN_MARKER in arg for arg in get_cmdline(process))
+
+
+def register(pid, socket_host, socket_port):
+    """
+    Write the registry for the launched openvpn.
+
+    :param pid: the pid of the launched process. It can be the privileged
+                launcher, as long as openvpn is one of its children.
+    :type pid: int
+    """
+    try:
+        create_time = _get(psutil.Process(pid), 'create_time')
+    except (psutil_NoSuchProcess, psutil_AccessDenied):
+        return
+    registry = {'pid': pid, 'create_time': create_time,
+                'management': [socket_host, socket_port]}
+    try:
+        with open(REGISTRY_PATH, 'w') as f:
+            json.dump(registry, f)
+    except (IOError, OSError) as e:
+        log.warn('Could not write the openvpn registry: %r' % (e,))
+
+
+def unregister(pid=None):
+    """
+    Remove the registry, if it is for the given pid.
+    """
+    registry = _read()
+    if registry is None:
+        return
+    if pid is not None and registry.get('pid') != pid:
+        return
+    try:
+        os.remove(REGISTRY_PATH)
+    except OSError:
+        pass
+
+
+def _read():
+    try:
+        with open(REGISTRY_PATH) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _find_registered(registry):
+    try:
+        process = psutil.Process(registry['pid'])
+        if abs(_get(process, 'create_time') - registry['create_time']) > 1:
+            # the pid was reused
+            return None
+        for p in [process] + _children(process):
+            try:
+                if _is_leap_openvpn(p):
+                    return p
+            except psutil_AccessDenied:
+                pass
+    except (psutil_NoSuchProcess, psutil_AccessDenied, KeyError, TypeError):
+        pass
+    return None
+
+
+def _scan_processes():
+    for p in psutil.process_iter():
+        try:
+            if _is_leap_openvpn(p):
+                return p
+        except (psutil_NoSuchProcess, psutil_AccessDenied):
+            pass
+    return None
+
+
+def find_openvpn_process():
+    """
+    Look for our openvpn running.
+
+    If there is a registry, only the registered process and its children are
+    checked. Otherwise all the processes are scanned, in a thread.
+
+    :return: a Deferred which fires with the psutil process, or None.
+    :rtype: Deferred
+    """
+    registry = _read()
+    if registry is None:
+        return threads.deferToThread(_scan_processes)
+
+    process = _find_registered(registry)
+    if process is None:
+        log.debug('Removing stale openvpn registry')
+        unregister()
+    return defer.succeed(process)
@@ -1,78 +1,138 @@
-from itertools import chain, repeat
+import re
+
+from twisted.logger import Logger
+
 from ._human import bytes2human
+from ._traffic import TrafficStats
 
 from leap.common.events import catalog, emit_async
 
 
-# TODO implement a state machine in this class
+# openvpn states, as notified by the management interface
+_OPENVPN_STATES = {
+    'CONNECTING': 'starting',
+    'RESOLVE': 'starting',
+    'TCP_CONNECT': 'starting',
+    'WAIT': 'starting',
+    'AUTH': 'starting',
+    'AUTH_PENDING': 'starting',
+    'GET_CONFIG': 'starting',
+    'ASSIGN_IP': 'starting',
+    'ADD_ROUTES': 'starting',
+    'RECONNECTING': 'starting',
+    'CONNECTED': 'on',
+    'EXITING': 'stopping',
+}
+
+# status -> the statuses it can change to
+_TRANSITIONS = {
+    'off': ('starting', 'on', 'failure'),
+    'starting': ('on', 'off', 'stopping', 'failure'),
+    'on': ('starting', 'off', 'stopping', 'failure'),
+    'stopping': ('off', 'failure'),
+    'failure': ('starting', 'on', 'off'),
+}
 
 
 class VPNStatus(object):
     """
-    A class containing different patterns in the openvpn output that
-    we can react upon.
+    A state machine for the status of the vpn, fed with the state changes of
+    openvpn and with the patterns found in its output.
     """
+    log = Logger()
 
     _events = {
         'NETWORK_UNREACHABLE': (
             'Network is unreachable (code=101)',),
         'PROCESS_RESTART_TLS': (
             "SIGTERM[soft,tls-error]",),
+        'PROCESS_RESTART_PING': (
+            "SIGTERM[soft,ping-restart]",),
         'INITIALIZATION_COMPLETED': (
             "Initialization Sequence Completed",),
     }
 
-    def __init__(self):
+    # event -> (status, error), None if the status does not change
+    _status_codes = {
+        'NETWORK_UNREACHABLE': ('off', 'network unreachable'),
+        'PROCESS_RESTART_TLS': ('starting', 'restart tls'),
+        'PROCESS_RESTART_PING': None,
+        'INITIALIZATION_COMPLETED': ('on', None),
+    }
+
+    _patterns = dict(
+        (pattern, event)
+        for event, patterns in _events.items() for pattern in patterns)
+    # a single pass over each line looks for all the patterns
+    _matcher = re.compile('|'.join(map(re.escape, _patterns)))
+
+    def __init__(self, traffic=None):
         self._status = 'off'
         self.errcode = None
-        self._traffic_down = None
-        self._traffic_up = None
+        if traffic is None:
+            traffic = TrafficStats()
+        self.traffic = traffic
 
     def watch(self, line):
         """
         Inspects line searching for the different patterns. If a match
-        is found, try to emit the corresponding signal.
+        is found, change the status accordingly.
 
         :param line: a line of openvpn output
         :type line: str
+        :return: the event found in the line, or None
+        :rtype: str
         """
-        chained_iter = chain(*[
-            zip(repeat(key, len(l)), l)
-            for key, l in self._events.iteritems()])
-        for event, pattern in chained_iter:
-            if pattern in line:
-                break
-        else:
-            return
-
-        status, errcode = self._status_codes(event)
-        self.set_status(status, errcode)
+        match = self._matcher.search(line)
+        if match is None:
+            return None
+
+        event = self._patterns[match.group(0)]
+        code = self._status_codes[event]
+        if code is not None:
+            self.set_status(*code)
+        return event
 
     def set_status(self, status, errcode):
-        if status in ("AUTH", "WAIT", "CONNECTING", "GET_CONFIG",
-                      "ASSIGN_IP", "ADD_ROUTES", "RECONNECTING"):
-            status = "starting"
-        elif status == "EXITING":
-            status = "stopping"
-        elif status == "CONNECTED":
-            status = "on"
+        """
+        Change the status, if the transition is valid.
+
+        :param status: one of our statuses, or an openvpn state
+        :type status: str
+        :param errcode: the error, if any
+        :type errcode: str
+        :return: whether the status changed
+        :rtype: bool
+        """
+        status = _OPENVPN_STATES.get(status, status)
+        if status == self._status and errcode == self.errcode:
+            return False
+        if status != self._status and \
+                status not in _TRANSITIONS.get(self._status, ()):
+            self.log.debug('Ignoring vpn status change from %s to %s'
+                           % (self._status, status))
+            return False
 
         self._status = status
         self.errcode = errcode
         emit_async(catalog.VPN_STATUS_CHANGED)
+        return True
 
     def set_traffic_status(self, status):
         up, down = status
-        self._traffic_up = up
-        self._traffic_down = down
+        try:
+            self.traffic.add(up, down)
+        except ValueError:
+            # the counters were missing in the status output
+            pass
 
     def get_traffic_status(self):
         down = None
         up = None
-        if self._traffic_down:
-            down = bytes2human(self._traffic_down)
-        if self._traffic_up:
-            up = bytes2human(self._traffic_up)
+        if self.traffic.down is not None:
+            down = bytes2human(self.traffic.down)
+        if self.traffic.up is not None:
+            up = bytes2human(self.traffic.up)
         return {'down': down, 'up': up}
 
     @property
@@ -83,14 +143,3 @@ class VPNStatus(object):
             'error': self.errcode
         })
         return status
-
-    def _status_codes(self, event):
-        # TODO check good transitions
-        # TODO check valid states
-
-        _table = {
-            "network_unreachable": ('off', 'network unreachable'),
-            "process_restart_tls": ('starting', 'restart tls'),
-            "initialization_completed": ('on', None)
-        }
-        return _table.get(event.lower())
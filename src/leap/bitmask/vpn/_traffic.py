@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# _traffic.py
+# Copyright (C) 2017 LEAP
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+History of the VPN traffic.
+
+The management interface notifies the byte counters of the tunnel every few
+seconds. The last samples are kept in a ring buffer, and the rates are
+computed from them.
+"""
+import time
+
+from collections import deque
+
+from twisted.logger import Logger
+
+
+HISTORY_SIZE = 300  # samples
+AVERAGE_WINDOW = 10  # seconds
+
+
+class TrafficStats(object):
+
+    log = Logger()
+
+    def __init__(self, size=HISTORY_SIZE, window=AVERAGE_WINDOW):
+        # (timestamp, up, down), with the byte counters since the tunnel was
+        # opened
+        self._samples = deque(maxlen=size)
+        self._window = window
+        self._listeners = []
+
+    def add(self, up, down, timestamp=None):
+        """
+        Add a sample of the byte counters.
+
+        :param up: bytes sent through the tunnel
+        :type up: int or str
+        :param down: bytes received through the tunnel
+        :type down: int or str
+        """
+        up, down = int(up), int(down)
+        if timestamp is None:
+            timestamp = time.time()
+        if self._samples:
+            _, last_up, last_down = self._samples[-1]
+            if up < last_up or down < last_down:
+                # openvpn restarted the tunnel, the counters start again
+                self._samples.clear()
+        self._samples.append((timestamp, up, down))
+
+        for listener in self._listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                self.log.error('Error notifying traffic: %r' % (e,))
+
+    def clear(self):
+        self._samples.clear()
+
+    def addListener(self, listener):
+        """
+        Call C{listener(stats)} on every new sample.
+        """
+        self._listeners.append(listener)
+
+    def removeListener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    @property
+    def up(self):
+        return self._samples[-1][1] if self._samples else None
+
+    @property
+    def down(self):
+        return self._samples[-1][2] if self._samples else None
+
+    def rate(self, window=None):
+        """
+        :param window: the seconds to average the rate over. If None, the
+                       rate between the last two samples.
+        :type window: int
+        :return: the rate, in bytes per second, as (up, down); or
+                 (None, None) if there are not enough samples.
+        :rtype: tuple
+        """
+        if len(self._samples) < 2:
+            return None, None
+        last = self._samples[-1]
+        if window is None:
+            first = self._samples[-2]
+        else:
+            start = last[0] - window
+            first = last
+            for sample in reversed(self._samples):
+                if sample[0] < start:
+                    break
+                first = sample
+            if first is last:
+                first = self._samples[-2]
+        elapsed = float(last[0] - first[0])
+        if elapsed <= 0:
+            return None, None
+        return ((last[1] - first[1]) / elapsed,
+                (last[2] - first[2]) / elapsed)
+
+    def history(self):
+        """
+        :return: the samples, as (timestamp, up, down), from the oldest.
+        :rtype: list
+        """
+        return list(self._samples)
+
+    def as_dict(self, history=False):
+        rate_up, rate_down = self.rate()
+        avg_up, avg_down = self.rate(self._window)
+        stats = {
+            'up': self.up,
+            'down': self.down,
+            'rate_up': rate_up,
+            'rate_down': rate_down,
+            'avg_rate_up': avg_up,
+            'avg_rate_down': avg_down,
+            'avg_window': self._window,
+            'samples': len(self._samples),
+        }
+        if history:
+            stats['history'] = self.history()
+        return stats
@@ -19,21 +19,35 @@
 Firewall Manager
 """
 
-import commands
-import subprocess
+import os
+import time
+
+from twisted.internet import defer, utils
+from twisted.logger import Logger
 
 from leap.bitmask.vpn.constants import IS_MAC
 from leap.common.events import catalog, emit_async
 
 
+# how old the cached state can be before it's verified again, in seconds
+CHECK_PERIOD = 60
+
+
 class FirewallManager(object):
 
     """
     Firewall manager that blocks/unblocks all the internet traffic with some
     exceptions.
     This allows us to achieve fail close on a vpn connection.
+
+    The privileged helper is run asynchronously. The state of the firewall is
+    cached: it is updated with the result of start and stop, and verified in
+    the background when it gets old, so reading the status never waits for
+    the helper.
     """
 
+    log = Logger()
+
     # FIXME -- get the path
     BITMASK_ROOT = "/usr/local/sbin/bitmask-root"
 
@@ -46,62 +60,117 @@ class FirewallManager(object):
         :type remotes: list
         """
         self._remotes = remotes
+        # None until we know it
+        self._up = None
+        self._checked = 0
+        self._checking = None
+
+    def _run_helper(self, *args):
+        """
+        Run the privileged helper.
+
+        :return: a Deferred which fires with its exit code.
+        :rtype: Deferred
+        """
+        return utils.getProcessValue(
+            "pkexec", (self.BITMASK_ROOT,) + args, env=os.environ)
+
+    def _set_up(self, up):
+        self._checked = time.time()
+        if up != self._up:
+            self._up = up
+            emit_async(catalog.VPN_STATUS_CHANGED)
 
+    @defer.inlineCallbacks
     def start(self, restart=False):
         """
         Launch the firewall using the privileged wrapper.
 
-        :returns: True if the exitcode of calling the root helper in a
-                  subprocess is 0.
-        :rtype: bool
+        :returns: a Deferred which fires with True if the exitcode of calling
+                  the root helper in a subprocess is 0.
+        :rtype: Deferred
         """
         gateways = [gateway for gateway, port in self._remotes]
 
         # XXX check for wrapper existence, check it's root owned etc.
         # XXX check that the iptables rules are in place.
 
-        cmd = ["pkexec", self.BITMASK_ROOT, "firewall", "start"]
+        args = ["firewall", "start"]
         if restart:
-            cmd.append("restart")
-
-        # FIXME -- use a processprotocol
-        exitCode = subprocess.call(cmd + gateways)
-        emit_async(catalog.VPN_STATUS_CHANGED)
+            args.append("restart")
 
-        if exitCode == 0:
-            return True
+        exitCode = yield self._run_helper(*(args + gateways))
+        ok = exitCode == 0
+        if ok:
+            self._set_up(True)
         else:
-            return False
+            emit_async(catalog.VPN_STATUS_CHANGED)
+        defer.returnValue(ok)
 
     # def tear_down_firewall(self):
+    @defer.inlineCallbacks
     def stop(self):
         """
         Tear the firewall down using the privileged wrapper.
+
+        :rtype: Deferred
         """
         if IS_MAC:
             # We don't support Mac so far
-            return True
+            defer.returnValue(True)
 
-        exitCode = subprocess.call(["pkexec", self.BITMASK_ROOT,
-                                    "firewall", "stop"])
-        emit_async(catalog.VPN_STATUS_CHANGED)
-        if exitCode == 0:
-            return True
+        exitCode = yield self._run_helper("firewall", "stop")
+        ok = exitCode == 0
+        if ok:
+            self._set_up(False)
         else:
-            return False
+            emit_async(catalog.VPN_STATUS_CHANGED)
+        defer.returnValue(ok)
 
-    def is_up(self):
+    def check(self):
         """
-        Return whether the firewall is up or not.
+        Ask the privileged helper whether the firewall is up, and update the
+        cached state.
 
-        :rtype: bool
+        :return: a Deferred which fires with whether it's up.
+        :rtype: Deferred
         """
-        # TODO test this, refactored from is_fw_down
+        def checked(exitCode):
+            # TODO test this, refactored from is_fw_down
+            self._checking = None
+            up = exitCode != 1
+            self._set_up(up)
+            return up
+
+        def failed(failure):
+            self._checking = None
+            self._checked = time.time()
+            self.log.warn('Error checking the firewall: %s'
+                          % failure.getErrorMessage())
+            return self._up
+
+        # concurrent checks wait for the one running
+        checking = self._checking
+        if checking is None:
+            checking = self._checking = self._run_helper("firewall", "isup")
+            checking.addCallbacks(checked, failed)
+        d = defer.Deferred()
+        checking.addCallback(lambda up: d.callback(up) or up)
+        return d
+
+    def _maybe_check(self):
+        if self._checking is None and \
+                time.time() - self._checked > CHECK_PERIOD:
+            self.check()
 
-        cmd = "pkexec {0} firewall isup".format(self.BITMASK_ROOT)
-        output = commands.getstatusoutput(cmd)[0]
+    def is_up(self):
+        """
+        Return whether the firewall is up or not, as last seen.
 
-        return output != 256
+        :rtype: bool
+        """
+        self._maybe_check()
+        return bool(self._up)
 
     @property
     def status(self):
@@ -27,10 +27,9 @@ import stat
 from twisted.logger import Logger
 
 from abc import ABCMeta, abstractmethod
-from functools import partial
 
 from leap.bitmask.vpn.constants import IS_LINUX
-from leap.bitmask.vpn.utils import force_eval
+from leap.bitmask.vpn.utils import cached_file_check, force_eval
 
 
 log = Logger()
@@ -38,6 +37,8 @@ log = Logger()
 
 flags_STANDALONE = False
 
+HASH_CHUNK_SIZE = 64 * 1024
+
 
 class VPNLauncherException(Exception):
     pass
@@ -309,7 +310,9 @@ class VPNLauncher(object):
                 raise Exception(
                     "Need to define UPDOWN_FILES for this particular "
                     "launcher before calling this method")
-            file_exist = partial(_has_updown_scripts, warn=False)
+
+            def file_exist(path):
+                return cached_file_check(path, _has_updown_scripts, False)
             zipped = zip(kls.UPDOWN_FILES, map(file_exist, kls.UPDOWN_FILES))
             missing = filter(lambda (path, exists): exists is False, zipped)
             return [path for path, exists in missing]
@@ -328,7 +331,9 @@ class VPNLauncher(object):
                 "auncher before calling this method")
 
         other = force_eval(kls.OTHER_FILES)
-        file_exist = partial(_has_other_files, warn=False)
+
+        def file_exist(path):
+            return cached_file_check(path, _has_other_files, False)
 
         if flags_STANDALONE:
             try:
@@ -339,7 +344,9 @@ class VPNLauncher(object):
 
             _, bitmask_root_path, openvpn_bin_path = other
 
-            check_hash = _has_expected_binary_hash
+            def check_hash(path, expected_hash):
+                return cached_file_check(
+                    path, _has_expected_binary_hash, expected_hash)
             openvpn_hash = _binaries.OPENVPN_BIN
             bitmask_root_hash = _binaries.BITMASK_ROOT
 
@@ -375,9 +382,11 @@ def _has_expected_binary_hash(path, expected_hash):
     :type expected_hash: str
     :rtype: bool
     """
+    file_hash = hashlib.sha256()
     try:
-        with open(path) as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
-        return expected_hash == file_hash
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
     except IOError:
         return False
+    return expected_hash == file_hash.hexdigest()
@@ -62,6 +62,8 @@ class TunnelManager(object):
     def start(self):
         """
         Start the VPN process.
+
+        :rtype: Deferred
         """
         result = self._vpn.start()
         return result
@@ -85,6 +87,10 @@ class TunnelManager(object):
     def traffic_status(self):
         return self._vpn.traffic_status
 
+    @property
+    def traffic(self):
+        return self._vpn.traffic
+
     def _get_management_location(self):
         """
         Return a tuple with the host (socket) and port to be used for VPN.
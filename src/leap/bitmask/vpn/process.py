@@ -31,11 +31,15 @@ from twisted.logger import Logger
 from leap.bitmask.vpn.utils import get_vpn_launcher
 from leap.bitmask.vpn import _status
 from leap.bitmask.vpn import _management
+from leap.bitmask.vpn import _registry
 
 
 # OpenVPN verbosity level - from flags.py
 OPENVPN_VERBOSITY = 1
 
+# longer lines of openvpn output are truncated
+MAX_LINE_LENGTH = 64 * 1024
+
 
 class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
 
@@ -50,7 +54,7 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
     # TODO do we really need the vpnconfig/providerconfig objects in here???
 
     def __init__(self, vpnconfig, providerconfig, socket_host, socket_port,
-                 openvpn_verb, remotes, restartfun=None):
+                 openvpn_verb, remotes, restartfun=None, traffic=None):
         """
         :param vpnconfig: vpn configuration object
         :type vpnconfig: VPNConfig
@@ -68,6 +72,9 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
         :param openvpn_verb: the desired level of verbosity in the
                              openvpn invocation
         :type openvpn_verb: int
+
+        :param traffic: where to keep the traffic samples
+        :type traffic: TrafficStats
         """
         _management.VPNManagement.__init__(self)
 
@@ -81,13 +88,15 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
         self._last_state = None
         self._last_status = None
         self._alive = False
+        self._pid = None
 
         # XXX use flags, maybe, instead of passing
         # the parameter around.
         self._openvpn_verb = openvpn_verb
         self._restartfun = restartfun
 
-        self._status = _status.VPNStatus()
+        self._status = _status.VPNStatus(traffic=traffic)
+        self._out_buffer = ''
         self.restarting = False
 
         self._remotes = remotes
@@ -110,6 +119,9 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
         """
         self._alive = True
         self.aborted = False
+        # the transport forgets the pid when the process exits
+        self._pid = self.transport.pid
+        _registry.register(self._pid, self._socket_host, self._socket_port)
         self.try_to_connect_to_management(max_retries=10)
 
     def outReceived(self, data):
@@ -120,12 +132,14 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
 
         .. seeAlso: `http://twistedmatrix.com/documents/13.0.0/api/twisted.internet.protocol.ProcessProtocol.html` # noqa
         """
-        # truncate the newline
-        line = data[:-1]
-        if 'SIGTERM[soft,ping-restart]' in line:
-            self.restarting = True
-        self.log.info(line)
-        self._status.watch(line)
+        lines = (self._out_buffer + data).split('\n')
+        # the last one is not complete yet
+        self._out_buffer = lines.pop()[-MAX_LINE_LENGTH:]
+        for line in lines:
+            line = line.rstrip('\r')
+            self.log.info(line)
+            if self._status.watch(line) == 'PROCESS_RESTART_PING':
+                self.restarting = True
 
     def processExited(self, failure):
         """
@@ -147,6 +161,7 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
 
         self._status.set_status(status, errmsg)
         self._alive = False
+        self._close_management_socket(announce=False)
 
     def processEnded(self, reason):
         """
@@ -155,6 +170,7 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
 
         .. seeAlso: `http://twistedmatrix.com/documents/13.0.0/api/twisted.internet.protocol.ProcessProtocol.html` # noqa
         """
+        _registry.unregister(self._pid)
         exit_code = reason.value.exitCode
         if isinstance(exit_code, int):
             self.log.debug('processEnded, status %d' % (exit_code,))
@@ -162,22 +178,6 @@ class VPNProcess(protocol.ProcessProtocol, _management.VPNManagement):
                 self.log.debug('Restarting VPN process')
                 reactor.callLater(2, self._restartfun)
 
-    # polling
-
-    def pollStatus(self):
-        """
-        Polls connection status.
-        """
-        if self._alive:
-            self.get_status()
-
-    def pollState(self):
-        """
-        Polls connection state.
-        """
-        if self._alive:
-            self.get_state()
-
     # launcher
 
     def getCommand(self):
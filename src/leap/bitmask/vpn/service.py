@@ -27,6 +27,7 @@ from twisted.internet import defer
 
 from leap.bitmask.hooks import HookableService
 from leap.bitmask.vpn.vpn import VPNManager
+from leap.bitmask.vpn._gateways import GatewayRanker
 from leap.bitmask.vpn._checks import is_service_ready, get_vpn_cert_path
 from leap.bitmask.vpn import privilege, helpers
 from leap.bitmask.vpn.privilege import NoPolkitAuthAgentAvailable
@@ -55,6 +56,7 @@ class VPNService(HookableService):
         self._started = False
         self._vpn = None
         self._domain = ''
+        self._ranker = GatewayRanker()
 
         if basepath is None:
             self._basepath = get_path_prefix()
@@ -78,8 +80,9 @@ class VPNService(HookableService):
             exc.expected = True
             raise exc
         yield self._setup(domain)
+        self._vpn.traffic.addListener(self._publish_traffic)
         try:
-            self._vpn.start()
+            yield self._vpn.start()
         except NoPolkitAuthAgentAvailable as e:
             e.expected = True
             raise e
@@ -89,6 +92,7 @@ class VPNService(HookableService):
         self._write_last(domain)
         defer.returnValue({'result': 'started'})
 
+    @defer.inlineCallbacks
     def stop_vpn(self):
         # TODO -----------------------------
         # when shutting down the main bitmaskd daemon, this should be called.
@@ -97,12 +101,14 @@ class VPNService(HookableService):
             raise Exception('VPN was not running')
 
         if self._started:
-            self._vpn.stop()
+            yield self._vpn.stop()
             self._started = False
-            return {'result': 'vpn stopped'}
-        elif self._vpn.is_firewall_up():
-            self._vpn.stop_firewall()
-            return {'result': 'firewall stopped'}
+            defer.returnValue({'result': 'vpn stopped'})
+
+        firewall_up = yield self._vpn.check_firewall()
+        if firewall_up:
+            yield self._vpn.stop_firewall()
+            defer.returnValue({'result': 'firewall stopped'})
         else:
             raise Exception('VPN was not running')
 
@@ -115,6 +121,7 @@ class VPNService(HookableService):
 
         if self._vpn:
             status = self._vpn.get_status()
+        status['gateways'] = self._ranker.status()
 
         if self._domain:
             status['domain'] = self._domain
@@ -122,6 +129,22 @@ class VPNService(HookableService):
             status['domain'] = self._read_last()
         return status
 
+    def do_stats(self, history=False):
+        """
+        Return the traffic counters and rates of the VPN.
+
+        :param history: whether to include the last samples
+        :type history: bool
+        """
+        if not self._vpn:
+            return {}
+        return self._vpn.traffic.as_dict(history=history)
+
+    def _publish_traffic(self, traffic):
+        event_stream = getattr(self.parent, 'event_stream', None)
+        if event_stream is not None:
+            event_stream.publish('VPN_TRAFFIC', traffic.as_dict())
+
     def do_check(self, domain=None):
         """Check whether the VPN Service is properly configured,
         and can be started"""
@@ -171,8 +194,10 @@ class VPNService(HookableService):
 
         bonafide = self.parent.getServiceNamed("bonafide")
         config = yield bonafide.do_provider_read(provider, "eip")
+        gateways = yield self._ranker.rank(
+            config.gateways, getattr(config, 'locations', None))
         remotes = [(gw["ip_address"], gw["capabilities"]["ports"][0])
-                   for gw in config.gateways]
+                   for gw in gateways]
         extra_flags = config.openvpn_configuration
 
         prefix = os.path.join(self._basepath, "leap", "providers", provider,
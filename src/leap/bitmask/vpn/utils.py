@@ -18,6 +18,11 @@
 """
 Common utils
 """
+import os
+
+
+# (function, path, args) -> (stat key, result)
+_file_checks = {}
 
 
 def force_eval(items):
@@ -53,6 +58,38 @@ def first(things):
         return None
 
 
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime, st.st_ctime, st.st_size, st.st_mode)
+
+
+def cached_file_check(path, f, *args):
+    """
+    Return f(path, *args), computed again only if the file in path changed.
+
+    The result is cached with the inode, mtime, ctime, size and mode of the
+    file, so a check of an unchanged file costs a stat. The ctime also
+    changes when the file is rewritten in place and its mtime set back, or
+    when its owner changes.
+
+    :param path: the file being checked
+    :type path: str
+    :param f: the check
+    :type f: callable
+    """
+    key = (f, path, args)
+    stat_key = _stat_key(path)
+    cached = _file_checks.get(key)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+    result = f(path, *args)
+    _file_checks[key] = (stat_key, result)
+    return result
+
+
 def get_vpn_launcher():
     """
     Return the VPN launcher for the current platform.
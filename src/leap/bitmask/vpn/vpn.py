@@ -18,6 +18,8 @@
 
 from colorama import Fore
 
+from twisted.internet import defer
+
 from leap.bitmask.util import merge_status
 from leap.bitmask.vpn.manager import TunnelManager
 from leap.bitmask.vpn.fw.firewall import FirewallManager
@@ -32,35 +34,37 @@ class VPNManager(object):
         self._firewall = FirewallManager(remotes)
         self.starting = False
 
+    @defer.inlineCallbacks
     def start(self):
         # TODO we should have some way of switching this flag to False
         # other than parsing the result of the status command.
         self.starting = True
         print(Fore.BLUE + "Firewall: starting..." + Fore.RESET)
-        fw_ok = self._firewall.start()
+        fw_ok = yield self._firewall.start()
         if not fw_ok:
             print(Fore.RED + "Firewall: problem!")
             self.starting = False
-            return False
+            defer.returnValue(False)
         print(Fore.GREEN + "Firewall: started" + Fore.RESET)
 
-        vpn_ok = self._vpn.start()
+        vpn_ok = yield self._vpn.start()
         if not vpn_ok:
             print (Fore.RED + "VPN: Error starting." + Fore.RESET)
-            self._firewall.stop()
+            yield self._firewall.stop()
             print(Fore.GREEN + "Firewall: stopped." + Fore.RESET)
             self.starting = False
-            return False
+            defer.returnValue(False)
         print(Fore.GREEN + "VPN: started" + Fore.RESET)
 
+    @defer.inlineCallbacks
     def stop(self):
         self.starting = False
         print(Fore.BLUE + "Firewall: stopping..." + Fore.RESET)
-        fw_ok = self._firewall.stop()
+        fw_ok = yield self._firewall.stop()
 
         if not fw_ok:
             print (Fore.RED + "Firewall: Error stopping." + Fore.RESET)
-            return False
+            defer.returnValue(False)
 
         print(Fore.GREEN + "Firewall: stopped." + Fore.RESET)
         print(Fore.BLUE + "VPN: stopping..." + Fore.RESET)
@@ -68,17 +72,24 @@ class VPNManager(object):
         vpn_ok = self._vpn.stop()
         if not vpn_ok:
             print (Fore.RED + "VPN: Error stopping." + Fore.RESET)
-            return False
+            defer.returnValue(False)
 
         print(Fore.GREEN + "VPN: stopped." + Fore.RESET)
-        return True
+        defer.returnValue(True)
+
+    @property
+    def traffic(self):
+        return self._vpn.traffic
 
     def stop_firewall(self):
-        self._firewall.stop()
+        return self._firewall.stop()
 
     def is_firewall_up(self):
         return self._firewall.is_up()
 
+    def check_firewall(self):
+        return self._firewall.check()
+
     def get_status(self):
         childrenStatus = {
             "vpn": self._vpn.status,
@@ -388,6 +388,40 @@ class KeyManagerKeyManagementTestCase(KeyManagerWithSoledadTestCase):
         self.assertIsInstance(key, OpenPGPKey)
         self.assertTrue(ADDRESS in key.uids)
 
+    @defer.inlineCallbacks
+    def test_put_raw_keys(self):
+        """
+        Test that putting several concatenated keys stores all of them
+        """
+        km = self._key_manager(url=NICKSERVER_URI)
+
+        keys = yield km.put_raw_keys(PRIVATE_KEY + PUBLIC_KEY_2)
+        self.assertEqual(2, len(keys))
+
+        key = yield km.get_key(ADDRESS, fetch_remote=False)
+        self.assertEqual(KEY_FINGERPRINT, key.fingerprint)
+        key = yield km.get_key(ADDRESS, private=True, fetch_remote=False)
+        self.assertTrue(key.private)
+        key = yield km.get_key(ADDRESS_2, fetch_remote=False)
+        self.assertTrue(ADDRESS_2 in key.uids)
+
+    @defer.inlineCallbacks
+    def test_put_raw_keys_updates_existing_key(self):
+        km = self._key_manager(url=NICKSERVER_URI)
+        yield km.put_raw_key(PUBLIC_KEY, ADDRESS)
+
+        yield km.put_raw_keys(PUBLIC_KEY + PUBLIC_KEY_2,
+                              validation=ValidationLevels.Fingerprint)
+        keys = yield km.get_all_keys()
+        self.assertEqual(2, len(keys))
+        key = yield km.get_key(ADDRESS, fetch_remote=False)
+        self.assertEqual(ValidationLevels.Fingerprint, key.validation)
+
+    def test_put_raw_keys_address_differ(self):
+        km = self._key_manager(url=NICKSERVER_URI)
+        d = km.put_raw_keys(PUBLIC_KEY + PUBLIC_KEY_2, address=ADDRESS)
+        return self.assertFailure(d, errors.KeyAddressMismatch)
+
     @defer.inlineCallbacks
     def test_fetch_uri_ascii_key(self):
         """
@@ -527,6 +561,19 @@ class KeyManagerKeyManagementTestCase(KeyManagerWithSoledadTestCase):
         # then
         self.assertEqual(True, key.sign_used)
 
+    @defer.inlineCallbacks
+    def test_encrypt_stores_encr_used_on_flush(self):
+        km = self._key_manager()
+        yield km._openpgp.put_raw_key(PRIVATE_KEY, ADDRESS)
+        yield km.encrypt('data', ADDRESS, fetch_remote=False)
+
+        key = yield km._openpgp.get_key(ADDRESS)
+        self.assertFalse(key.encr_used)
+
+        yield km.stop_usage_queue()
+        key = yield km._openpgp.get_key(ADDRESS)
+        self.assertTrue(key.encr_used)
+
     @defer.inlineCallbacks
     def test_decrypt_does_not_update_sign_used_for_recipient(self):
         # given
@@ -0,0 +1,91 @@
+import json
+import os
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.bonafide import config
+
+
+class LoadJsonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+        self.write({'hosts': {'a': {'port': 1}}})
+
+    def write(self, data):
+        with open(self.path, 'w') as f:
+            json.dump(data, f)
+
+    def test_cached_while_unchanged(self):
+        data = config.load_json(self.path)
+        self.assertIs(data, config.load_json(self.path))
+
+    def test_reloaded_when_changed(self):
+        config.load_json(self.path)
+        self.write({'hosts': {'b': {'port': 22}}})
+        # make sure the change is seen even within the same second
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 1))
+        self.assertEqual(['b'], config.load_json(self.path)['hosts'].keys())
+
+    def test_invalidate(self):
+        data = config.load_json(self.path)
+        config.invalidate_json(self.path)
+        self.assertIsNot(data, config.load_json(self.path))
+
+    def test_missing_file(self):
+        self.assertRaises(OSError, config.load_json, self.mktemp())
+
+
+class UpdateProviderInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.downloads = []
+
+        def download(agent, uri, path, method='GET'):
+            self.downloads.append((agent, uri))
+            return defer.succeed(False)
+
+        self.patch(config, 'conditionalDownload', download)
+        self.provider = config.Provider.__new__(config.Provider)
+        self.provider._disco = _disco()
+        self.provider._provider_config = config.Record(services=['mx'])
+        self.provider._domain = 'example.org'
+        self.provider._basedir = self.mktemp()
+        self.provider.is_configured = lambda: True
+        self.provider.has_fetched_services_config = lambda: True
+        self.provider._load_provider_configs = lambda: {
+            'soledad': '/1/config/soledad-service.json',
+            'smtp': '/1/config/smtp-service.json'}
+        self.provider._get_domain_agent = lambda: 'domain'
+        self.provider._get_verified_agent = lambda: 'api'
+
+    def test_provider_json_is_not_fetched_with_the_api_agent(self):
+        updated = self.successResultOf(self.provider.update_provider_info())
+        self.assertEqual([], updated)
+        self.assertEqual([
+            ('domain', 'https://example.org/provider.json'),
+            ('api', 'https://api.example.org:4430/1/configs.json'),
+            ('api', 'https://api.example.org:4430/1/config/'
+                    'soledad-service.json'),
+            ('api', 'https://api.example.org:4430/1/config/'
+                    'smtp-service.json')], self.downloads)
+
+
+class _disco(object):
+
+    def get_provider_info_uri(self):
+        return 'https://example.org/provider.json'
+
+    def get_provider_info_method(self):
+        return 'GET'
+
+    def get_configs_uri(self):
+        return 'https://api.example.org:4430/1/configs.json'
+
+    def get_configs_method(self):
+        return 'GET'
+
+    def get_base_uri(self):
+        return 'https://api.example.org:4430'
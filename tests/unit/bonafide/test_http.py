@@ -0,0 +1,100 @@
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+from twisted.web.client import ResponseDone
+from twisted.web.error import Error
+from twisted.web.http_headers import Headers
+
+from leap.bitmask.bonafide import _http
+from leap.bitmask.bonafide._http import conditionalDownload
+
+
+class FakeResponse(object):
+
+    def __init__(self, code, body='', headers=None):
+        self.code = code
+        self.phrase = 'phrase'
+        self.headers = Headers(headers or {})
+        self._body = body
+
+    def deliverBody(self, protocol):
+        protocol.dataReceived(self._body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+class FakeAgent(object):
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, url, headers, producer):
+        self.requests.append(headers)
+        return defer.succeed(self.responses.pop(0))
+
+
+class ConditionalDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = self.mktemp()
+
+    def test_download_and_revalidate(self):
+        agent = FakeAgent(
+            FakeResponse(200, '{"a": 1}', {'ETag': ['"v1"']}),
+            FakeResponse(304))
+
+        d = conditionalDownload(agent, 'https://example.org', self.path)
+        self.assertTrue(self.successResultOf(d))
+        with open(self.path) as f:
+            self.assertEqual('{"a": 1}', f.read())
+
+        d = conditionalDownload(agent, 'https://example.org', self.path)
+        self.assertFalse(self.successResultOf(d))
+        self.assertEqual(
+            ['"v1"'], agent.requests[1].getRawHeaders('if-none-match'))
+
+    def test_error_keeps_file(self):
+        with open(self.path, 'w') as f:
+            f.write('old')
+        agent = FakeAgent(FakeResponse(500))
+        d = conditionalDownload(agent, 'https://example.org', self.path)
+        self.failureResultOf(d, Error)
+        with open(self.path) as f:
+            self.assertEqual('old', f.read())
+
+
+class FakeConnection(object):
+    state = 'QUIESCENT'
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(_http, '_pools', {})
+
+    def test_pool_is_shared_per_provider(self):
+        pool = _http.getPool('/ca1.pem')
+        self.assertIs(pool, _http.getPool('/ca1.pem'))
+        self.assertIsNot(pool, _http.getPool('/ca2.pem'))
+        self.assertEqual(
+            _http.MAX_PERSISTENT_PER_HOST, pool.maxPersistentPerHost)
+
+    def test_pool_keeps_its_limits(self):
+        pool = _http.getPool('/ca1.pem', maxPersistentPerHost=2)
+        _http.getPool('/ca1.pem', maxPersistentPerHost=8,
+                      cachedConnectionTimeout=1)
+        self.assertEqual(2, pool.maxPersistentPerHost)
+        self.assertEqual(
+            _http.CACHED_CONNECTION_TIMEOUT, pool.cachedConnectionTimeout)
+
+    def test_reuse_is_counted(self):
+        pool = _http.MeteredPool(reactor)
+        pool.retryAutomatically = False
+        key = ('https', 'api.example.org', 4430)
+        pool._putConnection(key, FakeConnection())
+        self.assertEqual(1, pool.stats()['idle'])
+
+        d = pool.getConnection(key, None)
+        self.assertIsInstance(self.successResultOf(d), FakeConnection)
+        self.assertEqual(
+            {'requests': 1, 'reused': 1, 'idle': 0}, pool.stats())
@@ -0,0 +1,48 @@
+import binascii
+import json
+
+import srp
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.bonafide import _srp
+
+
+USERNAME = 'user'
+PASSWORD = 'secret'
+
+
+class SRPAuthMechanismTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(_srp._stop_pool)
+
+    @defer.inlineCallbacks
+    def test_authentication(self):
+        salt, vkey = _srp._get_salt_verifier(USERNAME, PASSWORD)
+        auth = _srp.SRPAuthMechanism(USERNAME, PASSWORD)
+        yield auth.start_authentication()
+
+        svr = srp.Verifier(USERNAME, salt, vkey, auth.A,
+                           srp.SHA256, srp.NG_1024)
+        _, B = svr.get_challenge()
+        yield auth.process_handshake(json.dumps({
+            'salt': binascii.hexlify(salt), 'B': binascii.hexlify(B)}))
+
+        HAMK = svr.verify_session(auth.M)
+        self.assertTrue(svr.authenticated())
+        uuid, token = auth.process_authentication(json.dumps({
+            'id': 'uuid', 'token': 'token', 'M2': binascii.hexlify(HAMK)}))
+        auth.verify_authentication()
+        self.assertEqual(('uuid', 'token'), (uuid, token))
+        self.assertTrue(auth.authenticated())
+
+    def test_not_authenticated_before_start(self):
+        auth = _srp.SRPAuthMechanism(USERNAME, PASSWORD)
+        self.assertFalse(auth.authenticated())
+
+    def test_set_backend(self):
+        self.patch(_srp, '_backend', None)
+        _srp.set_backend('srp._pysrp')
+        self.assertEqual('srp._pysrp', _srp.get_backend().__name__)
@@ -10,6 +10,10 @@ from leap.bitmask.bonafide.session import Session
 
 class UsersTest(unittest.TestCase):
 
+    # the patches are undone when the test returns its deferred, run the srp
+    # computations right away so the request is made while they are active
+    @patch('leap.bitmask.bonafide.session._srp.deferToSRPThread',
+           defer.maybeDeferred)
     @patch('leap.bitmask.bonafide.session.Session.is_authenticated')
     @patch('leap.bitmask.bonafide.session.cookieAgentFactory')
     @patch('leap.bitmask.bonafide.session.httpRequest')
@@ -0,0 +1,119 @@
+import __builtin__
+import json
+import sys
+
+from StringIO import StringIO
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.cli import command
+from leap.bitmask.cli.bitmask_cli import BitmaskCLI
+
+
+class FakeConfig(object):
+
+    def get(self, section, option, default=''):
+        return default
+
+    def set(self, section, option, value):
+        pass
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+
+        def send(cmd, printer=None, timeout=60, errb=None):
+            return self.send(cmd)
+
+        self.patch(command, 'get_connection', lambda: None)
+        self.patch(command, 'color_init', lambda: None)
+        self.patch(command.Command, '_send', send)
+        # batch changes the indentation of every command
+        self.patch(command.Command, 'json_indent', 2)
+        self.patch(sys, 'argv', ['bitmaskctl', 'batch'])
+        self.stdout = StringIO()
+        self.patch(sys, 'stdout', self.stdout)
+        self.patch(sys, 'stderr', StringIO())
+        self.cli = BitmaskCLI(FakeConfig())
+
+    def send(self, cmd):
+        self.sent.append((list(cmd.data), list(sys.argv)))
+        if cmd.data == ['core', 'stats']:
+            raise RuntimeError('broken')
+        return defer.succeed(None)
+
+    def batch(self, script):
+        path = self.mktemp()
+        with open(path, 'w') as f:
+            f.write(script)
+        self.successResultOf(self.cli.batch([path]))
+        return [data for data, _ in self.sent]
+
+    def errors(self):
+        lines = self.stdout.getvalue().splitlines()
+        return [json.loads(line)['error'] for line in lines]
+
+    def test_comments_and_blank_lines_are_skipped(self):
+        sent = self.batch('# a comment\n\n  \nversion\nstatus  # why\n')
+        self.assertEqual([['core', 'version'], ['core', 'status']], sent)
+
+    def test_line_is_split_like_a_shell(self):
+        sent = self.batch('keys list -u "user@example.org"\n')
+        self.assertEqual(
+            [['keys', 'list', 'user@example.org', 'public']], sent)
+
+    def test_parse_error_does_not_stop_batch(self):
+        sent = self.batch('keys list -u "user\nversion\n')
+        self.assertEqual([['core', 'version']], sent)
+        self.assertEqual(1, len(self.errors()))
+
+    def test_nested_batch_is_rejected(self):
+        sent = self.batch('batch other.txt\nshell\nversion\n')
+        self.assertEqual([['core', 'version']], sent)
+        self.assertEqual(
+            ["'batch' can not be nested", "'shell' can not be nested"],
+            self.errors())
+
+    def test_usage_error_does_not_stop_batch(self):
+        # argparse exits on an unknown argument
+        sent = self.batch('keys list --bogus\nversion\n')
+        self.assertEqual([['core', 'version']], sent)
+
+    def test_command_error_does_not_stop_batch(self):
+        sent = self.batch('stats\nversion\n')
+        self.assertEqual([['core', 'stats'], ['core', 'version']], sent)
+        self.assertEqual(['broken'], self.errors())
+
+    def test_argv_is_restored(self):
+        self.batch('keys list\nstats\n')
+        self.assertEqual(['bitmaskctl', 'keys', 'list'], self.sent[0][1])
+        self.assertEqual(['bitmaskctl', 'batch'], sys.argv)
+
+    def test_batch_prints_one_line_per_response(self):
+        self.batch('version\n')
+        self.assertIsNone(command.Command.json_indent)
+
+    def test_batch_from_stdin(self):
+        self.patch(sys, 'stdin', StringIO('version\nstatus\n'))
+        self.successResultOf(self.cli.batch([]))
+        self.assertEqual(
+            [['core', 'version'], ['core', 'status']],
+            [data for data, _ in self.sent])
+
+    def test_shell_stops_on_exit(self):
+        lines = iter(['version', '', 'exit', 'status'])
+        self.patch(__builtin__, 'raw_input', lambda prompt: next(lines))
+        self.successResultOf(self.cli.shell([]))
+        self.assertEqual([['core', 'version']],
+                         [data for data, _ in self.sent])
+
+    def test_shell_stops_on_eof(self):
+        def raw_input(prompt):
+            raise EOFError()
+
+        self.patch(__builtin__, 'raw_input', raw_input)
+        self.successResultOf(self.cli.shell([]))
+        self.assertEqual([], self.sent)
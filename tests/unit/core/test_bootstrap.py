@@ -0,0 +1,36 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.core.bootstrap import SessionBootstrap
+
+
+class SessionBootstrapTestCase(unittest.TestCase):
+
+    def test_concurrency_is_bounded(self):
+        bootstrap = SessionBootstrap(max_concurrent=2)
+        stages = [defer.Deferred() for _ in range(3)]
+        for i, d in enumerate(stages):
+            bootstrap.run('user%d@leap.se' % i, 'soledad', lambda d=d: d)
+
+        def soledad_status(i):
+            return bootstrap.status()['user%d@leap.se' % i]['soledad']
+
+        self.assertEqual('running', soledad_status(0)['status'])
+        self.assertEqual('running', soledad_status(1)['status'])
+        self.assertEqual('waiting', soledad_status(2)['status'])
+
+        stages[0].callback(None)
+        self.assertEqual('done', soledad_status(0)['status'])
+        self.assertEqual('running', soledad_status(2)['status'])
+        self.assertIsNotNone(soledad_status(0)['duration'])
+
+    def test_failure_is_recorded(self):
+        bootstrap = SessionBootstrap()
+        d = bootstrap.run(
+            'user@leap.se', 'keymanager',
+            lambda: defer.fail(RuntimeError('no gpg')))
+        self.failureResultOf(d, RuntimeError)
+
+        status = bootstrap.status()['user@leap.se']['keymanager']
+        self.assertEqual('failure', status['status'])
+        self.assertEqual('no gpg', status['error'])
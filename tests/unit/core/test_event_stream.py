@@ -0,0 +1,127 @@
+from twisted.trial import unittest
+
+from leap.bitmask.core import event_stream
+from leap.bitmask.core.event_stream import EventStream
+
+
+class EventStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registered = {}
+        self.patch(event_stream, 'register', self._register)
+        self.patch(event_stream, 'unregister', self._unregister)
+        self.stream = EventStream(size=10)
+
+    def _register(self, event, callback):
+        self.registered[str(event)] = callback
+
+    def _unregister(self, event):
+        del self.registered[str(event)]
+
+    def emit(self, event, *content):
+        self.registered[event](event, *content)
+
+    def test_every_subscriber_gets_every_event(self):
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'ui')
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'cli')
+        self.emit('KEYMANAGER_KEY_FOUND', 'a@leap.se')
+        self.emit('KEYMANAGER_KEY_FOUND', 'b@leap.se')
+
+        expected = [('KEYMANAGER_KEY_FOUND', ('a@leap.se',)),
+                    ('KEYMANAGER_KEY_FOUND', ('b@leap.se',))]
+        self.assertEqual(expected, self.stream.poll('ui'))
+        self.assertEqual(expected, self.stream.poll('cli'))
+
+    def test_poll_waits_for_next_event(self):
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'ui')
+        d = self.stream.poll('ui')
+        self.assertFalse(d.called)
+        self.emit('KEYMANAGER_KEY_FOUND', 'a@leap.se')
+        self.assertEqual(
+            [('KEYMANAGER_KEY_FOUND', ('a@leap.se',))],
+            self.successResultOf(d))
+
+    def test_poll_filters_unregistered_events(self):
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'ui')
+        self.stream.register('KEYMANAGER_KEY_NOT_FOUND', 'cli')
+        self.emit('KEYMANAGER_KEY_NOT_FOUND', 'a@leap.se')
+        d = self.stream.poll('ui')
+        self.assertFalse(d.called)
+
+    def test_poll_limit(self):
+        self.stream.register('KEYMANAGER_KEY_FOUND')
+        self.emit('KEYMANAGER_KEY_FOUND', 'a@leap.se')
+        self.emit('KEYMANAGER_KEY_FOUND', 'b@leap.se')
+        self.assertEqual(
+            [('KEYMANAGER_KEY_FOUND', ('a@leap.se',))],
+            self.stream.poll(limit=1))
+        self.assertEqual(
+            [('KEYMANAGER_KEY_FOUND', ('b@leap.se',))],
+            self.stream.poll(limit=1))
+
+    def test_buffer_is_bounded(self):
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'ui')
+        for i in range(15):
+            self.emit('KEYMANAGER_KEY_FOUND', str(i))
+        events = self.stream.poll('ui')
+        self.assertEqual(10, len(events))
+        self.assertEqual(('5',), events[0][1])
+
+    def test_unregister_keeps_other_subscribers(self):
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'ui')
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'cli')
+        self.stream.unregister('KEYMANAGER_KEY_FOUND', 'ui')
+        self.assertIn('KEYMANAGER_KEY_FOUND', self.registered)
+        self.stream.close('cli')
+        self.assertNotIn('KEYMANAGER_KEY_FOUND', self.registered)
+
+    def test_push(self):
+        pushed = []
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'ws')
+        self.stream.push('ws', lambda *args: pushed.append(args))
+        self.emit('KEYMANAGER_KEY_FOUND', 'a@leap.se')
+        self.assertEqual(
+            [('KEYMANAGER_KEY_FOUND', ('a@leap.se',))], pushed)
+
+    def test_publish_local_event(self):
+        self.stream.publish('VPN_TRAFFIC', {'up': 0})
+        self.stream.register('VPN_TRAFFIC', 'ui')
+        self.assertEqual({}, self.registered)
+        self.stream.publish('VPN_TRAFFIC', {'up': 1})
+        self.assertEqual(
+            [('VPN_TRAFFIC', ({'up': 1},))], self.stream.poll('ui'))
+
+    def test_anonymous_polls_do_not_cancel_each_other(self):
+        self.stream.register('KEYMANAGER_KEY_FOUND')
+        first = self.stream.poll()
+        second = self.stream.poll()
+        self.assertNoResult(first)
+        self.emit('KEYMANAGER_KEY_FOUND', 'a@leap.se')
+        expected = [('KEYMANAGER_KEY_FOUND', ('a@leap.se',))]
+        self.assertEqual(expected, self.successResultOf(first))
+        self.assertEqual(expected, self.successResultOf(second))
+
+    def test_waiting_subscriber_expires(self):
+        clock = FakeTime()
+        self.patch(event_stream, 'time', clock)
+        self.stream.register('KEYMANAGER_KEY_FOUND', 'ui')
+        d = self.stream.poll('ui')
+
+        clock.now += event_stream.SUBSCRIBER_TIMEOUT + 1
+        self.emit('KEYMANAGER_KEY_FOUND', 'a@leap.se')
+        self.assertEqual([], self.successResultOf(d))
+        self.assertIn('ui', self.stream._subscribers)
+
+        # the client didn't poll again
+        clock.now += event_stream.SUBSCRIBER_TIMEOUT + 1
+        self.emit('KEYMANAGER_KEY_FOUND', 'b@leap.se')
+        self.assertNotIn('ui', self.stream._subscribers)
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
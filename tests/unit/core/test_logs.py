@@ -0,0 +1,142 @@
+import os
+
+from twisted.internet.task import Clock
+from twisted.logger import LogLevel
+from twisted.trial import unittest
+
+from leap.bitmask.core import logs
+from leap.bitmask.core.logs import LogFileTailer, LogStream
+
+
+def event(text, level=LogLevel.info, namespace='leap.bitmask.vpn.process'):
+    return {'log_format': text, 'log_level': level,
+            'log_namespace': namespace, 'log_time': 0}
+
+
+class LogStreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.stream = LogStream(size=3, clock=self.clock)
+
+    def test_backlog_is_bounded(self):
+        for i in range(5):
+            self.stream(event('record %d' % i))
+        result = self.stream.poll()
+        self.assertEqual(5, result['cursor'])
+        self.assertEqual([3, 4, 5], [r['seq'] for r in result['records']])
+
+        result = self.stream.poll(limit=1)
+        self.assertEqual([5], [r['seq'] for r in result['records']])
+
+    def test_filters(self):
+        self.stream(event('debug', level=LogLevel.debug))
+        self.stream(event('mail', namespace='leap.bitmask.mail.imap'))
+        self.stream(event('vpn'))
+
+        records = self.stream.poll(level='info')['records']
+        self.assertEqual(2, len(records))
+        records = self.stream.poll(component='vpn')['records']
+        self.assertEqual(['vpn'], [r['line'].split()[-1] for r in records])
+        records = self.stream.poll(component='leap.bitmask.mail')['records']
+        self.assertEqual(1, len(records))
+
+    def test_poll_waits_for_next_record(self):
+        self.stream(event('old'))
+        d = self.stream.poll(cursor=1, level='warn')
+        self.stream(event('info'))
+        self.assertNoResult(d)
+
+        self.stream(event('warning', level=LogLevel.warn))
+        result = self.successResultOf(d)
+        self.assertEqual(3, result['cursor'])
+        self.assertEqual(1, len(result['records']))
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_record_from_other_thread(self):
+        calls = []
+        self.patch(logs.threadable, 'ioThread', object())
+        self.patch(logs.threadable, 'isInIOThread', lambda: False)
+        self.patch(logs, 'reactor', FakeReactor(calls))
+        d = self.stream.poll()
+        self.stream(event('from a thread'))
+        self.assertNoResult(d)
+
+        self.patch(logs.threadable, 'isInIOThread', lambda: True)
+        f, args = calls.pop()
+        f(*args)
+        self.assertEqual(1, len(self.successResultOf(d)['records']))
+
+    def test_answered_poll_can_log(self):
+        first = self.stream.poll()
+        second = self.stream.poll()
+        warnings = self.stream.poll(level='warn')
+        first.addCallback(lambda _: self.stream(event('answered')))
+        self.stream(event('record'))
+
+        result = self.successResultOf(second)
+        self.assertEqual(1, result['cursor'])
+        self.assertEqual(['record'], [r['line'].split()[-1]
+                                      for r in result['records']])
+        self.assertNoResult(warnings)
+        self.assertEqual(1, len(self.stream._waiting))
+
+        records = self.stream.poll(cursor=1)['records']
+        self.assertEqual(['answered'], [r['line'].split()[-1]
+                                        for r in records])
+
+    def test_poll_times_out(self):
+        d = self.stream.poll()
+        self.clock.advance(logs.POLL_TIMEOUT)
+        self.assertEqual({'cursor': 0, 'records': []},
+                         self.successResultOf(d))
+
+
+class FakeReactor(object):
+
+    def __init__(self, calls):
+        self._calls = calls
+
+    def callFromThread(self, f, *args):
+        self._calls.append((f, args))
+
+
+class LogFileTailerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(logs, 'inotify', None)
+        self.patch(logs, 'TAIL_BLOCK_SIZE', 4)
+        self.clock = Clock()
+        self.path = self.mktemp()
+        self.lines = []
+        self.tailer = LogFileTailer(self.path, self.lines.append,
+                                    clock=self.clock)
+        self.addCleanup(self.tailer.stop)
+
+    def write(self, data):
+        with open(self.path, 'a') as f:
+            f.write(data)
+
+    def test_last_lines(self):
+        self.write('one\ntwo\nthree\nfour\n')
+        self.tailer.start(lines=2)
+        self.assertEqual(['three', 'four'], self.lines)
+
+    def test_follow(self):
+        self.write('one\n')
+        self.tailer.start(lines=0)
+        self.write('two\nthr')
+        self.clock.advance(logs.TAIL_INTERVAL)
+        self.assertEqual(['two'], self.lines)
+        self.write('ee\n')
+        self.clock.advance(logs.TAIL_INTERVAL)
+        self.assertEqual(['two', 'three'], self.lines)
+
+    def test_rotation(self):
+        self.write('one\n')
+        self.tailer.start(lines=1)
+        self.write('two\n')
+        os.rename(self.path, self.path + '.1')
+        self.write('three\n')
+        self.clock.advance(logs.TAIL_INTERVAL)
+        self.assertEqual(['one', 'two', 'three'], self.lines)
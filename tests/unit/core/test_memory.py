@@ -0,0 +1,55 @@
+import sys
+
+from twisted.trial import unittest
+
+from leap.bitmask import memory
+from leap.bitmask.memory import MemoryAccounting, get_size
+
+
+class Cache(object):
+
+    def __init__(self, items):
+        self._items = items
+
+
+class GetSizeTestCase(unittest.TestCase):
+
+    def test_walks_containers(self):
+        value = 'x' * 1000
+        size = get_size({'key': [value, (value,)]})
+        self.assertTrue(size > sys.getsizeof(value))
+        # the shared value is counted once
+        self.assertTrue(size < 2 * sys.getsizeof(value))
+
+    def test_limit(self):
+        items = ['x' * 1000 for _ in range(10)]
+        self.assertTrue(get_size(items, limit=2) < get_size(items))
+
+
+class MemoryAccountingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.accounting = MemoryAccounting()
+
+    def test_sizes_by_name(self):
+        cache1 = Cache({'a': 'x' * 1000})
+        cache2 = Cache({'b': 'y' * 1000})
+        self.accounting.register('caches', cache1, '_items')
+        self.accounting.register('caches', cache2, '_items')
+
+        sizes = self.accounting.sizes()
+        self.assertEqual(2, sizes['caches']['owners'])
+        self.assertEqual(2, sizes['caches']['items'])
+        self.assertTrue(sizes['caches']['bytes'] > 2000)
+
+    def test_owners_are_forgotten(self):
+        cache = Cache({})
+        self.accounting.register('caches', cache, '_items')
+        del cache
+        self.assertEqual({}, self.accounting.sizes())
+
+    def test_report(self):
+        self.patch(memory, 'tracemalloc', None)
+        report = self.accounting.report()
+        self.assertIsNone(report['allocated'])
+        self.assertEqual({}, report['containers'])
@@ -0,0 +1,64 @@
+import json
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.core import metrics
+from leap.bitmask.core.dispatcher import CommandDispatcher
+from leap.bitmask.core.metrics import CommandStats, LatencyHistogram
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram(buckets=(0.01, 0.1, 1))
+        for latency in [0.005] * 90 + [0.05] * 9 + [2]:
+            histogram.add(latency)
+
+        self.assertEqual([90, 9, 0, 1], histogram.counts)
+        self.assertEqual(0.01, histogram.percentile(50))
+        self.assertEqual(0.1, histogram.percentile(95))
+        self.assertEqual(2, histogram.percentile(100))
+
+
+class FakeCore(object):
+
+    def __init__(self):
+        self.version = defer.Deferred()
+
+    def do_version(self):
+        return self.version
+
+
+class DispatcherStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.core = FakeCore()
+        self.stats = CommandStats()
+        self.dispatcher = CommandDispatcher(self.core, stats=self.stats)
+
+    def test_command_is_timed(self):
+        d = self.dispatcher.dispatch(['core', 'version'])
+        self.assertEqual(1, self.stats.as_dict()['core version']['in_flight'])
+
+        self.core.version.callback({'version_core': '0.10'})
+        response = json.loads(self.successResultOf(d))
+        self.assertEqual('0.10', response['result']['version_core'])
+
+        stats = self.stats.as_dict()['core version']
+        self.assertEqual(0, stats['in_flight'])
+        self.assertEqual(1, stats['count'])
+        self.assertEqual(0, stats['errors'])
+
+    def test_errors_are_counted(self):
+        d = self.dispatcher.dispatch(['nothing'])
+        response = json.loads(self.successResultOf(d))
+        self.assertEqual('No such command', response['error'])
+        self.assertEqual(1, self.stats.as_dict()[metrics.OTHER]['errors'])
+
+    def test_command_names_are_bounded(self):
+        stats = CommandStats(max_commands=1)
+        stats.finished(stats.started('keys list'))
+        stats.finished(stats.started('keys export'))
+        self.assertEqual(['keys list', metrics.OTHER],
+                         sorted(stats.as_dict().keys()))
@@ -1,7 +1,14 @@
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from twisted.trial import unittest
 
+from leap.bitmask import memory
+from leap.bitmask.core import mail_services
+from leap.bitmask.core.bootstrap import SessionBootstrap
+from leap.bitmask.core.mail_services import KeymanagerContainer
 from leap.bitmask.core.mail_services import KeymanagerService
+from leap.bitmask.core.mail_services import SoledadContainer
+from leap.bitmask.keymanager.errors import KeyNotFound
 
 
 class KeymanagerServiceTestCase(unittest.TestCase):
@@ -30,6 +37,101 @@ class KeymanagerServiceTestCase(unittest.TestCase):
         yield kms.do_delete('user', 'foo@bar')
         assert kms._keymanager.loopback == ['get_key', 'delete_key']
 
+    def test_keymanager_service_stop_stops_usage_queues(self):
+        kms = KeymanagerService()
+        kms._container = KeymanagerContainer(service=kms)
+        keymanager = _container._keymanager()
+        kms._container._instances['user'] = keymanager
+        self.successResultOf(kms.stopService())
+        assert keymanager.loopback == ['stop_usage_queue']
+
+
+class KeymanagerContainerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.patch(mail_services, 'reactor', self.clock)
+        self.patch(mail_services, 'emit_async', lambda *args: None)
+
+    def test_waiting_for_token_does_not_hold_bootstrap(self):
+        kms = KeymanagerService(bootstrap=SessionBootstrap(max_concurrent=1))
+        container = KeymanagerContainer(service=kms)
+        keymanager = _generating_keymanager()
+        d = container._get_or_generate_keys(keymanager, 'user@leap.se')
+        self.assertNoResult(d)
+        self.assertEqual(['get_key', 'gen_key'], keymanager.loopback)
+        status = kms.bootstrap.status()['user@leap.se']['keymanager']
+        self.assertEqual('done', status['status'])
+
+        other = kms.bootstrap.run('other@leap.se', 'soledad', lambda: None)
+        self.successResultOf(other)
+
+        keymanager.token = 'token'
+        self.clock.advance(5)
+        self.assertIs(keymanager, self.successResultOf(d))
+        self.assertEqual('send_key', keymanager.loopback[-1])
+
+    def test_instances_are_accounted(self):
+        self.patch(memory, 'accounting', memory.MemoryAccounting())
+        container = KeymanagerContainer(service=KeymanagerService())
+        container._instances['user@leap.se'] = _generating_keymanager()
+        sizes = memory.accounting.sizes()
+        self.assertEqual(1, sizes['keymanager.instances']['items'])
+
+
+class SoledadContainerTestCase(unittest.TestCase):
+
+    def test_unknown_uuid_fails_the_stage(self):
+        self.patch(mail_services.threads, 'deferToThread',
+                   defer.maybeDeferred)
+        sol = mail_services.SoledadService(None)
+        container = SoledadContainer(service=sol)
+        container._usermap.lookup_uuid = lambda userid, passphrase: None
+        d = container.add_instance('user@leap.se', 'pass')
+        self.failureResultOf(d, mail_services.UUIDNotFound)
+        status = sol.bootstrap.status()['user@leap.se']['soledad']
+        self.assertEqual('failure', status['status'])
+
+    def test_token_arriving_while_starting_is_kept(self):
+        uuid = defer.Deferred()
+        self.patch(mail_services.threads, 'deferToThread',
+                   lambda f, *args: uuid if f.__name__ == 'lookup_uuid'
+                   else defer.maybeDeferred(f, *args))
+        self.patch(mail_services, '_get_soledad_uri', lambda *args: 'url')
+        created = []
+        container = SoledadContainer(
+            service=mail_services.SoledadService(None))
+        container._create_soledad_instance = \
+            lambda *args: created.append(args[-1])
+        d = container.add_instance('user@leap.se', 'pass')
+        other = container.add_instance('user@leap.se', 'pass', token='token')
+        self.assertIs(d, other)
+
+        uuid.callback('uuid')
+        self.assertEqual(['token'], created)
+
+
+class _generating_keymanager(object):
+
+    def __init__(self):
+        self.loopback = []
+        self.token = None
+
+    def ever_synced(self):
+        return defer.succeed(True)
+
+    def get_key(self, address, private=False, fetch_remote=False):
+        self.loopback.append('get_key')
+        return defer.fail(KeyNotFound(address))
+
+    def gen_key(self):
+        self.loopback.append('gen_key')
+        return defer.succeed(None)
+
+    def send_key(self):
+        self.loopback.append('send_key')
+        return defer.succeed(None)
+
 
 class _container(object):
 
@@ -60,6 +162,10 @@ class _container(object):
             self.loopback.append('delete_key')
             return defer.succeed('')
 
+        def stop_usage_queue(self):
+            self.loopback.append('stop_usage_queue')
+            return defer.succeed(None)
+
     def __init__(self):
         self._instances = {'user': self._keymanager()}
 
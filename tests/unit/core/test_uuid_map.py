@@ -0,0 +1,74 @@
+import base64
+
+import scrypt
+
+from twisted.trial import unittest
+
+from leap.bitmask.core import uuid_map
+from leap.bitmask.core.uuid_map import UserMap
+
+
+class UserMapTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(uuid_map, 'MAP_PATH', self.mktemp())
+
+        self.kdf_calls = 0
+        derive_keys = uuid_map._derive_keys
+
+        def counting_derive_keys(*args):
+            self.kdf_calls += 1
+            return derive_keys(*args)
+
+        self.patch(uuid_map, '_derive_keys', counting_derive_keys)
+
+    def test_lookup_after_reload(self):
+        usermap = UserMap()
+        usermap.add('user1@leap.se', 'uuid1', 'pass1')
+        usermap.add('user2@leap.se', 'uuid2', 'pass2')
+
+        usermap = UserMap()
+        self.kdf_calls = 0
+        self.assertEqual(
+            'uuid2', usermap.lookup_uuid('user2@leap.se', 'pass2'))
+        self.assertEqual(1, self.kdf_calls)
+        self.assertEqual('user2@leap.se', usermap.lookup_userid('uuid2'))
+
+    def test_lookup_wrong_password(self):
+        usermap = UserMap()
+        usermap.add('user1@leap.se', 'uuid1', 'pass1')
+        self.assertIsNone(usermap.lookup_uuid('user1@leap.se', 'wrong'))
+
+    def test_add_appends(self):
+        usermap = UserMap()
+        usermap.add('user1@leap.se', 'uuid1', 'pass1')
+        usermap.add('user1@leap.se', 'uuid1', 'pass1')
+        usermap.add('user2@leap.se', 'uuid2', 'pass2')
+        with open(uuid_map.MAP_PATH) as f:
+            lines = f.readlines()
+        self.assertEqual(3, len(lines))
+        self.assertTrue(lines[0].startswith(uuid_map.MAP_VERSION))
+
+    def test_legacy_record_is_indexed(self):
+        data = 'userid:%s:uuid:%s' % ('user1@leap.se', 'uuid1')
+        line = base64.urlsafe_b64encode(
+            scrypt.encrypt(data, 'pass1', maxtime=0.05))
+        with open(uuid_map.MAP_PATH, 'w') as f:
+            f.write(line + '\n')
+
+        usermap = UserMap()
+        self.assertEqual(
+            'uuid1', usermap.lookup_uuid('user1@leap.se', 'pass1'))
+
+        usermap = UserMap()
+        self.kdf_calls = 0
+        self.assertEqual(
+            'uuid1', usermap.lookup_uuid('user1@leap.se', 'pass1'))
+        self.assertEqual(1, self.kdf_calls)
+
+    def test_lookup_userid_follows_changes(self):
+        usermap = UserMap()
+        usermap.add('user1@leap.se', 'uuid1', 'pass1')
+        usermap.add('user1@leap.se', 'uuid2', 'pass1')
+        self.assertIsNone(usermap.lookup_userid('uuid1'))
+        self.assertEqual('user1@leap.se', usermap.lookup_userid('uuid2'))
@@ -0,0 +1,78 @@
+import thread
+
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from leap.bitmask.core import watchdog
+from leap.bitmask.core.watchdog import Watchdog
+
+
+class FakeThreadPool(object):
+
+    def __init__(self):
+        self.max = 10
+        self.threads = []
+        self.working = []
+        self.queued = 0
+        self.q = self
+
+    def qsize(self):
+        return self.queued
+
+
+class FakeLog(object):
+
+    def __init__(self):
+        self.warnings = []
+
+    def warn(self, message):
+        self.warnings.append(message)
+
+
+class WatchdogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.pool = FakeThreadPool()
+        self.watchdog = Watchdog(clock=self.clock, threadpool=self.pool,
+                                 queue_threshold=2)
+        self.watchdog.log = FakeLog()
+        self.warnings = self.watchdog.log.warnings
+        # don't start the sampler thread
+        self.patch(watchdog.threading.Thread, 'start', lambda self: None)
+        self.watchdog.startService()
+        self.addCleanup(self.watchdog.stopService)
+
+    def test_lag(self):
+        self.clock.advance(watchdog.TICK_INTERVAL)
+        self.assertEqual(0, self.watchdog.stats()['lag']['last'])
+
+        # the reactor was blocked for one second
+        self.clock.advance(watchdog.TICK_INTERVAL + 1)
+        stats = self.watchdog.stats()['lag']
+        self.assertEqual(1, stats['max'])
+        self.assertEqual(1, stats['stalls'])
+        self.assertEqual(1, len(self.warnings))
+
+        # warnings are not repeated
+        self.clock.advance(watchdog.TICK_INTERVAL + 1)
+        self.assertEqual(2, self.watchdog.stats()['lag']['stalls'])
+        self.assertEqual(1, len(self.warnings))
+
+    def test_threadpool_queue(self):
+        self.pool.queued = 3
+        self.clock.advance(watchdog.TICK_INTERVAL)
+        stats = self.watchdog.stats()['threadpool']
+        self.assertEqual(3, stats['queued'])
+        self.assertEqual(3, stats['max_queued'])
+        self.assertIn('3 calls', self.warnings[0])
+
+    def test_blocking_site_is_sampled(self):
+        self.watchdog._reactor_thread = thread.get_ident()
+        self.watchdog._sample(2)
+        self.watchdog._sample(3)
+
+        site = self.watchdog.stats()['blocking'][0]
+        self.assertEqual(2, site['samples'])
+        self.assertEqual(3, site['longest'])
+        self.assertIn('_sample', site['site'])
@@ -13,6 +13,7 @@ from twisted.web.test.test_web import DummyRequest
 
 from leap.bitmask.core import dispatcher
 from leap.bitmask.core import web
+from leap.bitmask.core.event_stream import EventStream
 from leap.bitmask.core.dummy import mail_services
 from leap.bitmask.core.dummy import BonafideService
 from leap.bitmask.core.dummy import BackendCommands
@@ -238,6 +239,7 @@ class DummyCore(service.MultiService):
         self.init('mail', mail)
 
         self.core_cmds = BackendCommands(self)
+        self.event_stream = EventStream()
         self.tokens = {}
 
     def init(self, label, service, *args, **kw):
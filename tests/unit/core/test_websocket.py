@@ -0,0 +1,67 @@
+import json
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.core import websocket
+from leap.bitmask.core.dispatcher import _format_result
+
+
+class FakeDispatcher(object):
+
+    def dispatch(self, parts):
+        if parts == ['core', 'version']:
+            return defer.succeed(_format_result({'version': '1'}))
+        return defer.fail(RuntimeError('broken'))
+
+
+class FrameTestCase(unittest.TestCase):
+
+    def test_frame_adds_request_id(self):
+        framed = websocket._frame(_format_result([1]), 7)
+        self.assertEqual(
+            {'id': 7, 'error': None, 'result': [1]}, json.loads(framed))
+
+    def test_frame_without_request_id(self):
+        framed = websocket._frame(' {"error": "broken", "result": null}', None)
+        self.assertEqual(
+            {'id': None, 'error': 'broken', 'result': None},
+            json.loads(framed))
+
+
+class DispatcherProtocolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = websocket.DispatcherProtocol()
+        self.protocol.dispatcher = FakeDispatcher()
+        self.sent = []
+        self.protocol.sendMessage = lambda msg, binary: self.sent.append(
+            json.loads(msg))
+
+    def test_request(self):
+        self.protocol.onMessage(
+            '{"id": 1, "command": ["core", "version"]}', False)
+        self.assertEqual(
+            [{'id': 1, 'error': None, 'result': {'version': '1'}}],
+            self.sent)
+
+    def test_malformed_json(self):
+        self.protocol.onMessage('{"id": 1, "command": ', False)
+        self.assertEqual(1, len(self.sent))
+        self.assertIsNone(self.sent[0]['id'])
+        self.assertIsNone(self.sent[0]['result'])
+        self.assertTrue(self.sent[0]['error'])
+        self.flushLoggedErrors(ValueError)
+
+    def test_request_without_command(self):
+        self.protocol.onMessage('{"id": 1}', False)
+        self.assertIsNone(self.sent[0]['id'])
+        self.assertTrue(self.sent[0]['error'])
+        self.flushLoggedErrors(KeyError)
+
+    def test_failing_command(self):
+        self.protocol.onMessage(
+            '{"id": 2, "command": ["keys", "list"]}', False)
+        self.assertEqual(
+            [{'id': 2, 'error': 'broken', 'result': None}], self.sent)
+        self.flushLoggedErrors(RuntimeError)
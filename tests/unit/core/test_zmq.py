@@ -0,0 +1,75 @@
+import json
+
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from leap.bitmask.core import _zmq
+
+
+class FakeDispatcher(object):
+
+    def __init__(self):
+        self.calls = {}
+
+    def dispatch(self, parts):
+        d = defer.Deferred()
+        self.calls[tuple(parts)] = d
+        return d
+
+
+class DispatcherRouterConnectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(_zmq.ZmqRouterConnection, '__init__',
+                   lambda *args: None)
+        self.clock = Clock()
+        self.conn = _zmq._DispatcherRouterConnection(
+            None, None, None, clock=self.clock)
+        self.conn.dispatcher = FakeDispatcher()
+        self.sent = []
+        self.conn.sendMultipart = lambda sender, parts: self.sent.append(
+            [sender] + parts)
+
+    def test_requests_are_answered_out_of_order(self):
+        self.conn.gotMessage('client1', 'id1', '', 'keys', 'list')
+        self.conn.gotMessage('client2', 'id2', '', 'core', 'version')
+        self.assertEqual(2, self.conn.stats()['in_flight'])
+
+        calls = self.conn.dispatcher.calls
+        calls[('core', 'version')].callback('{"result": 2}')
+        calls[('keys', 'list')].callback('{"result": 1}')
+
+        self.assertEqual(
+            [['client2', 'id2', '', '{"result": 2}'],
+             ['client1', 'id1', '', '{"result": 1}']],
+            self.sent)
+        self.assertEqual(0, self.conn.stats()['in_flight'])
+
+    def test_req_socket_envelope(self):
+        self.conn.gotMessage('client', '', 'core', 'version')
+        self.conn.dispatcher.calls[('core', 'version')].callback('{}')
+        self.assertEqual([['client', '', '{}']], self.sent)
+
+    def test_error_is_answered(self):
+        self.conn.gotMessage('client', 'id', '', 'core', 'version')
+        self.conn.dispatcher.calls[('core', 'version')].errback(
+            RuntimeError('broken'))
+        response = json.loads(self.sent[0][-1])
+        self.assertEqual('broken', response['error'])
+        self.flushLoggedErrors(RuntimeError)
+
+    def test_timeout(self):
+        self.conn.gotMessage('client', 'id', '', 'core', 'version')
+        self.clock.advance(_zmq.COMMAND_TIMEOUT)
+        response = json.loads(self.sent[0][-1])
+        self.assertIn('did not finish', response['error'])
+
+        # the late result is dropped
+        self.conn.dispatcher.calls[('core', 'version')].callback('{}')
+        self.assertEqual(1, len(self.sent))
+        self.assertEqual(1, self.conn.stats()['timeouts'])
+
+    def test_events_poll_does_not_time_out(self):
+        self.conn.gotMessage('client', 'id', '', 'events', 'poll', 'ui')
+        self.assertEqual([], self.clock.getDelayedCalls())
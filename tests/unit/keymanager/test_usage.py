@@ -0,0 +1,129 @@
+import os
+import tempfile
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.keymanager.keys import OpenPGPKey
+from leap.bitmask.keymanager.usage import KeyUsageQueue
+
+
+ADDRESS = 'foo@localhost'
+FINGERPRINT = 'E36E738D69173C13D709E44F2F455E2824D18DDF'
+
+
+class KeyUsageQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.openpgp = FakeOpenPGP()
+        _, self.journal_path = tempfile.mkstemp()
+        os.unlink(self.journal_path)
+        self.addCleanup(self._remove_journal)
+
+    def _remove_journal(self):
+        if os.path.isfile(self.journal_path):
+            os.unlink(self.journal_path)
+
+    def test_mark_does_not_write(self):
+        queue = KeyUsageQueue(self.openpgp)
+        queue.mark_encr_used(publicKey())
+        self.assertEqual([], self.openpgp.written)
+
+    def test_update_sets_pending_flags(self):
+        queue = KeyUsageQueue(self.openpgp)
+        queue.mark_sign_used(publicKey())
+        key = queue.update(publicKey())
+        self.assertTrue(key.sign_used)
+        self.assertFalse(key.encr_used)
+
+    @defer.inlineCallbacks
+    def test_flush_writes_all_flags_at_once(self):
+        queue = KeyUsageQueue(self.openpgp)
+        queue.mark_encr_used(publicKey())
+        queue.mark_sign_used(publicKey())
+        queue.mark_sign_used(publicKey(address='bar@localhost'))
+        yield queue.flush()
+        self.assertEqual(1, len(self.openpgp.written))
+        self.assertEqual(
+            {(ADDRESS, FINGERPRINT): set(['encr', 'sign']),
+             ('bar@localhost', FINGERPRINT): set(['sign'])},
+            self.openpgp.written[0])
+        key = queue.update(publicKey())
+        self.assertFalse(key.sign_used)
+
+    @defer.inlineCallbacks
+    def test_failed_flush_keeps_flags(self):
+        self.openpgp.fail = True
+        queue = KeyUsageQueue(self.openpgp)
+        queue.mark_encr_used(publicKey())
+        yield queue.flush()
+        key = queue.update(publicKey())
+        self.assertTrue(key.encr_used)
+
+    def test_flush_in_flight_writes_later_flags(self):
+        self.openpgp.hold = True
+        queue = KeyUsageQueue(self.openpgp)
+        queue.mark_encr_used(publicKey())
+        first = queue.flush()
+        queue.mark_sign_used(publicKey(address='bar@localhost'))
+        second = queue.flush()
+        self.assertEqual(1, len(self.openpgp.written))
+
+        self.openpgp.hold = False
+        self.openpgp.held.pop().callback(None)
+        self.successResultOf(first)
+        self.successResultOf(second)
+        self.assertEqual(2, len(self.openpgp.written))
+        self.assertEqual(
+            {('bar@localhost', FINGERPRINT): set(['sign'])},
+            self.openpgp.written[1])
+
+    def test_flush_fires_when_journal_fails(self):
+        queue = KeyUsageQueue(self.openpgp, self.journal_path)
+        queue.mark_encr_used(publicKey())
+
+        def fail():
+            raise IOError('disk full')
+
+        queue._rewrite_journal = fail
+        self.successResultOf(queue.flush())
+        self.assertEqual(1, len(self.openpgp.written))
+        self.successResultOf(queue.flush())
+
+    @defer.inlineCallbacks
+    def test_journal_survives_restart(self):
+        queue = KeyUsageQueue(self.openpgp, self.journal_path)
+        queue.mark_encr_used(publicKey())
+
+        # a new queue, as after a crash
+        queue = KeyUsageQueue(self.openpgp, self.journal_path)
+        key = queue.update(publicKey())
+        self.assertTrue(key.encr_used)
+
+        yield queue.flush()
+        queue = KeyUsageQueue(self.openpgp, self.journal_path)
+        key = queue.update(publicKey())
+        self.assertFalse(key.encr_used)
+
+
+class FakeOpenPGP(object):
+
+    def __init__(self):
+        self.written = []
+        self.fail = False
+        self.hold = False
+        self.held = []
+
+    def put_keys_usage(self, usage):
+        if self.fail:
+            return defer.fail(Exception('soledad is gone'))
+        self.written.append(usage)
+        if self.hold:
+            d = defer.Deferred()
+            self.held.append(d)
+            return d
+        return defer.succeed(None)
+
+
+def publicKey(address=ADDRESS):
+    return OpenPGPKey(address=address, fingerprint=FINGERPRINT)
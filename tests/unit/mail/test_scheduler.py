@@ -0,0 +1,120 @@
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from leap.bitmask.mail.incoming import scheduler
+
+
+class FakeSoledad(object):
+
+    def __init__(self):
+        self.syncs = []
+
+    def sync(self):
+        d = defer.Deferred()
+        self.syncs.append(d)
+        return d
+
+
+class SyncTestCase(unittest.TestCase):
+
+    def test_concurrent_syncs_are_coalesced(self):
+        soledad = FakeSoledad()
+        d1 = scheduler.sync(soledad)
+        d2 = scheduler.sync(soledad)
+        self.assertEqual(1, len(soledad.syncs))
+
+        soledad.syncs[0].callback('synced')
+        self.assertEqual('synced', self.successResultOf(d1))
+        self.assertEqual('synced', self.successResultOf(d2))
+
+        stats = scheduler.get_sync_stats(soledad).as_dict()
+        self.assertEqual(1, stats['syncs'])
+        self.assertEqual(1, stats['coalesced'])
+
+    def test_new_sync_after_finished(self):
+        soledad = FakeSoledad()
+        scheduler.sync(soledad)
+        soledad.syncs[0].callback(None)
+        scheduler.sync(soledad)
+        self.assertEqual(2, len(soledad.syncs))
+
+    def test_failure_is_sent_to_all(self):
+        soledad = FakeSoledad()
+        d1 = scheduler.sync(soledad)
+        d2 = scheduler.sync(soledad)
+        soledad.syncs[0].errback(RuntimeError('sync failed'))
+        self.failureResultOf(d1, RuntimeError)
+        self.failureResultOf(d2, RuntimeError)
+        self.assertEqual(1, scheduler.get_sync_stats(soledad).errors)
+
+
+class SyncSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.calls = 0
+        self.activity = False
+        self.scheduler = scheduler.SyncScheduler(
+            self.call, 10, 80, jitter=0, clock=self.clock)
+
+    def call(self):
+        self.calls += 1
+        return self.activity
+
+    def test_backs_off_when_idle(self):
+        self.scheduler.start()
+        self.clock.advance(0)
+        self.assertEqual(1, self.calls)
+        self.assertEqual(20, self.scheduler.period)
+
+        for period in (20, 40, 80, 80):
+            self.clock.advance(period)
+        self.assertEqual(5, self.calls)
+        self.assertEqual(80, self.scheduler.period)
+
+    def test_activity_resets_period(self):
+        self.scheduler.start()
+        self.clock.advance(0)
+        self.clock.advance(20)
+        self.assertEqual(40, self.scheduler.period)
+
+        self.activity = True
+        self.clock.advance(40)
+        self.assertEqual(10, self.scheduler.period)
+
+    def test_backs_off_on_errors(self):
+        def fail():
+            self.calls += 1
+            return defer.fail(RuntimeError())
+
+        self.scheduler = scheduler.SyncScheduler(
+            fail, 10, 80, jitter=0, clock=self.clock)
+        self.scheduler.start()
+        self.clock.advance(0)
+        self.assertEqual(20, self.scheduler.period)
+
+        self.clock.advance(20)
+        self.assertEqual(2, self.calls)
+        self.assertEqual(40, self.scheduler.period)
+        self.flushLoggedErrors(RuntimeError)
+
+    def test_waits_for_running_call(self):
+        d = defer.Deferred()
+        self.scheduler = scheduler.SyncScheduler(
+            lambda: d, 10, 80, jitter=0, clock=self.clock)
+        self.scheduler.start()
+        self.clock.advance(0)
+        self.assertIs(d, self.scheduler._run())
+
+        d.callback(True)
+        self.assertEqual(10, self.scheduler.period)
+        self.assertEqual(1, len(self.clock.getDelayedCalls()))
+
+    def test_stop(self):
+        self.scheduler.start()
+        self.clock.advance(0)
+        self.scheduler.stop()
+        self.clock.advance(100)
+        self.assertEqual(1, self.calls)
+        self.assertEqual([], self.clock.getDelayedCalls())
@@ -0,0 +1,48 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from leap.bitmask.vpn.fw import firewall
+from leap.bitmask.vpn.fw.firewall import FirewallManager
+
+
+class FirewallManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(firewall, 'emit_async', lambda *args: None)
+        self.fw = FirewallManager([('1.2.3.4', 443)])
+        self.calls = []
+        self.results = {}
+        self.patch(self.fw, '_run_helper', self._run_helper)
+
+    def _run_helper(self, *args):
+        self.calls.append(args)
+        d = self.results.get(args[1])
+        if d is None:
+            d = defer.succeed(0)
+        return d
+
+    def test_start_updates_cached_state(self):
+        self.assertTrue(self.successResultOf(self.fw.start()))
+        self.assertEqual(
+            [('firewall', 'start', '1.2.3.4')], self.calls)
+        self.assertEqual('on', self.fw.status['status'])
+        self.assertEqual(1, len(self.calls))
+
+    def test_status_checks_in_background(self):
+        self.results['isup'] = running = defer.Deferred()
+        self.assertEqual('off', self.fw.status['status'])
+        self.assertEqual('off', self.fw.status['status'])
+        self.assertEqual([('firewall', 'isup')], self.calls)
+
+        running.callback(0)
+        self.assertEqual('on', self.fw.status['status'])
+        self.assertEqual(1, len(self.calls))
+
+    def test_concurrent_checks(self):
+        self.results['isup'] = running = defer.Deferred()
+        d1 = self.fw.check()
+        d2 = self.fw.check()
+        running.callback(1)
+        self.assertFalse(self.successResultOf(d1))
+        self.assertFalse(self.successResultOf(d2))
+        self.assertEqual(1, len(self.calls))
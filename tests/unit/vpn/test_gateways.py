@@ -0,0 +1,61 @@
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from leap.bitmask.vpn import _gateways
+from leap.bitmask.vpn._gateways import GatewayRanker
+
+
+def gateway(ip, location):
+    return {'host': 'gw-%s.example.org' % location, 'ip_address': ip,
+            'location': location, 'capabilities': {'ports': ['443']}}
+
+
+GATEWAYS = [gateway('1.1.1.1', 'dead'),
+            gateway('2.2.2.2', 'slow'),
+            gateway('3.3.3.3', 'fast'),
+            gateway('4.4.4.4', 'near')]
+
+LOCATIONS = {'fast': {'timezone': '+9'}, 'near': {'timezone': '0'}}
+
+
+class GatewayRankerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(_gateways, '_local_timezone', lambda: 0)
+        self.clock = Clock()
+        self.ranker = GatewayRanker(ttl=60, clock=self.clock)
+        self.rtts = {'1.1.1.1': None, '2.2.2.2': 0.3,
+                     '3.3.3.3': 0.051, '4.4.4.4': 0.058}
+        self.probes = []
+        self.patch(self.ranker, '_probe', self._probe)
+
+    def _probe(self, ip, port):
+        self.probes.append((ip, port))
+        return defer.succeed(self.rtts[ip])
+
+    def test_rank(self):
+        d = self.ranker.rank(GATEWAYS, LOCATIONS)
+        ranked = [gw['ip_address'] for gw in self.successResultOf(d)]
+        self.assertEqual(
+            ['4.4.4.4', '3.3.3.3', '2.2.2.2', '1.1.1.1'], ranked)
+
+        status = self.ranker.status()
+        self.assertEqual('near', status[0]['location'])
+        self.assertIsNone(status[-1]['rtt'])
+
+    def test_faster_step_wins_over_location(self):
+        self.rtts['3.3.3.3'] = 0.01
+        d = self.ranker.rank(GATEWAYS, LOCATIONS)
+        ranked = [gw['ip_address'] for gw in self.successResultOf(d)]
+        self.assertEqual(
+            ['3.3.3.3', '4.4.4.4', '2.2.2.2', '1.1.1.1'], ranked)
+
+    def test_rtts_are_cached(self):
+        self.ranker.rank(GATEWAYS)
+        self.ranker.rank(GATEWAYS)
+        self.assertEqual(4, len(self.probes))
+
+        self.clock.advance(61)
+        self.ranker.rank(GATEWAYS)
+        self.assertEqual(8, len(self.probes))
@@ -0,0 +1,58 @@
+import hashlib
+import os
+
+from twisted.trial import unittest
+
+from leap.bitmask.vpn import launcher
+from leap.bitmask.vpn import utils
+
+
+class FileChecksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(utils, '_file_checks', {})
+        self.path = self.mktemp()
+        with open(self.path, 'w') as f:
+            f.write('binary')
+
+    def test_check_is_cached_until_file_changes(self):
+        calls = []
+
+        def check(path):
+            calls.append(path)
+            return os.path.getsize(path)
+
+        self.assertEqual(6, utils.cached_file_check(self.path, check))
+        self.assertEqual(6, utils.cached_file_check(self.path, check))
+        self.assertEqual(1, len(calls))
+
+        with open(self.path, 'a') as f:
+            f.write(' changed')
+        self.assertEqual(14, utils.cached_file_check(self.path, check))
+        self.assertEqual(2, len(calls))
+
+    def test_rewrite_keeping_mtime_is_seen(self):
+        calls = []
+
+        def check(path):
+            calls.append(path)
+            with open(path) as f:
+                return f.read()
+
+        os.utime(self.path, (1000, 1000))
+        self.assertEqual('binary', utils.cached_file_check(self.path, check))
+        with open(self.path, 'r+') as f:
+            f.write('BINARY')
+        os.utime(self.path, (1000, 1000))
+        self.assertEqual('BINARY', utils.cached_file_check(self.path, check))
+        self.assertEqual(2, len(calls))
+
+    def test_binary_hash_in_chunks(self):
+        self.patch(launcher, 'HASH_CHUNK_SIZE', 4)
+        expected = hashlib.sha256('binary').hexdigest()
+        self.assertTrue(
+            launcher._has_expected_binary_hash(self.path, expected))
+        self.assertFalse(
+            launcher._has_expected_binary_hash(self.path, 'bad'))
+        self.assertFalse(
+            launcher._has_expected_binary_hash(self.mktemp(), expected))
@@ -0,0 +1,85 @@
+from twisted.internet import error
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial import unittest
+
+from leap.bitmask.vpn._management import ManagementError
+from leap.bitmask.vpn._management import ManagementProtocol
+from leap.bitmask.vpn._management import VPNManagement
+
+
+class FakeStatus(object):
+
+    def __init__(self):
+        self.states = []
+        self.traffic = []
+
+    def set_status(self, status, errcode):
+        self.states.append(status)
+
+    def set_traffic_status(self, status):
+        self.traffic.append(status)
+
+
+class FakeVPNProcess(VPNManagement):
+
+    def __init__(self):
+        VPNManagement.__init__(self)
+        self._status = FakeStatus()
+        self._last_state = None
+        self._last_status = None
+        self._alive = True
+
+
+class ManagementProtocolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.vpn = FakeVPNProcess()
+        self.proto = ManagementProtocol(self.vpn)
+        self.transport = StringTransport()
+        self.proto.makeConnection(self.transport)
+
+    def test_subscribes_on_connect(self):
+        self.assertTrue(self.vpn.is_connected())
+        self.assertEqual(
+            'state on\nbytecount 1\nstate\nstatus\n',
+            self.transport.value())
+
+    def test_pipelined_answers(self):
+        d1 = self.proto.sendCommand('version')
+        d2 = self.proto.sendCommand('bogus')
+        d3 = self.proto.sendCommand('signal SIGTERM')
+        self.proto.dataReceived(
+            'SUCCESS: real-time state notification set to ON\r\n'
+            'SUCCESS: bytecount interval changed\r\n'
+            '1500000000,CONNECTED,SUCCESS,10.41.0.2,1.2.3.4,,,\r\n'
+            'END\r\n'
+            'OpenVPN STATISTICS\r\n'
+            'TUN/TAP read bytes,100\r\n'
+            'TUN/TAP write bytes,200\r\n'
+            'END\r\n'
+            'OpenVPN Version: OpenVPN 2.4\r\n'
+            'END\r\n'
+            'ERROR: unknown command\r\n'
+            'SUCCESS: signal SIGTERM thrown\r\n')
+
+        self.assertEqual(['CONNECTED'], self.vpn._status.states)
+        self.assertEqual([('100', '200')], self.vpn._status.traffic)
+        self.assertEqual(
+            ['OpenVPN Version: OpenVPN 2.4'], self.successResultOf(d1))
+        self.failureResultOf(d2, ManagementError)
+        self.assertEqual(
+            ['signal SIGTERM thrown'], self.successResultOf(d3))
+
+    def test_notifications(self):
+        self.proto.dataReceived(
+            '>STATE:1500000000,CONNECTED,SUCCESS,10.41.0.2,1.2.3.4,,,\r\n'
+            '>BYTECOUNT:2048,1024\r\n')
+        self.assertEqual(['CONNECTED'], self.vpn._status.states)
+        self.assertEqual([('1024', '2048')], self.vpn._status.traffic)
+
+    def test_connection_lost(self):
+        d = self.proto.sendCommand('status')
+        self.proto.connectionLost(Failure(error.ConnectionDone()))
+        self.failureResultOf(d, error.ConnectionDone)
+        self.assertFalse(self.vpn.is_connected())
@@ -0,0 +1,38 @@
+import os
+
+from twisted.trial import unittest
+
+from leap.bitmask.vpn import _registry
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.patch(_registry, 'REGISTRY_PATH', self.mktemp())
+        self.scanned = []
+        self.patch(_registry, '_scan_processes',
+                   lambda: self.scanned.append(True))
+
+    def test_registered_process_is_found_without_scan(self):
+        _registry.register(os.getpid(), '/tmp/openvpn.socket', 'unix')
+        self.patch(_registry, '_is_leap_openvpn', lambda p: True)
+
+        d = _registry.find_openvpn_process()
+        self.assertEqual(os.getpid(), self.successResultOf(d).pid)
+        self.assertEqual([], self.scanned)
+
+    def test_stale_registry_is_removed(self):
+        _registry.register(os.getpid(), '/tmp/openvpn.socket', 'unix')
+        self.patch(_registry, '_is_leap_openvpn', lambda p: False)
+
+        d = _registry.find_openvpn_process()
+        self.assertIsNone(self.successResultOf(d))
+        self.assertFalse(os.path.exists(_registry.REGISTRY_PATH))
+        self.assertEqual([], self.scanned)
+
+    def test_unregister_other_pid(self):
+        _registry.register(os.getpid(), '/tmp/openvpn.socket', 'unix')
+        _registry.unregister(os.getpid() + 1)
+        self.assertTrue(os.path.exists(_registry.REGISTRY_PATH))
+        _registry.unregister(os.getpid())
+        self.assertFalse(os.path.exists(_registry.REGISTRY_PATH))
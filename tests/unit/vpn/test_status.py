@@ -0,0 +1,36 @@
+from twisted.trial import unittest
+
+from leap.bitmask.vpn import _status
+from leap.bitmask.vpn._status import VPNStatus
+
+
+class VPNStatusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.patch(_status, 'emit_async', self.events.append)
+        self.status = VPNStatus()
+
+    def test_watch(self):
+        self.assertIsNone(self.status.watch('TUN/TAP device tun0 opened'))
+        self.assertEqual(
+            'INITIALIZATION_COMPLETED',
+            self.status.watch('Mon Jan 1 Initialization Sequence Completed'))
+        self.assertEqual('on', self.status.status['status'])
+
+        self.assertEqual(
+            'PROCESS_RESTART_PING',
+            self.status.watch('SIGTERM[soft,ping-restart] received'))
+        self.assertEqual('on', self.status.status['status'])
+
+    def test_openvpn_states(self):
+        self.status.set_status('TCP_CONNECT', None)
+        self.status.set_status('AUTH', None)
+        self.status.set_status('CONNECTED', None)
+        self.assertEqual('on', self.status.status['status'])
+        self.assertEqual(2, len(self.events))
+
+    def test_invalid_transition(self):
+        self.status.set_status('EXITING', None)
+        self.assertEqual('off', self.status.status['status'])
+        self.assertEqual([], self.events)
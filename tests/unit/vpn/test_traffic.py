@@ -0,0 +1,35 @@
+from twisted.trial import unittest
+
+from leap.bitmask.vpn._traffic import TrafficStats
+
+
+class TrafficStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.traffic = TrafficStats(size=5, window=4)
+
+    def test_rates(self):
+        self.assertEqual((None, None), self.traffic.rate())
+        for t in range(6):
+            self.traffic.add(100 * t, 1000 * t * t, timestamp=t)
+
+        self.assertEqual((100, 9000), self.traffic.rate())
+        self.assertEqual((100, 8000), self.traffic.rate(window=2))
+        self.assertEqual(5, len(self.traffic.history()))
+
+        stats = self.traffic.as_dict()
+        self.assertEqual(500, stats['up'])
+        self.assertEqual(25000, stats['down'])
+        self.assertEqual(6000, stats['avg_rate_down'])
+
+    def test_counters_reset(self):
+        self.traffic.add(1000, 1000, timestamp=0)
+        self.traffic.add(2000, 2000, timestamp=1)
+        self.traffic.add(10, 10, timestamp=2)
+        self.assertEqual([(2, 10, 10)], self.traffic.history())
+
+    def test_listeners(self):
+        samples = []
+        self.traffic.addListener(lambda stats: samples.append(stats.up))
+        self.traffic.add('10', '20')
+        self.assertEqual([10], samples)
@@ -40,6 +40,9 @@ var bitmask = function(){
     var api_token = null;
     var last_uid = null;
     var last_uuid = null;
+    // identifies this client to the core, so it gets its own copy of
+    // every event it registers for
+    var subscriber_id = 'ui-' + Math.random().toString(36).slice(2);
 
     if (window.location.protocol === "file:") {
         api_url = 'http://localhost:7070/API/';
@@ -88,16 +91,16 @@ var bitmask = function(){
 
     function event_polling() {
         if (api_token) {
-            call(['events', 'poll']).then(function(response) {
-                if (response !== null) {
-                    var event = response[0];
-                    var content = response[1];
+            call(['events', 'poll', subscriber_id]).then(function(response) {
+                response.forEach(function(item) {
+                    var event = item[0];
+                    var content = item[1];
                     if (event in event_handlers) {
                         Object.values(event_handlers[event]).forEach(function(handler) {
                             handler(event, content);
                         })
                     }
-                }
+                });
                 event_polling();
             }, function(error) {
                 setTimeout(event_polling, 5000);
@@ -384,6 +387,29 @@ var bitmask = function(){
                 return call(['keys', 'insert', uid, address, validation, rawkey]);
             },
 
+            /**
+             * Import all the keys of a keyring
+             *
+             * @param {string} uid The uid of the keyring.
+             * @param {string} rawkeys The keyring or the armored keys
+             * @param {string} validation The validation level of the keys
+             *                            If it's not provided 'Fingerprint' level will be used.
+             * @param {string} address The email address to bind the keys to
+             *                         If it's not provided the first uid of each key will be used.
+             *
+             * @return {Promise<[KeyObject]>} The imported public keys
+             */
+            imprt: function(uid, rawkeys, validation, address) {
+                if (typeof validation !== 'string') {
+                    validation = 'Fingerprint';
+                }
+                var params = ['keys', 'import', uid, validation, rawkeys];
+                if (typeof address === 'string') {
+                    params.push(address);
+                }
+                return call(params);
+            },
+
             /**
              * Delete a key
              *
@@ -415,7 +441,7 @@ var bitmask = function(){
                     return null;
                 } else {
                     event_handlers[event][name] = func;
-                    return call(['events', 'register', event])
+                    return call(['events', 'register', event, subscriber_id])
                 }
             },
 
@@ -429,7 +455,7 @@ var bitmask = function(){
                 event_handlers[event] = event_handlers[event] || {}
                 delete event_handlers[event][name]
                 if (Object.keys(event_handlers[event]).length == 0) {
-                  return call(['events', 'unregister', event]);
+                  return call(['events', 'unregister', event, subscriber_id]);
                 } else {
                   return null;
                 }